@@ -4,12 +4,14 @@
 import wizard_instrument
 import grid_wrapper
 import wizard_script
+import tracing
+import ipc
 
 
 import wx
 import wx.adv
 
-from threading import Thread
+from threading import Thread, Lock
 from subprocess import Popen, PIPE, STDOUT
 import os
 import sys
@@ -19,6 +21,9 @@ import yaml  # used for writing yaml config file (save configuration settings)
 import json  # used for converting a string representation of list into list
 
 APP_EXIT = 1
+TRACE_RUN = 2
+TRACE_VIEW = 3
+UPDATE_INTERVAL = 50  # milliseconds between two batched GUI updates while a script runs
 """
 Description:
 Application aims to improve data acquisition for future measurements. Some of these improvements include simplifying
@@ -43,14 +48,89 @@ def OnAbout(e):
     wx.adv.AboutBox(info)
 
 
+class TraceFrame(wx.Frame):
+    def __init__(self, path, *args, **kwds):
+        """
+        Shows the per-command summary (count, total, p50/p95/max) of a trace file written by a traced run. The same
+        file can be opened in chrome://tracing or https://ui.perfetto.dev for the timeline of every call.
+
+        :param path: Chrome trace-event JSON file
+        """
+        wx.Frame.__init__(self, *args, **kwds)
+        self.SetTitle(f'Trace - {os.path.basename(path)}')
+        self.SetSize((960, 500))
+        self.text_ctrl = wx.TextCtrl(self, wx.ID_ANY, "", style=wx.TE_MULTILINE | wx.TE_READONLY | wx.TE_DONTWRAP)
+        self.text_ctrl.SetFont(wx.Font(10, wx.MODERN, wx.NORMAL, wx.NORMAL, False, u'Consolas'))
+
+        events = tracing.load_chrome(path)
+        self.text_ctrl.SetValue(f'{path}\n{len(events)} calls\n\n' + tracing.format_summary(tracing.summary(events)))
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.text_ctrl, 1, wx.EXPAND, 0)
+        self.SetSizer(sizer)
+        self.Layout()
+
+
+class UpdateQueue:
+    """
+    Collects the log text, progress lines and grid rows read from a running script. The reader threads (stdout and the
+    data channel, see ipc.py) only append to the queue and rows are numbered in the order they arrive. The GUI takes
+    everything collected since the last tick in one batch (MyFrame.FlushUpdates, run every UPDATE_INTERVAL ms by a
+    wx.Timer), so a script printing thousands of lines per second costs one text update and one grid refresh per tick
+    instead of a wx.CallAfter per line.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.events = []
+        self.row = 0  # on Run, new data is appended at the zeroth row
+        self.progress = None  # only the latest (current, total, eta) is kept. Older progress is never shown
+
+    def reset(self):
+        with self.lock:
+            self.events = []
+            self.row = 0
+            self.progress = None
+
+    def put_text(self, text):
+        with self.lock:
+            self.events.append(('text', text))
+
+    def put_progress(self, text):
+        with self.lock:
+            self.events.append(('progress', text))
+
+    def set_progress(self, current, total, eta):
+        with self.lock:
+            self.progress = (current, total, eta)
+
+    def put_rows(self, rows):
+        with self.lock:
+            for data in rows:
+                self.events.append(('row', self.row, data))
+                self.row += 1
+
+    def take(self):
+        with self.lock:
+            events, self.events = self.events, []
+            progress, self.progress = self.progress, None
+        return events, progress
+
+
 class MyFrame(wx.Frame):
     def __init__(self, *args, **kwds):
         # begin wxGlade: MyFrame.__init__
         kwds["style"] = kwds.get("style", 0) | wx.DEFAULT_FRAME_STYLE ^ wx.RESIZE_BORDER
         wx.Frame.__init__(self, *args, **kwds)
         self.frame_number = 1
+        self.trace_path = None
         self.SetSize((1075, 779))
 
+        self.updates = UpdateQueue()
+        self.progress_start = None  # position of the progress line at the end of the log, if one is shown
+        self.update_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.FlushUpdates, self.update_timer)
+
         self.panel_1 = wx.Panel(self, wx.ID_ANY)
         self.panel_2 = wx.Panel(self.panel_1, wx.ID_ANY)
 
@@ -65,6 +145,9 @@ class MyFrame(wx.Frame):
                                        style=wx.TE_MULTILINE | wx.TE_READONLY | wx.TE_DONTWRAP)  # | wx.TE_RICH
         self.text_ctrl_3.SetFont(wx.Font(10, wx.MODERN, wx.NORMAL, wx.NORMAL, False, u'Consolas'))
         self.text_ctrl_4 = wx.TextCtrl(self.panel_2, wx.ID_ANY, "", style=wx.TE_PROCESS_ENTER)
+        # Progress  ----------------------------------------------------------------------------------------------------
+        self.gauge = wx.Gauge(self.panel_2, wx.ID_ANY, range=100, style=wx.GA_HORIZONTAL | wx.GA_SMOOTH)
+        self.label_progress = wx.StaticText(self.panel_2, wx.ID_ANY, "")
         # Checkboxes  --------------------------------------------------------------------------------------------------
         self.checkbox_1 = wx.CheckBox(self.panel_2, wx.ID_ANY, "Save results to \".../output\"")
         self.checkbox_2 = wx.CheckBox(self.panel_2, wx.ID_ANY, "Save plots")
@@ -83,8 +166,10 @@ class MyFrame(wx.Frame):
         # Menu Bar -----------------------------------------------------------------------------------------------------
         self.frame_menubar = wx.MenuBar()
         self.fileMenu = wx.Menu()
+        self.traceMenu = wx.Menu()
         self.helpMenu = wx.Menu()
         self.frame_menubar.Append(self.fileMenu, '&File')  # The "File" menu is accessible via the Alt+F shortcut.
+        self.frame_menubar.Append(self.traceMenu, '&Trace')
         self.frame_menubar.Append(self.helpMenu, '&Help')  # The "File" menu is accessible via the Alt+F shortcut.
 
         self.fileMenu.Append(wx.ID_NEW, '&New')  # The menu item "New" is appended into the menu object.
@@ -99,7 +184,12 @@ class MyFrame(wx.Frame):
         self.fileMenu.Append(wx.MenuItem(self.fileMenu, APP_EXIT, 'E&xit\tCtrl+Q'))
         self.helpItem = self.helpMenu.Append(wx.ID_ABOUT, '&About')
 
+        # tracing is opt-in: the next run records its instrument I/O and GUI updates to results/trace_*.json
+        self.traceRunItem = self.traceMenu.AppendCheckItem(TRACE_RUN, 'Trace Next &Run')
+        self.traceMenu.Append(TRACE_VIEW, '&View Trace...')
+
         self.Bind(wx.EVT_MENU, self.OnExit, id=APP_EXIT)
+        self.Bind(wx.EVT_MENU, self.OnViewTrace, id=TRACE_VIEW)
         self.Bind(wx.EVT_MENU, OnAbout, self.helpItem)
         self.SetMenuBar(self.frame_menubar)
         # Menu Bar end -------------------------------------------------------------------------------------------------
@@ -159,8 +249,11 @@ class MyFrame(wx.Frame):
         self.text_ctrl_3.SetMinSize((500, 300))
         self.text_ctrl_4.SetMinSize((402, 23))
 
+        self.gauge.SetMinSize((-1, 18))
+        self.label_progress.SetMinSize((250, -1))
+
         self.grid_1.CreateGrid(16, 13)
-        self.grid_1.SetMinSize((950, 334))
+        self.grid_1.SetMinSize((950, 306))
         # end wxGlade
 
     def __do_layout(self):
@@ -216,7 +309,11 @@ class MyFrame(wx.Frame):
         grid_sizer_1.Add(self.text_ctrl_4, (6, 5), (1, 1), wx.ALIGN_CENTER_VERTICAL | wx.ALL, 10)
         grid_sizer_1.Add(self.button_7, (6, 6), (1, 1), wx.ALIGN_CENTER_VERTICAL | wx.BOTTOM | wx.RIGHT | wx.TOP, 10)
 
-        grid_sizer_1.Add(self.grid_1, (7, 0), (1, 7), wx.EXPAND | wx.RIGHT | wx.TOP, 10)
+        # Progress -----------------------------------------------------------------------------------------------------
+        grid_sizer_1.Add(self.gauge, (7, 0), (1, 5), wx.ALIGN_CENTER_VERTICAL | wx.EXPAND | wx.LEFT, 5)
+        grid_sizer_1.Add(self.label_progress, (7, 5), (1, 2), wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 10)
+
+        grid_sizer_1.Add(self.grid_1, (8, 0), (1, 7), wx.EXPAND | wx.RIGHT | wx.TOP, 10)
 
         self.panel_2.SetSizer(grid_sizer_1)
         sizer_2.Add(self.panel_2, 1, wx.ALL | wx.EXPAND, 10)
@@ -239,9 +336,61 @@ class MyFrame(wx.Frame):
         Instantiates class Thread from threading module with a target worker function and proceeds to start the thread
         :param e: event e waits for button press from 'Run Measurement'
         """
+        self.progress_start = None
+        self.updates.reset()
+        self.gauge.SetValue(0)
+        self.label_progress.SetLabel('')
+        self.update_timer.Start(UPDATE_INTERVAL)
         t = Thread(target=self.__onRun)
         t.start()
 
+    def FlushUpdates(self, event=None):
+        """
+        Applies everything the reader thread queued since the last tick in one batch. Progress reports only move the
+        gauge. Progress bars printed by older scripts are still shown in the log: consecutive ones collapse to the last
+        one and, as before, a progress bar is replaced by whatever line follows it, so the log keeps at most one at its
+        end.
+        """
+        events, progress = self.updates.take()
+        if progress is not None:
+            self.ShowProgress(*progress)
+        if not events:
+            return
+
+        text, progress, rows = [], None, []
+        for kind, *payload in events:
+            if kind == 'row':
+                rows.append(payload)
+            elif kind == 'progress':
+                progress = payload[0]
+            else:
+                text.append(payload[0])
+                progress = None
+
+        ctrl = self.text_ctrl_3
+        if self.progress_start is not None and (text or progress is not None):
+            ctrl.Remove(self.progress_start, ctrl.GetLastPosition())
+            self.progress_start = None
+        if text:
+            ctrl.AppendText(''.join(text))
+        if progress is not None:
+            self.progress_start = ctrl.GetLastPosition()
+            ctrl.AppendText(progress)
+
+        if rows:
+            self.grid_1.write_rows(rows)
+
+    def ShowProgress(self, current, total, eta):
+        total = max(int(total), 1)
+        if self.gauge.GetRange() != total:
+            self.gauge.SetRange(total)
+        self.gauge.SetValue(min(max(int(current), 0), total))
+        self.label_progress.SetLabel(f'{current}/{total} ({100. * current / total:.1f}%)   ETA {ipc.format_eta(eta)}')
+
+    def StopUpdates(self):
+        self.update_timer.Stop()
+        self.FlushUpdates()
+
     def __onRun(self):
         """
         IMPLEMENTING RUN -----------------------------------------------------------------------------------------------
@@ -279,6 +428,20 @@ class MyFrame(wx.Frame):
                  ---------------------------------------------
                  U+2588     █       \xe2\x96\x88    FULL BLOCK
 
+        PROGRESS GAUGE -------------------------------------------------------------------------------------------------
+        Scripts report progress with ipc.channel.progress(current, total) instead of printing a bar. The reports are
+        rate limited in the script, only the latest one is kept here, and it moves self.gauge on the next update tick
+        without touching the log. The textual progress bar above is kept for scripts that still print one.
+
+        DATA CHANNEL ---------------------------------------------------------------------------------------------------
+        Results are not parsed out of the log. The script is given the address of a local socket (ipc.ENV_VAR) and
+        publishes rows, progress and metadata there as binary records (see ipc.py), read by a second thread. Scripts
+        that still print '[TABLE] [...]' lines are understood as before.
+
+        BATCHED UPDATES ------------------------------------------------------------------------------------------------
+        The reader threads do not touch the GUI. Lines and table rows go into self.updates and are applied together
+        every UPDATE_INTERVAL ms by FlushUpdates, including the progress bar replacement described above.
+
         IMPLEMENTING wx.CallAfter --------------------------------------------------------------------------------------
         Do:         wx.CallAfter(self.text_ctrl_3.Replace, left, left+500, line)
         Instead of: wx.CallAfter(self.text_ctrl_3.Replace(left, left+500, line))
@@ -324,30 +487,77 @@ class MyFrame(wx.Frame):
         if choice != '':
             print(f'Now running {choice}.py')
             path = '.\\test scripts\\'  # the dot at the beginning ensures folder path begins in  running directory
-            self.p = Popen([sys.executable or 'python', f'{path + choice}.py'], stdout=PIPE, stdin=PIPE, stderr=STDOUT)
+            env = os.environ.copy()
+            trace_path = None
+            if self.traceRunItem.IsChecked():
+                trace_file = f'trace_{choice}_{time.strftime("%Y%m%d_%H%M%S")}.json'
+                trace_path = os.path.abspath(os.path.join('results', trace_file))
+                os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+                env[tracing.ENV_VAR] = trace_path
+            listener = ipc.Listener()
+            env[ipc.ENV_VAR] = listener.address
+            # scripts in 'test scripts' import ipc from the launcher directory
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                              env.get('PYTHONPATH')]))
+            self.p = Popen([sys.executable or 'python', f'{path + choice}.py'], stdout=PIPE, stdin=PIPE, stderr=STDOUT,
+                           env=env)
+            data_thread = Thread(target=self.__onData, args=(listener, self.p))
+            data_thread.start()
 
-            row = 0  # on Run, new data is appended at the zeroth row
-            prevLine = b''
             for line in iter(self.p.stdout.readline, b''):
-                if prevLine.startswith(b'Progress'):
-
-                    line = line + b'\n'
-                    left = max(0, self.text_ctrl_3.GetInsertionPoint() - len(prevLine.decode('utf-8')) - 2)
-                    wx.CallAfter(self.text_ctrl_3.Replace, left, left + 500, line)
-                    prevLine = line
+                text = line.decode('utf-8', errors='replace')
+                progress = ipc.parse_progress(text) if line.startswith(b'Progress') else None
+                if progress is not None:
+                    self.updates.set_progress(*progress)  # printed by ipc.channel without the data channel
+                elif line.startswith(b'Progress'):
+                    self.updates.put_progress(text)
                 else:
-                    wx.CallAfter(self.text_ctrl_3.WriteText, line)
-                    prevLine = line
+                    self.updates.put_text(text)
 
-                if line.startswith(b'[TABLE] [') and line.endswith(b']\r\n\n'):
-                    data = json.loads(line.split(b' ', 1)[1])
-                    self.grid_1.write_list_to_row(row, data)
-                    row += 1
+                if line.startswith(b'[TABLE] [') and line.rstrip().endswith(b']'):
+                    # legacy scripts and scripts run without the data channel
+                    self.updates.put_rows([json.loads(line.split(b' ', 1)[1])])
                 else:
                     pass
+
+            self.p.wait()
+            data_thread.join()
+            wx.CallAfter(self.StopUpdates)
+            if trace_path and os.path.exists(trace_path):
+                self.trace_path = trace_path
+                wx.CallAfter(self.ShowTrace, trace_path)
         else:
             pass
 
+    def __onData(self, listener, process):
+        """
+        Reads the data channel of a running script until the script closes it or exits. A script that never publishes
+        anything never connects, so the listener is polled until the process is gone.
+        """
+        try:
+            conn = None
+            while conn is None and process.poll() is None:
+                conn = listener.accept(timeout=0.2)
+            if conn is None:
+                conn = listener.accept(timeout=0)  # connected just before exiting
+            if conn is None:
+                return
+
+            with conn:
+                for kind, value in ipc.records(conn):
+                    if kind in (ipc.ROW, ipc.BLOCK):
+                        self.updates.put_rows(value)
+                    elif kind == ipc.PROGRESS:
+                        self.updates.set_progress(*value)
+                    elif kind == ipc.METADATA:
+                        if 'header' in value:
+                            self.updates.put_rows([value['header']])
+                        for key, item in value.items():
+                            if key != 'header':
+                                self.updates.put_text(f'[META] {key}: {item}\n')
+        finally:
+            listener.close()
+
     def send_Command(self, e):
         """
         Retrieves the user input from the text ctrl object and writes to the stdin of the shell script subprocess.
@@ -450,6 +660,26 @@ class MyFrame(wx.Frame):
         self.checkbox_2.SetValue(0)
         self.checkbox_3.SetValue(0)
 
+    def OnViewTrace(self, e):
+        """
+        Opens the trace of the last traced run, or lets the user pick a trace file.
+
+        :param e: event e waits for menu selection 'View Trace...'
+        """
+        with wx.FileDialog(self, "Open trace file", defaultDir=os.path.abspath('results'),
+                           defaultFile=os.path.basename(self.trace_path or ''), wildcard="Trace files (*.json)|*.json",
+                           style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as fileDialog:
+            if fileDialog.ShowModal() == wx.ID_CANCEL:
+                return  # the user changed their mind
+            path = fileDialog.GetPath()
+        self.ShowTrace(path)
+
+    def ShowTrace(self, path):
+        try:
+            TraceFrame(path, wx.GetTopLevelParent(self), wx.ID_ANY, "").Show()
+        except (OSError, ValueError, KeyError) as e:
+            wx.MessageBox(f'Could not read trace file:\n{path}\n\n{e}', "Warning")
+
     def OnExit(self, e):
         """
         Closes the application.
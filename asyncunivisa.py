@@ -0,0 +1,226 @@
+import pyunivisa
+
+import asyncio
+import time
+import numpy as np
+
+"""
+asyncio counterpart to pyunivisa.Client.
+
+SOCKET and NIGHTHAWK instruments are raw TCP connections, so they are spoken to directly through asyncio streams. The
+remaining modes (GPIB, INSTR, SERIAL, USB) have no asyncio transport and are run on the default thread pool executor
+through a pooled pyunivisa.Client. Either way, write/read/query are coroutines and independent instruments can be
+awaited at the same time with asyncio.gather:
+
+    async with AsyncClient(f5790A_id) as f5790A, AsyncClient(k34461A_id) as k34461A:
+        (nom, nom_std), (dist, dist_std) = await asyncio.gather(average_reading(f5790A, '*WAI;VAL?'),
+                                                                average_reading(k34461A, 'READ?'))
+
+Generated test scripts do not use this module. Their concurrent_readings runs the blocking VisaClient sessions on a
+thread pool instead, since most of their instruments have no asyncio transport anyway. AsyncClient is for code that
+already runs an event loop.
+
+Running this module starts a local TCP stand-in for a SOCKET and a NIGHTHAWK instrument and reads both concurrently.
+test_asyncunivisa.py checks the client against the same stand-in.
+"""
+
+
+class AsyncClient:
+    def __init__(self, _instr_info):
+        self.instr_info = _instr_info
+        self.mode = self.instr_info['mode']
+
+        self.address = self.instr_info.get('ip_address', None)
+        self.port = self.instr_info.get('port', None)
+        self.timeout = 3.0  # seconds
+
+        self.reader = None
+        self.writer = None
+        self.client = None  # blocking pyunivisa.Client for modes without an asyncio transport
+        self.lock = None  # keeps the write and read of a query together when one instrument is shared by coroutines
+
+        if self.mode == 'NIGHTHAWK':
+            self.read_termination = b'>'
+        else:
+            self.read_termination = b'\n'
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        self.lock = asyncio.Lock()
+        if self.mode in ('SOCKET', 'NIGHTHAWK'):
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.address, int(self.port)),
+                                                              self.timeout)
+            if self.mode == 'NIGHTHAWK':
+                await self.read()  # consume the prompt sent on connection
+        else:
+            self.client = await self._run(pyunivisa.Client, self.instr_info)
+        return self
+
+    @staticmethod
+    async def _run(func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    def info(self):
+        print(self.instr_info)
+
+    async def write(self, cmd):
+        if self.writer is not None:
+            self.writer.write(f'{cmd}\n'.encode())
+            await self.writer.drain()
+        else:
+            await self._run(self.client.write, cmd)
+
+    async def read(self):
+        if self.reader is not None:
+            response = await asyncio.wait_for(self.reader.readuntil(self.read_termination), self.timeout)
+            response = response[:-len(self.read_termination)].decode()
+            if self.mode == 'NIGHTHAWK':
+                response = response.split("\r")[0].lstrip()
+        else:
+            response = await self._run(self.client.read)
+        return response
+
+    async def query(self, cmd):
+        async with self.lock:
+            if self.reader is not None:
+                await self.write(cmd)
+                response = await self.read()
+            else:
+                response = await self._run(self.client.query, cmd)
+        return response
+
+    async def read_binary(self, datatype='d', is_big_endian=False, expect_termination=True):
+        """
+        Reads an IEEE 488.2 definite-length block (#<n><length><data>) and returns a read-only numpy view onto the
+        received bytes. See pyunivisa.Client.read_binary.
+        """
+        if self.reader is None:
+            return await self._run(self.client.read_binary, datatype, is_big_endian, expect_termination)
+
+        mark = await asyncio.wait_for(self.reader.readexactly(1), self.timeout)
+        while mark != b'#':
+            mark = await asyncio.wait_for(self.reader.readexactly(1), self.timeout)
+        digits = int(await asyncio.wait_for(self.reader.readexactly(1), self.timeout))
+        if digits == 0:
+            raise ValueError('Indefinite-length blocks (#0) are not supported')
+        length = int(await asyncio.wait_for(self.reader.readexactly(digits), self.timeout))
+        data = await asyncio.wait_for(self.reader.readexactly(length), self.timeout)
+
+        if self.mode == 'NIGHTHAWK' or expect_termination:
+            await asyncio.wait_for(self.reader.readuntil(self.read_termination), self.timeout)
+
+        return np.frombuffer(data, dtype=pyunivisa.BinaryDtype(datatype, is_big_endian))
+
+    async def query_binary(self, cmd, datatype='d', is_big_endian=False, expect_termination=True):
+        async with self.lock:
+            if self.reader is not None:
+                await self.write(cmd)
+                response = await self.read_binary(datatype, is_big_endian, expect_termination)
+            else:
+                response = await self._run(self.client.query_binary, cmd, datatype, is_big_endian,
+                                           expect_termination)
+        return response
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader, self.writer = None, None
+        elif self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+async def average_reading(instrument, cmd, samples=10, delay=5.):
+    """
+    Coroutine counterpart to average_reading in the generated test scripts. Waiting is done with asyncio.sleep, so
+    other instruments keep being read while this one settles.
+
+    :return: (mean, std)
+    """
+    data = []
+    await asyncio.sleep(delay)
+    for idx in range(samples):
+        data.append(float((await instrument.query(cmd)).split(',')[0]))
+        await asyncio.sleep(0.20)
+    array = np.asarray(data)
+    mean = array.mean()
+    std = np.sqrt(np.mean(abs(array - mean) ** 2))
+    return mean, std
+
+
+async def gather_readings(*requests, samples=10, delay=5.):
+    """
+    Reads independent instruments at the same time.
+
+    :param requests: (instrument, cmd) pairs
+    :return: list of (mean, std) tuples in the same order as the requests
+    """
+    return await asyncio.gather(*(average_reading(instrument, cmd, samples, delay) for instrument, cmd in requests))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+async def _stand_in(reader, writer, prompt=False, latency=0.05):
+    """
+    Minimal TCP stand-in for an instrument. Answers *IDN?, returns a REAL64 big endian block of readings for FETC?
+    and a single reading for every other query. NIGHTHAWK instruments echo a '>' prompt after every response.
+    """
+    if prompt:
+        writer.write(b'>')
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        cmd = line.decode().strip()
+        if cmd.endswith('?'):
+            await asyncio.sleep(latency)
+            if cmd == 'FETC?':
+                data = (1.0 + np.random.normal(0, 1e-6, 1000)).astype('>f8').tobytes()
+                length = str(len(data)).encode()
+                writer.write(b'#' + str(len(length)).encode() + length + data + (b'\r\n>' if prompt else b'\n'))
+            else:
+                response = 'FLUKE,STAND-IN,0,1.0' if cmd == '*IDN?' else f'{1.0 + np.random.normal(0, 1e-6):.9e}'
+                writer.write((f'{response}\r\n>' if prompt else f'{response}\n').encode())
+        elif prompt:
+            writer.write(b'\r\n>')
+        await writer.drain()
+    writer.close()
+
+
+async def _demo():
+    socket_server = await asyncio.start_server(_stand_in, '127.0.0.1', 0)
+    nighthawk_server = await asyncio.start_server(lambda r, w: _stand_in(r, w, prompt=True), '127.0.0.1', 0)
+    socket_id = {'ip_address': '127.0.0.1', 'port': socket_server.sockets[0].getsockname()[1], 'mode': 'SOCKET'}
+    nighthawk_id = {'ip_address': '127.0.0.1', 'port': nighthawk_server.sockets[0].getsockname()[1],
+                    'mode': 'NIGHTHAWK'}
+
+    async with AsyncClient(socket_id) as meter, AsyncClient(nighthawk_id) as source:
+        print(await meter.query('*IDN?'))
+        print(await source.query('*IDN?'))
+
+        start = time.perf_counter()
+        await average_reading(meter, 'READ?', delay=0.5)
+        await average_reading(source, 'VAL?', delay=0.5)
+        print(f'sequential: {time.perf_counter() - start:.3f} s')
+
+        start = time.perf_counter()
+        results = await gather_readings((meter, 'READ?'), (source, 'VAL?'), delay=0.5)
+        print(f'concurrent: {time.perf_counter() - start:.3f} s')
+        print(results)
+
+        for instrument in (meter, source):
+            block = await instrument.query_binary('FETC?', datatype='d', is_big_endian=True)
+            print(f'{instrument.mode} binary block: {block.size} readings, mean {block.mean():.9f}')
+
+    socket_server.close()
+    nighthawk_server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
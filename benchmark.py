@@ -0,0 +1,265 @@
+from wizard_script import CodeWriter
+import simulator
+
+from collections import defaultdict
+import importlib.util
+import numpy as np
+import subprocess
+import tracemalloc
+import functools
+import argparse
+import platform
+import tempfile
+import json
+import time
+import sys
+import io
+import os
+import wx
+
+"""
+Throughput benchmark for the sweep pipeline.
+
+For each sweep size a script is generated with CodeWriter.generate_code from the template, exactly as the Script
+Wizard does, and run end to end against simulated instruments (mode: SIM). The frame of the generated script is built
+but never shown, so the benchmark runs without a window. The real code paths are timed:
+    > average_reading           - settling and sampling of one reading
+    > write_to_log              - one row into the table, on the sweep thread
+    > MyGrid.refresh_store      - showing the new rows in the grid, when the redraw scheduler of the frame is due
+    > draw_plot                 - redrawing the plot, when the redraw scheduler of the frame is due
+    > setpoint                  - the whole setpoint, from one logged row to the next
+
+The frame is never shown, so no GUI timer runs. write_to_log and plot_data only request a refresh from the frame's
+RedrawScheduler, and the benchmark ticks the scheduler after every plot_data in place of its timer: the grid and the
+plot are brought up to date whenever the scheduler would do it at its rate and back-off, and once more at the end of
+the sweep.
+
+Each run reports setpoints/second, the 50/90/99th percentile and max latency of every stage, and the peak memory
+allocated by Python (tracemalloc). Results are stored as JSON so two versions can be compared with --compare:
+
+    python benchmark.py --sizes 10 100 1000 --output benchmarks/before.json
+    python benchmark.py --sizes 10 100 1000 --compare benchmarks/before.json
+
+The simulated instruments answer without latency and settle immediately, and the settling engine polls without
+sleeping, so the numbers measure the software rather than the instruments. Sweeps that run longer than --budget seconds
+are stopped early and reported as truncated. On a machine without a display, run under a virtual X server (xvfb-run).
+"""
+
+SIZES = [10, 100, 1000, 10000, 100000]
+STAGES = ['setpoint', 'average_reading', 'write_to_log', 'refresh_store', 'draw_plot']
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class StageTimer:
+    def __init__(self, budget):
+        self.budget = budget
+        self.samples = defaultdict(list)
+        self.start = time.perf_counter()
+        self.last_row = self.start
+        self.rows = 0
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[name].append(time.perf_counter() - start)
+        return timed
+
+    def wrap_setpoint(self, func):
+        """
+        write_to_log is called once per setpoint, so the time between two calls is the time of a whole setpoint
+        """
+        timed = self.wrap('write_to_log', func)
+
+        @functools.wraps(func)
+        def setpoint(*args, **kwargs):
+            result = timed(*args, **kwargs)
+            now = time.perf_counter()
+            self.samples['setpoint'].append(now - self.last_row)
+            self.last_row = now
+            self.rows += 1
+            if now - self.start > self.budget:
+                raise BudgetExceeded
+            return result
+        return setpoint
+
+    def percentiles(self):
+        stats = {}
+        for name in STAGES:
+            ms = np.asarray(self.samples.get(name, [])) * 1e3
+            if ms.size:
+                p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+                stats[name] = {'count': int(ms.size), 'mean_ms': ms.mean(), 'p50_ms': p50, 'p90_ms': p90,
+                               'p99_ms': p99, 'max_ms': ms.max()}
+        return stats
+
+
+# FUNCTION DEFINITIONS -------------------------------------------------------------------------------------------------
+def sweep_config(latency=0., seed=0):
+    sim = {'port': '', 'gpib_address': '', 'mode': 'SIM', 'latency': latency, 'noise': 1e-6, 'tau': 0., 'seed': seed}
+    return {'f5560A': {'ip_address': '5560A', **sim},
+            'f5790A': {'ip_address': '5790A', **sim},
+            'k34461A': {'ip_address': '34461A', **sim}}
+
+
+def sweep_commands():
+    # the distortion sweep of output/leviathan_out.py: source a current, read the standard and the meter, go to standby
+    return [{'choice': 'f5560A', 'code': 'out curA; out 1000Hz', 'variable': ''},
+            {'choice': 'f5560A', 'code': 'OPER', 'variable': ''},
+            {'choice': 'f5790A', 'code': '*WAI;VAL?', 'variable': 'nom'},
+            {'choice': 'k34461A', 'code': 'READ?', 'variable': 'dist'},
+            {'choice': 'f5560A', 'code': 'STBY', 'variable': ''}]
+
+
+def generate_sweep(size, output_file, latency=0.):
+    currents = np.linspace(1e-3, 120e-3, size)
+    CodeWriter().generate_code(instr_config=sweep_config(latency),
+                               input_variables={'cur': ', '.join(f'{cur:.6g}' for cur in currents)},
+                               permutate=1,  # a zip over a single variable would yield 1-tuples
+                               commands=sweep_commands(),
+                               output_variables={'nom': 2, 'dist': 3},
+                               output_file=output_file)
+
+
+def load_script(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def tick_after(plot_data, scheduler):
+    """
+    Stands in for the timer of a RedrawScheduler, which only runs in a wx main loop
+    """
+    @functools.wraps(plot_data)
+    def requested(*args, **kwargs):
+        result = plot_data(*args, **kwargs)
+        scheduler.on_timer(None)
+        return result
+    return requested
+
+
+def run_sweep(size, workdir, budget=60., latency=0.):
+    path = os.path.join(workdir, f'sweep_{size}.py')
+    generate_sweep(size, path, latency)
+
+    stdout = sys.stdout
+    log = io.StringIO()
+    tracemalloc.start()
+    try:
+        module = load_script(path, f'sweep_{size}')
+        module.settling.interval = 0.  # simulated instruments settle immediately, so poll without sleeping
+
+        frame = module.TestFrame(None, wx.ID_ANY, "")  # built, but never shown
+        sys.stdout = log  # the frame redirects stdout to its log window
+
+        timer = StageTimer(budget)
+        module.average_reading = timer.wrap('average_reading', module.average_reading)
+        frame.grid_1.refresh_store = timer.wrap('refresh_store', frame.grid_1.refresh_store)
+        frame.draw_plot = timer.wrap('draw_plot', frame.draw_plot)  # called by frame.refresh, the scheduler's callback
+        frame.plot_data = tick_after(frame.plot_data, frame.plot_scheduler)
+        frame.write_to_log = timer.wrap_setpoint(frame.write_to_log)
+
+        timer.start = timer.last_row = time.perf_counter()
+        try:
+            frame.run()
+            truncated = False
+        except BudgetExceeded:
+            truncated = True
+        if frame.plot_scheduler.dirty:
+            frame.plot_scheduler.flush()  # the last rows, drawn on the next tick in the GUI
+        elapsed = time.perf_counter() - timer.start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        sys.stdout = stdout
+
+    module.plt.close(frame.figure)
+    frame.Destroy()
+
+    return {'size': size,
+            'points': timer.rows,
+            'truncated': truncated,
+            'elapsed_s': elapsed,
+            'setpoints_per_second': timer.rows / elapsed if elapsed else 0.,
+            'peak_memory_mb': peak / 2 ** 20,
+            'stages': timer.percentiles()}
+
+
+def version():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return commit or 'unknown'
+
+
+def print_results(results, baseline=None):
+    previous = {run['size']: run for run in baseline['results']} if baseline else {}
+    print(f"\n{'size':>8} {'points':>8} {'setpoints/s':>12} {'peak MB':>9}  " +
+          ' '.join(f'{name + " p50/p99 ms":>30}' for name in STAGES))
+    for run in results:
+        row = f"{run['size']:>8} {run['points']:>8}{'*' if run['truncated'] else ' '}" \
+              f"{run['setpoints_per_second']:>11.1f} {run['peak_memory_mb']:>9.1f}  "
+        for name in STAGES:
+            stage = run['stages'].get(name)
+            cell = f"{stage['p50_ms']:.3f}/{stage['p99_ms']:.3f}" if stage else '-'
+            row += f'{cell:>30} '
+        if run['size'] in previous:
+            before = previous[run['size']]['setpoints_per_second']
+            row += f"  {run['setpoints_per_second'] / before:.2f}x vs {baseline['version']}" if before else ''
+        print(row)
+    if any(run['truncated'] for run in results):
+        print('* sweep stopped early by the time budget')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput benchmark for the sweep pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='number of setpoints of each sweep')
+    parser.add_argument('--budget', type=float, default=60., help='seconds allowed per sweep before it is stopped')
+    parser.add_argument('--latency', type=float, default=0., help='simulated seconds per instrument query')
+    parser.add_argument('--output', default=None, help='JSON results file (default: benchmarks/<commit>_<time>.json)')
+    parser.add_argument('--compare', default=None, help='JSON results of a previous run to compare against')
+    args = parser.parse_args()
+
+    app = wx.App(False)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            simulator.bench.reset()
+            results.append(run_sweep(size, workdir, args.budget, args.latency))
+            print(f"{size} setpoints: {results[-1]['setpoints_per_second']:.1f} setpoints/s")
+
+    report = {'version': version(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'wx': wx.version(),
+              'budget_s': args.budget,
+              'latency_s': args.latency,
+              'results': results}
+
+    output = args.output or os.path.join('benchmarks', f"{report['version']}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f'\nresults written to {output}')
+    app.Destroy()
+
+
+if __name__ == "__main__":
+    main()
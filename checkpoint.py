@@ -0,0 +1,167 @@
+from numbers import Real
+from pathlib import Path
+import threading
+import hashlib
+import json
+import os
+
+"""
+Append-only checkpoint journal of a sweep.
+
+A long sweep keeps its results in TestFrame.table and the grid only, so a crashed Test.run thread or a dropped GPIB
+connection loses everything measured so far. The journal writes one JSON line per completed setpoint and flushes it to
+disk before the sweep moves on, so at most the setpoint being measured is lost:
+
+    {"header": ["cur", "nom", "dist", "settle_time", "index"], "sweep": "fb833f72529b8296"}
+    {"index": 0, "row": [0.001, 0.0010000012, 2.1e-05, 0.61, 0]}
+    {"index": 1, "row": [0.002, 0.0020000008, 1.9e-05, 0.58, 1]}
+    {"complete": true}
+
+A setpoint is keyed by its index in the unordered sweep (the position in zip(...) or itertools.product(...)), so a
+resumed run skips exactly the setpoints that are already in the journal and replays their rows into the table instead
+of measuring them again. Floats are written with repr, which round-trips exactly, so a resumed run produces the same
+table as an uninterrupted one.
+
+The sweep signature is a digest of the values of every input variable and of how they are traversed (see
+sweep_signature). A journal whose header or signature does not match the sweep being run belongs to a different test
+and is not resumed, since the same index would be a different setpoint. A sweep that runs to its end writes a final
+complete line, so a journal without one was interrupted. A line cut short by a crash is dropped, and the file is
+truncated back to the last complete line before new rows are appended.
+
+Generated test scripts import Journal and sweep_signature from here.
+"""
+
+
+class Journal:
+    def __init__(self, path, header, resume=False, sweep=None):
+        """
+        :param path: journal file. Created if it does not exist
+        :param header: column names of the rows. Stored as the first line of the journal
+        :param resume: keep the rows of a previous run with the same header and sweep. Otherwise the journal is started
+                       over
+        :param sweep: signature of the setpoints, see sweep_signature. Stored with the header
+        """
+        self.path = Path(path)
+        self.header = list(header)
+        self.sweep = sweep
+        self.lock = threading.Lock()
+        self.rows = {}
+
+        size = 0
+        if resume and self.path.exists():
+            meta, rows, size = load(self.path)
+            if (meta.get('header'), meta.get('sweep')) == (self.header, self.sweep):
+                self.rows = rows
+                print(f'[Journal] resuming {len(rows)} completed setpoints from {self.path}')
+            else:
+                print(f'[Journal] {self.path} was written by a different sweep and is not resumed')
+                size = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if size:
+            os.truncate(self.path, size)
+            self.file = open(self.path, 'a')
+        else:
+            self.file = open(self.path, 'w')
+            self._write({'header': self.header, 'sweep': self.sweep})
+
+    def __contains__(self, index):
+        return index in self.rows
+
+    def append(self, index, row):
+        """
+        Records a completed setpoint. Returns once the line is on disk.
+        """
+        with self.lock:
+            self.rows[index] = list(row)
+            self._write({'index': index, 'row': self.rows[index]})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, default=to_json) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self, complete=False):
+        """
+        :param complete: the sweep ran to its end. Marks the journal so it is not taken for an interrupted run
+        """
+        with self.lock:
+            if complete:
+                self._write({'complete': True})
+            self.file.close()
+
+
+# FUNCTION DEFINITIONS -------------------------------------------------------------------------------------------------
+def journal_path(filename='test'):
+    """
+    Journal of the generated test script named filename (see the 'filename' of the script). Relative to the directory
+    the script is run from, next to its other results.
+    """
+    return Path('results') / f'{filename}_journal.jsonl'
+
+
+def sweep_header(input_variables, output_variables, permutate):
+    """
+    Header of the table, and of the journal, of the script generated for a sweep (see templates/template.py.j2)
+    """
+    index = ['index'] if permutate and input_variables else []
+    return list(input_variables) + list(output_variables) + ['settle_time'] + index
+
+
+def sweep_signature(permutate, *series):
+    """
+    Digest of the setpoints of a sweep: the values of every input variable, in order, and whether they are permutated
+    or stepped together. Numbers are compared as floats, so [1, 2] in a generated script and the floats parsed by the
+    Script Wizard give the same signature.
+
+    [EXAMPLE] sweep_signature(True, [1e-3, 1e-2], [1000, 2000]) --> 'fb833f72529b8296' (16 hex digits)
+    """
+    values = [[float(value) if isinstance(value, Real) else str(value) for value in values] for values in series]
+    return hashlib.blake2b(json.dumps([bool(permutate), values]).encode(), digest_size=8).hexdigest()
+
+
+def to_json(value):
+    # numpy scalars and arrays are not serializable by json. Anything else is written as its string
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def load(path):
+    """
+    :return: (meta, {index: row}, size). meta holds the 'header' and 'sweep' of the journal, and 'complete' if the sweep
+             ran to its end. size is the number of bytes up to the end of the last row, where new rows are appended
+    """
+    meta, rows, size = {}, {}, 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # cut short by a crash
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if 'complete' in record:
+                meta['complete'] = True
+                continue
+            if 'header' in record:
+                meta.update(record)
+            else:
+                rows[record['index']] = record['row']
+            meta.pop('complete', None)  # rows appended by a resumed run after the sweep once ended
+            size += len(line)
+    return meta, rows, size
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        meta, rows, size = load(sys.argv[1])
+        state = 'complete' if meta.get('complete') else 'interrupted'
+        print(f'{len(rows)} completed setpoints ({size} bytes, {state}, sweep {meta.get("sweep")})')
+        print(', '.join(meta.get('header') or []))
+        for index in sorted(rows):
+            print(index, rows[index])
+    else:
+        print('usage: python checkpoint.py <journal.jsonl>')
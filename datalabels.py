@@ -0,0 +1,115 @@
+from matplotlib.artist import Artist
+from matplotlib.text import Text
+from matplotlib.transforms import IdentityTransform
+import numpy as np
+
+"""
+Data labels of the live plot.
+
+Annotating every row of a long sweep adds one artist per row, each drawn on every frame whether it fits the view or
+not. DataLabels is a single artist over the plotted columns that only draws the labels that fit:
+
+    labels = DataLabels('ppm_shift')
+    ax.add_artist(labels)
+    labels.set_data(x, y, table['ppm_shift'])  # after new rows were logged
+    if labels.changed():
+        ...  # the background with the labels has to be drawn again
+
+Generated test scripts import DataLabels from here.
+"""
+
+
+class DataLabels(Artist):
+    """
+    The data labels of the live plot as a single artist, instead of one annotation per row. The artist holds the plotted
+    columns and formats a label only the first time it is shown. The labels are laid out for the current view: points
+    outside the axes are culled, then points whose label would overlap a label already placed. So the cost of a draw
+    depends on the labels that fit the view, not on the number of rows, and a new row that adds no label (changed()
+    is False) does not need the labels drawn again.
+    """
+
+    def __init__(self, name, offset=10):
+        """
+        :param name: column shown by the labels, as '<name>=<value>'
+        :param offset: pixels between a point and the bottom of its label
+        """
+        super().__init__()
+        self.name = name
+        self.offset = offset
+        self.x, self.y, self.values = [], [], []
+        self.formatted = {}  # {row: label}
+        self.metrics = None  # (width of a character, height of a label) in pixels, measured by the last draw
+        self.placed = []  # [(row, x, y), ...] drawn by the last draw
+        self.text = Text(0, 0, '', horizontalalignment='center', verticalalignment='bottom',
+                         transform=IdentityTransform())
+
+    def set_data(self, x, y, values):
+        # the plotted columns, which grow with the table. Nothing is formatted or copied here
+        self.x, self.y, self.values = x, y, values
+        self.stale = True
+
+    def label(self, row):
+        if row not in self.formatted:
+            value = self.values[row]
+            try:
+                value = round(value, 3)
+            except TypeError:
+                pass
+            self.formatted[row] = f'{self.name}={value}'
+        return self.formatted[row]
+
+    def layout(self):
+        """
+        :return: [(row, x, y), ...] of the labels that fit the view, in display coordinates
+        """
+        rows = min(len(self.x), len(self.y), len(self.values))
+        if not rows or self.axes is None or self.metrics is None:
+            return []
+        try:
+            points = self.axes.transData.transform(np.column_stack((np.asarray(self.x[:rows], dtype=float),
+                                                                    np.asarray(self.y[:rows], dtype=float))))
+        except (TypeError, ValueError):
+            return []  # columns that are not numbers cannot be placed
+        char_width, height = self.metrics
+        box = self.axes.bbox
+
+        # points in view, then at most one candidate per label sized cell of the axes, chosen in a vectorized pass
+        inside = np.isfinite(points).all(axis=1)
+        inside[inside] = ((points[inside, 0] >= box.x0) & (points[inside, 0] <= box.x1)
+                          & (points[inside, 1] >= box.y0) & (points[inside, 1] + self.offset + height <= box.y1))
+        candidates = np.flatnonzero(inside)
+        cells = np.floor((points[candidates] - (box.x0, box.y0)) / max(height, 1.)).astype(np.int64)
+        _, first = np.unique(cells[:, 0] * (int(box.height) + 1) + cells[:, 1], return_index=True)
+
+        placed, bands = [], {}  # {band of label boxes: [(left, right, bottom), ...]}
+        for row in candidates[np.sort(first)]:
+            width = len(self.label(row)) * char_width
+            x, bottom = points[row, 0], points[row, 1] + self.offset
+            left = x - width / 2
+            if left < box.x0 or left + width > box.x1:
+                continue
+            band = int(bottom // height)
+            if any(l < left + width and left < r and abs(b - bottom) < height
+                   for near in (band - 1, band, band + 1) for l, r, b in bands.get(near, ())):
+                continue
+            bands.setdefault(band, []).append((left, left + width, bottom))
+            placed.append((row, x, bottom))
+        return placed
+
+    def changed(self):
+        # True when the labels that fit the view are not the labels drawn last
+        return self.metrics is None or [row for row, _, _ in self.layout()] != [row for row, _, _ in self.placed]
+
+    def draw(self, renderer):
+        if not self.get_visible() or self.axes is None:
+            return
+        self.text.set_figure(self.figure)
+        self.text.set_text('0')
+        extent = self.text.get_window_extent(renderer)  # a line of text, including the descent
+        self.metrics = (extent.width, extent.height)
+        self.placed = self.layout()
+        for row, x, y in self.placed:
+            self.text.set_text(self.label(row))
+            self.text.set_position((x, y))
+            self.text.draw(renderer)
+        self.stale = False
@@ -0,0 +1,151 @@
+from numbers import Integral, Real
+import numpy as np
+
+"""
+Growable columnar storage for the results table of a test.
+
+TestFrame.table used to be a dict of Python lists, which matplotlib converted to arrays again on every redraw, so each
+new row cost O(n) and a run cost O(n^2). ColumnStore keeps every numeric column in a preallocated float64 (or int64)
+array that doubles in capacity when it fills up (amortized O(1) per row) and keeps columns holding anything else (range
+labels, values typed in by the operator) as lists. Reading a column returns a view onto the rows logged so far, so
+plotting and exporting copy nothing:
+
+    table = ColumnStore(['cur', 'nom', 'range'])
+    table.append([0.1, 0.0999998, '120mA'])
+    table['nom']        --> array([0.0999998])  (a view. Take a copy to keep it across appends)
+    table['range']      --> ['120mA']
+
+A column's type is decided by its first value. An integer column that receives a float or None (stored as NaN) becomes
+a float column, and a numeric column that receives anything other than a number becomes a list column from then on.
+
+The store behaves like the dict it replaces: keys(), values(), items(), iteration and len() are over the columns, and
+the number of rows is ColumnStore.rows. Generated test scripts import ColumnStore from here.
+"""
+
+
+class ColumnStore:
+    def __init__(self, names=(), capacity=1024):
+        """
+        :param names: column names, in order
+        :param capacity: rows allocated up front. Doubled whenever it fills up
+        """
+        self.capacity = max(1, int(capacity))
+        self.rows = 0
+        self.columns = {name: None for name in names}  # None until the first value decides the type of the column
+
+    # dict interface ---------------------------------------------------------------------------------------------------
+    def __getitem__(self, name):
+        column = self.columns[name]
+        if column is None:
+            return np.empty(0)
+        if isinstance(column, list):
+            return column
+        return column[:self.rows]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def keys(self):
+        return self.columns.keys()
+
+    def values(self):
+        return [self[name] for name in self.columns]
+
+    def items(self):
+        return [(name, self[name]) for name in self.columns]
+
+    # rows -------------------------------------------------------------------------------------------------------------
+    def append(self, row):
+        """
+        Appends one value per column, in column order. Missing trailing values are stored as NaN (None in list columns).
+        """
+        if self.rows == self.capacity:
+            self._grow()
+        for idx, name in enumerate(self.columns):
+            value = row[idx] if idx < len(row) else None
+            column = self.columns[name]
+            if column is None:
+                column = self._new_column(name, value)
+            if isinstance(column, list):
+                column.append(value)
+            elif value is None or isinstance(value, (Real, np.number)):
+                if column.dtype.kind == 'i' and not isinstance(value, (Integral, np.integer)):
+                    column = self._to_float(name)
+                column[self.rows] = np.nan if value is None else value
+            else:
+                self._to_list(name).append(value)
+        self.rows += 1
+
+    def row(self, index):
+        return [self.columns[name][index] if self.columns[name] is not None else np.nan for name in self.columns]
+
+    # columns ----------------------------------------------------------------------------------------------------------
+    def rename(self, names):
+        """
+        Renames the columns in order. Used when a header is written after rows have been logged.
+        """
+        names = list(names)
+        if len(names) != len(self.columns):
+            raise ValueError(f'{len(names)} names for {len(self.columns)} columns: {names}')
+        self.columns = {new: column for new, column in zip(names, self.columns.values())}
+
+    def set_column(self, name, values):
+        """
+        Replaces the values of a column, or adds it after the last column. values holds one value per row.
+        """
+        values = list(values)
+        if len(values) != self.rows:
+            raise ValueError(f"column '{name}' has {len(values)} values for {self.rows} rows")
+        if all(value is None or isinstance(value, (Real, np.number)) for value in values):
+            column = np.full(self.capacity, np.nan)
+            column[:self.rows] = [np.nan if value is None else value for value in values]
+            self.columns[name] = column
+        else:
+            self.columns[name] = values
+
+    def _new_column(self, name, value):
+        if isinstance(value, (Integral, np.integer)) and not isinstance(value, (bool, np.bool_)):
+            column = np.zeros(self.capacity, dtype=np.int64)
+        elif value is None or isinstance(value, (Real, np.number)):
+            column = np.full(self.capacity, np.nan)
+        else:
+            column = [None] * self.rows
+        self.columns[name] = column
+        return column
+
+    def _to_float(self, name):
+        column = self.columns[name].astype(float)
+        self.columns[name] = column
+        return column
+
+    def _to_list(self, name):
+        column = self.columns[name][:self.rows].tolist()
+        self.columns[name] = column
+        return column
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, column in self.columns.items():
+            if isinstance(column, np.ndarray):
+                grown = np.zeros(self.capacity, dtype=column.dtype)
+                grown[:self.rows] = column[:self.rows]
+                self.columns[name] = grown
+
+
+if __name__ == "__main__":
+    import time
+
+    table = ColumnStore(['index', 'cur', 'nom', 'range'])
+    for count in (1000, 10000, 100000, 1000000):
+        added, start = count - table.rows, time.perf_counter()
+        while table.rows < count:
+            table.append([table.rows, 0.1, 0.0999998, '120mA'])
+        elapsed = time.perf_counter() - start
+        numeric = sum(column.nbytes for column in table.columns.values() if isinstance(column, np.ndarray))
+        print(f'{count:>8} rows: {elapsed / added * 1e6:.2f} us/row, {numeric / 2 ** 20:.1f} MB of numeric columns')
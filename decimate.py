@@ -0,0 +1,174 @@
+import numpy as np
+
+"""
+Decimation of long series for plotting.
+
+A line with more points than the axes has pixels draws the same picture as a well chosen subset of its points, only
+slower and with far more memory in Agg. A series is reduced to about twice the pixel width of the axes before it is
+plotted, by one of:
+
+    > minmax    - the smallest and the largest value of every bucket of consecutive points (min/max envelope). Keeps
+                  every spike and the full extent of noise, so the reduced line covers the same pixels.
+    > lttb      - Largest-Triangle-Three-Buckets. One point per bucket, the one forming the largest triangle with the
+                  point kept from the previous bucket and the average of the next one. Keeps the visual shape of smooth
+                  series with fewer points than minmax.
+
+The full-resolution data is kept. LineDecimator plots through an axes and decimates again whenever its x limits change,
+so zooming or panning with the NavigationToolbar shows the detail of the visible range:
+
+    decimator = LineDecimator(ax)
+    line = decimator.plot(ax.plot, x, y)
+    ...
+    decimator.set_data(line, x, y)  # after new points were logged
+
+Generated test scripts import LineDecimator from here.
+"""
+
+METHODS = ('minmax', 'lttb')
+
+
+class LineDecimator:
+    def __init__(self, ax, method='minmax', factor=2):
+        """
+        :param ax: axes the lines are plotted on
+        :param method: 'minmax', 'lttb' or None (plot every point)
+        :param factor: points kept per pixel of axes width
+        """
+        self.ax = ax
+        self.method = method
+        self.factor = factor
+        self.series = {}  # {line: (x, y)} at full resolution
+        ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+
+    def plot(self, plot_function, x, y, *args, **kwargs):
+        """
+        :param plot_function: ax.plot, ax.semilogx, ...
+        :return: the line plotted
+        """
+        line, = plot_function(*self.reduce(x, y), *args, **kwargs)
+        self.series[line] = (x, y)
+        return line
+
+    def set_data(self, line, x, y):
+        self.series[line] = (x, y)
+        line.set_data(*self.reduce(x, y))
+
+    def reduce(self, x, y):
+        points = max(2, int(self.factor * self.ax.bbox.width))
+        # while the axes autoscale, their limits follow the data and every point is in view. Once zoomed or panned,
+        # only the points in view are decimated
+        xlim = None if self.ax.get_autoscalex_on() else self.ax.get_xlim()
+        return decimate(x, y, points, self.method, xlim)
+
+    def on_xlim_changed(self, ax):
+        for line, (x, y) in self.series.items():
+            line.set_data(*self.reduce(x, y))
+
+
+# FUNCTION DEFINITIONS -------------------------------------------------------------------------------------------------
+def decimate(x, y, points, method='minmax', xlim=None):
+    """
+    :param points: about how many points to keep
+    :param xlim: (left, right) to keep only the points in view, and their neighbours so lines reach the edges
+    :return: (x, y) reduced. Returned as given when there is nothing to reduce or the values are not numbers
+    """
+    if method is None or len(y) <= points or len(x) != len(y):
+        return x, y
+    x_values, y_values = np.asarray(x), np.asarray(y)
+    if x_values.dtype.kind not in 'fiu' or y_values.dtype.kind not in 'fiu':
+        return x, y
+
+    index = np.arange(len(y_values)) if xlim is None else in_view(x_values, xlim)
+    if len(index) > points:
+        if method == 'lttb':
+            kept = lttb(x_values[index], y_values[index], points)
+        else:
+            kept = minmax(y_values[index], points // 2)
+        index = index[kept]
+    return x_values[index], y_values[index]
+
+
+def in_view(x, xlim):
+    """
+    :return: indices of the points within xlim, and of the points next to them
+    """
+    lo, hi = sorted(xlim)
+    inside = (x >= lo) & (x <= hi)
+    near = inside.copy()
+    near[:-1] |= inside[1:]
+    near[1:] |= inside[:-1]
+    return np.flatnonzero(near)
+
+
+def minmax(y, buckets):
+    """
+    :return: sorted indices of the smallest and the largest value of each of buckets runs of consecutive points, and of
+             the first and the last point. NaN is only kept where a whole bucket is NaN
+    """
+    n = len(y)
+    if n <= 2 * buckets or buckets < 1:
+        return np.arange(n)
+    size = -(-n // buckets)  # ceiling
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    missing = np.isnan(padded)
+    offsets = np.arange(buckets) * size
+    lowest = np.where(missing, np.inf, padded).argmin(axis=1) + offsets
+    highest = np.where(missing, -np.inf, padded).argmax(axis=1) + offsets
+    index = np.unique(np.concatenate((lowest, highest, [0, n - 1])))
+    return index[index < n]
+
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+
+    :return: sorted indices of the points kept. The first and the last point are always kept. Points where x or y is
+             not finite are left out of the triangles, and kept only where a whole bucket is NaN, so the line keeps its
+             gap there like minmax
+    """
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return np.linspace(0, n - 1, points).astype(np.int64)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)  # points - 2 buckets between the first and last point
+    last = n - 1 - int(finite[::-1].argmax())  # last finite point
+
+    index = np.empty(points, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+    a = int(finite.argmax())  # the point kept from the previous bucket, or the first finite point
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        following = slice(hi, max(edges[bucket + 2], hi + 1)) if bucket + 2 < len(edges) else slice(last, last + 1)
+        kept = finite[following]
+        if kept.any():
+            average_x, average_y = x[following][kept].mean(), y[following][kept].mean()
+        else:
+            average_x, average_y = x[a], y[a]  # nothing to aim at. Every area is 0 and the first finite point is kept
+        area = np.abs((x[a] - average_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (average_y - y[a]))
+        area[~finite[lo:hi]] = -1.
+        best = lo + int(area.argmax())
+        index[bucket + 1] = best
+        if finite[best]:
+            a = best
+    return index
+
+
+if __name__ == "__main__":
+    import time
+
+    count = 10 ** 6
+    t = np.linspace(0, 100, count)
+    y = np.sin(t) + np.random.normal(0, 0.1, count)
+    y[count // 3] = 5.  # a spike
+
+    for method in METHODS:
+        start = time.perf_counter()
+        x_reduced, y_reduced = decimate(t, y, 2000, method)
+        elapsed = time.perf_counter() - start
+        print(f'{method:>6}: {count} --> {len(y_reduced)} points in {elapsed * 1e3:.1f} ms, '
+              f'max {y_reduced.max():.2f} (full {y.max():.2f})')
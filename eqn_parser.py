@@ -1,8 +1,9 @@
 from __future__ import division
-from pyparsing import (Literal, CaselessLiteral, Word, Combine, Group, Optional,
+from pyparsing import (Literal, CaselessLiteral, CaselessKeyword, Word, Combine, Group, Optional,
                        ZeroOrMore, Forward, nums, alphas, oneOf, ParseException, alphanums, delimitedList,)
+import functools
+import threading
 import math
-import operator
 
 import numpy as np
 from numpy import cos, sin, tan, cosh, sinh, tanh, log, log10, sqrt, exp
@@ -23,10 +24,82 @@ https://github.com/pyparsing/pyparsing/blob/master/examples/fourFn.py
 '''
 
 
+CHUNK_SIZE = 65536  # elements per chunk of Expression.evaluateChunked
+WHOLE_ARRAY = ('fft', 'mean', 'std', 'rms')  # functions that need the whole column. max and min of one argument too
+
+
 def cmp(a, b):
     return (a > b) - (a < b)
 
 
+class Expression(object):
+    """
+    An expression compiled once by NumericStringParser.compile. Calling it evaluates the expression with the given
+    variable bindings without parsing again, so the same expression can be applied to any number of columns or updates:
+
+        transform = nsp.compile('(y - x) / x * 1e6')
+        ppm = [transform(x=nom, y=col) for col in columns]
+    """
+
+    def __init__(self, text, stack, func, parser=None):
+        self.text = text
+        self.stack = tuple(stack)  # postfix form, as built by the grammar. Left untouched by evaluation
+        self.func = func
+        self.parser = parser
+        self.names = sorted({op for op in stack if isinstance(op, str) and op[0].isalpha()
+                             and op not in ('PI', 'E', 'unary -')})
+        self.chunkable = not any(isinstance(op, tuple) and (op[0] in WHOLE_ARRAY or op in (('max', 1), ('min', 1)))
+                                 for op in stack)
+
+    def __call__(self, variables=None, **kwargs):
+        if kwargs:
+            variables = dict(variables or {}, **kwargs)
+        return self.func(variables or {})
+
+    def evaluateChunked(self, variables=None, chunk_size=CHUNK_SIZE, out=None, **kwargs):
+        """
+        Evaluates the expression over long columns chunk_size elements at a time, writing into a preallocated output.
+        Every operation writes into a scratch buffer of one chunk that is reused for every chunk (ufunc out=), so the
+        memory used besides the output is bounded by the size of the expression times chunk_size, however long the
+        columns are. Unchunked evaluation allocates a full-size temporary per operation instead.
+
+        Expressions with whole-column functions (fft, mean, std, rms, max and min of one argument), columns of unequal
+        lengths and scalar-only bindings fall back to normal evaluation.
+
+        :param out: 1-D array to write the result into. Allocated when None
+        :return: out
+        """
+        if kwargs:
+            variables = dict(variables or {}, **kwargs)
+        variables = {key: np.asarray(value) if isinstance(value, (list, tuple)) else value
+                     for key, value in (variables or {}).items()}
+        columns = [variables[name] for name in self.names if np.ndim(variables.get(name)) == 1]
+        lengths = {len(column) for column in columns}
+
+        if not self.chunkable or self.parser is None or len(lengths) != 1 \
+                or any(np.ndim(variables.get(name)) > 1 for name in self.names):
+            result = self.func(variables)
+            if out is None:
+                return result
+            out[...] = result
+            return out
+
+        length = lengths.pop()
+        dtype = np.result_type(float, *columns) if out is None else out.dtype
+        if out is None:
+            out = np.empty(length, dtype=dtype)
+        func = self.parser.buildChunkStack(list(self.stack), min(chunk_size, length) or 1, dtype)
+        for start in range(0, length, chunk_size):
+            stop = min(start + chunk_size, length)
+            chunk = {key: (value[start:stop] if np.ndim(value) == 1 and len(value) == length else value)
+                     for key, value in variables.items()}
+            func(chunk, out[start:stop], stop - start)
+        return out
+
+    def __repr__(self):
+        return f'Expression({self.text!r})'
+
+
 class NumericStringParser(object):
     """
     Most of this code comes from the eqn_parser.py pyparsing example
@@ -41,6 +114,8 @@ class NumericStringParser(object):
 
     def __init__(self):
         self.variables = {}
+        self.exprStack = []
+        self.compiled = None
 
         """
         expop   :: '^'
@@ -68,7 +143,9 @@ class NumericStringParser(object):
         addop = plus | minus
         multop = mult | div
         expop = Literal("^")
-        pi = CaselessLiteral("PI")
+        # the constants are keywords, so identifiers that merely start with them (err, pix, e2) are not split up
+        pi = CaselessKeyword("PI")
+        e_constant = CaselessKeyword("E")
         expr = Forward()
         expr_list = delimitedList(Group(expr))
         # add parse action that replaces the function identifier with a (name, number of args) tuple
@@ -78,7 +155,7 @@ class NumericStringParser(object):
         atom = (
                 addop[...]
                 + (
-                        (fn_call | pi | e | fnumber | ident).setParseAction(self.pushFirst)
+                        (fn_call | pi | e_constant | fnumber | ident).setParseAction(self.pushFirst)
                         | Group(lpar + expr + rpar)
                 )
         ).setParseAction(self.pushUMinus)
@@ -96,65 +173,158 @@ class NumericStringParser(object):
         # general_term = term + ZeroOrMore( addop_term ) | OneOrMore( addop_term)
         # expr <<  general_term
         self.bnf = expr
-        # map operator symbols to corresponding arithmetic operations
+        # map operator symbols to corresponding arithmetic operations. Every operator and function is a NumPy ufunc or
+        # reduction, so a variable bound to a whole column is evaluated element-wise in a handful of ufunc calls.
+        # float_power keeps integer literals with negative exponents (2^-1) working
         epsilon = 1e-12
-        self.opn = {"+": operator.add,
-                    "-": operator.sub,
-                    "*": operator.mul,
-                    "/": operator.truediv,
-                    "^": operator.pow}
+        self.opn = {"+": np.add,
+                    "-": np.subtract,
+                    "*": np.multiply,
+                    "/": np.true_divide,
+                    "^": np.float_power}
         self.fn = {"sin": sin,
                    "cos": cos,
                    "tan": tan,
+                   "sinh": sinh,
+                   "cosh": cosh,
+                   "tanh": tanh,
                    "exp": exp,
+                   "log": log,
+                   "log10": log10,
+                   "sqrt": sqrt,
                    "fft": fft,
-                   "abs": abs,
-                   "trunc": lambda a: int(a),
-                   "round": round,
-                   "sgn": lambda a: abs(a) > epsilon and cmp(a, 0) or 0}
+                   "abs": np.abs,
+                   "trunc": np.trunc,
+                   "round": np.round,  # round(a) or round(a, decimals)
+                   "sgn": lambda a: np.sign(a) * (np.abs(a) > epsilon),
+                   # reductions of a whole column to a single value. max and min of two or more arguments are
+                   # element-wise. They are folded pairwise, as a third argument of a ufunc would be its output
+                   "mean": np.mean,
+                   "std": np.std,
+                   "rms": lambda a: np.sqrt(np.mean(np.square(a))),
+                   "max": lambda a, *b: functools.reduce(np.maximum, (a, *b)) if b else np.max(a),
+                   "min": lambda a, *b: functools.reduce(np.minimum, (a, *b)) if b else np.min(a)}
 
-    def evaluateStack(self, s):
+    def buildStack(self, s):
+        """
+        Compiles the postfix stack into a tree of closures. Each closure takes the variable bindings and returns its
+        value, so the walk over the stack happens once instead of on every evaluation.
+        """
         op, num_args = s.pop(), 0
         if isinstance(op, tuple):
             op, num_args = op
         if op == "unary -":
-            return -self.evaluateStack(s)
+            operand = self.buildStack(s)
+            return lambda v: -operand(v)
         if op in "+-*/^":
             # note: operands are pushed onto the stack in reverse order
-            op2 = self.evaluateStack(s)
-            op1 = self.evaluateStack(s)
-            return self.opn[op](op1, op2)
+            op2 = self.buildStack(s)
+            op1 = self.buildStack(s)
+            fn = self.opn[op]
+            return lambda v: fn(op1(v), op2(v))
         elif op == "PI":
-            return math.pi  # 3.1415926535
+            return lambda v: math.pi
         elif op == "E":
-            return math.e  # 2.718281828
+            return lambda v: math.e
         elif op in self.fn:
             # note: args are pushed onto the stack in reverse order
-            args = reversed([self.evaluateStack(s) for _ in range(num_args)])
-            return self.fn[op](*args)
+            args = list(reversed([self.buildStack(s) for _ in range(num_args)]))
+            fn = self.fn[op]
+            if num_args == 1:
+                arg = args[0]
+                return lambda v: fn(arg(v))
+            return lambda v: fn(*[arg(v) for arg in args])
         elif op[0].isalpha():
-            if op in self.variables:
-                return self.variables[op]
-            raise Exception("invalid identifier '%s'" % op)
+            def variable(v):
+                try:
+                    value = v[op]
+                except KeyError:
+                    raise Exception("invalid identifier '%s'" % op) from None
+                # columns handed over as lists are evaluated element-wise, like arrays
+                return np.asarray(value) if isinstance(value, (list, tuple)) else value
+            return variable
         else:
             # try to evaluate as int first, then as float if int fails
             try:
-                return int(op)
+                value = int(op)
             except ValueError:
-                return float(op)
+                value = float(op)
+            return lambda v: value
+
+    def buildChunkStack(self, s, size, dtype):
+        """
+        Counterpart to buildStack for Expression.evaluateChunked. Each closure takes the variable bindings of one chunk,
+        the array to write its result into (None for its own scratch buffer) and the length of the chunk. Operations are
+        given a scratch buffer of 'size' elements that is reused for every chunk, and write into it (or into the output
+        of the expression) with the ufunc's out argument.
+        """
+        op, num_args = s.pop(), 0
+        if isinstance(op, tuple):
+            op, num_args = op
+        if op == "unary -":
+            operand = self.buildChunkStack(s, size, dtype)
+            return self._chunkNode(np.negative, [operand], size, dtype)
+        if op in "+-*/^":
+            # note: operands are pushed onto the stack in reverse order
+            op2 = self.buildChunkStack(s, size, dtype)
+            op1 = self.buildChunkStack(s, size, dtype)
+            return self._chunkNode(self.opn[op], [op1, op2], size, dtype)
+        elif op in self.fn:
+            args = list(reversed([self.buildChunkStack(s, size, dtype) for _ in range(num_args)]))
+            return self._chunkNode(self.fn[op], args, size, dtype)
+        else:
+            leaf = self.buildStack([op])
+
+            def value(v, out, length):
+                result = leaf(v)
+                if out is None:
+                    return result
+                out[...] = result
+                return out
+            return value
+
+    @staticmethod
+    def _chunkNode(fn, args, size, dtype):
+        scratch = np.empty(size, dtype=dtype)
+
+        def node(v, out, length):
+            if out is None:
+                out = scratch[:length]
+            operands = [arg(v, None, length) for arg in args]
+            if isinstance(fn, np.ufunc) and fn.nout == 1:
+                try:
+                    return fn(*operands, out=out)
+                except TypeError:
+                    pass  # output dtype the ufunc cannot cast to, such as a complex result into a real buffer
+            out[...] = fn(*operands)
+            return out
+        return node
+
+    def compile(self, input_string, parseAll=True):
+        """
+        Parses the expression once and returns a reusable Expression. Raises ParseException on invalid input.
+        """
+        self.exprStack = []
+        self.bnf.parseString(input_string, parseAll)
+        stack = list(self.exprStack)
+        return Expression(input_string, stack, self.buildStack(list(stack)), self)
 
     def expr(self, input_string, parseAll=True):
         self.exprStack = []
+        self.compiled = None
         try:
             results = self.bnf.parseString(input_string, parseAll)
         except ParseException as err:
             results = ["Parse Failure", input_string, (str(err), err.line, err.column)]
+        else:
+            self.compiled = Expression(input_string, self.exprStack, self.buildStack(list(self.exprStack)))
 
     def eval(self, variables):
+        # exprStack is no longer consumed, so the last parsed expression can be evaluated any number of times
         self.variables = variables
-        print(self.exprStack)
-        val = self.evaluateStack(self.exprStack)
-        return val
+        if self.compiled is None:
+            raise Exception("no expression to evaluate. Parse one with expr() first")
+        return self.compiled(variables)
 
     # def eval(self, input_string, variables, parseAll=True):
     #     self.exprStack = []
@@ -176,8 +346,47 @@ class NumericStringParser(object):
 # ----------------------------------------------------------------------------------------------------------------------
 
 nsp = NumericStringParser()
+_nsp_lock = threading.Lock()  # the grammar's parse actions build nsp.exprStack, so one parse at a time
+
+
+@functools.lru_cache(maxsize=256)
+def compileExpression(input_string):
+    """
+    Compiled Expression for input_string, from a bounded LRU cache keyed by the expression text. Plot transforms and
+    derived columns reuse a handful of expressions, so after the first call these skip the grammar entirely. Hits and
+    misses are reported by compileExpression.cache_info() and the cache is emptied by compileExpression.cache_clear().
+    Invalid expressions raise ParseException and are not cached.
+    """
+    with _nsp_lock:
+        return nsp.compile(input_string)
+
+def _check():
+    x, y, z = np.array([1., 5., 3.]), np.array([4., 2., 6.]), np.array([2., 3., 9.])
+    columns = {'x': x, 'y': y, 'z': z}
+    originals = {name: column.copy() for name, column in columns.items()}
+    for text, expected in (('max(x, y, z)', [4., 5., 9.]), ('min(x, y, z)', [1., 2., 3.]),
+                           ('min(x, y, 3)', [1., 2., 3.]), ('max(x, 2, y, 0)', [4., 5., 6.]),
+                           ('max(x)', 5.), ('min(x, y)', [1., 2., 3.])):
+        expression = compileExpression(text)
+        assert np.array_equal(expression(columns), expected), text
+        assert np.array_equal(expression.evaluateChunked(columns, chunk_size=2), expected), text
+        for name, column in columns.items():
+            assert np.array_equal(column, originals[name]), f'{text} overwrote {name}'
+    # column names that start with the constants E and PI
+    columns = {'err': x, 'pix': y, 'e2': z}
+    for text, expected in (('err*2', 2 * x), ('pix+1', y + 1), ('e2-E', z - math.e), ('pi*err', math.pi * x),
+                           ('2e1+pix', y + 20.), ('exp(E) - err', math.exp(math.e) - x)):
+        assert np.allclose(compileExpression(text)(columns), expected), text
+    print('eqn_parser checks passed')
+
 
 if __name__ == "__main__":
+    import sys
+
+    if '--check' in sys.argv:
+        _check()
+        sys.exit()
+
     # input_string
     input_string = ""
     variables = {"x": 1, "y": 2, "z": np.asarray([1, 2, 3])}
@@ -4,6 +4,94 @@ import wx
 import wx.grid
 
 
+class GridTable(wx.grid.GridTableBase):
+    """
+    Virtual data behind MyGrid. wx asks for the value of a cell only when it is drawn, so no wx cell is created for
+    the data and a long run no longer slows the grid down.
+
+    Rows written cell by cell (write_list_to_row, editing, pasting) are kept as lists, one per written row. A results
+    table (datastore.ColumnStore) can also be shown from a given row on with bind_store: its values are read straight
+    from the store's columns when drawn and take no memory in the grid at all.
+    """
+
+    def __init__(self, rows=0, cols=0):
+        wx.grid.GridTableBase.__init__(self)
+        self.rows = rows
+        self.cols = cols
+        self.cells = {}  # {row: [value, ...]}
+        self.store = None
+        self.first_row = 0
+
+    def GetNumberRows(self):
+        return self.rows
+
+    def GetNumberCols(self):
+        return self.cols
+
+    def IsEmptyCell(self, row, col):
+        return self.GetValue(row, col) == ''
+
+    def GetValue(self, row, col):
+        values = self.cells.get(row)
+        if values is not None and col < len(values) and values[col] is not None:
+            return str(values[col])
+        store = self.store
+        if store is not None and 0 <= row - self.first_row < store.rows and col < len(store.columns):
+            column = list(store.columns.values())[col]
+            if column is not None:
+                return str(column[row - self.first_row])
+        return ''
+
+    def SetValue(self, row, col, value):
+        values = self.cells.setdefault(row, [])
+        if col >= len(values):
+            values.extend([None] * (col + 1 - len(values)))
+        values[col] = value
+
+    def Clear(self):
+        self.cells = {}
+        self.store = None
+
+    def AppendRows(self, numRows=1):
+        return self.resize(self.rows + numRows, self.cols)
+
+    def AppendCols(self, numCols=1):
+        return self.resize(self.rows, self.cols + numCols)
+
+    def DeleteRows(self, pos=0, numRows=1):
+        numRows = min(numRows, self.rows - pos)
+        self.cells = {(row if row < pos else row - numRows): values for row, values in self.cells.items()
+                      if not pos <= row < pos + numRows}
+        self.rows -= numRows
+        self.notify(wx.grid.GRIDTABLE_NOTIFY_ROWS_DELETED, pos, numRows)
+        return True
+
+    def write_row(self, row, data):
+        self.cells[row] = list(data)
+
+    def bind_store(self, store, first_row):
+        self.store = store
+        self.first_row = first_row
+        self.cells = {row: values for row, values in self.cells.items() if row < first_row}
+
+    def resize(self, rows, cols):
+        """
+        Grows the grid to at least rows x cols. The grid is told in one message per dimension
+        """
+        if rows > self.rows:
+            added, self.rows = rows - self.rows, rows
+            self.notify(wx.grid.GRIDTABLE_NOTIFY_ROWS_APPENDED, added)
+        if cols > self.cols:
+            added, self.cols = cols - self.cols, cols
+            self.notify(wx.grid.GRIDTABLE_NOTIFY_COLS_APPENDED, added)
+        return True
+
+    def notify(self, message, *args):
+        view = self.GetView()
+        if view is not None:
+            view.ProcessTableMessage(wx.grid.GridTableMessage(self, message, *args))
+
+
 class MyGrid(wx.grid.Grid):
     def __init__(self, parent):
         """Constructor"""
@@ -333,19 +421,60 @@ class MyGrid(wx.grid.Grid):
         plot_frame.Show()
         self.frame_number += 1
 
+    def CreateGrid(self, numRows, numCols, selmode=wx.grid.Grid.GridSelectCells):
+        # the grid is always backed by a virtual GridTable
+        self.table = GridTable(numRows, numCols)
+        return self.SetTable(self.table, True, selmode)
+
     def write_list_to_row(self, row=0, data=None):
         if data is not None:
             if row >= 0:
-                if row >= self.GetNumberRows() - 1:
-                    self.AppendRows(5)
-                for col, item in enumerate(data):
-                    self.SetCellValue(row, col, str(item))
+                data = list(data)
+                self.table.write_row(row, data)
+                self.table.resize(row + 5 if row >= self.GetNumberRows() - 1 else 0, len(data))
+                self.RefreshRow(row)
             else:
                 print('row must be in range greater than 0')
         else:
             print('No data to write to grid!')
             pass
 
+    def write_rows(self, rows):
+        """
+        Writes a batch of [(row, data), ...] with a single resize and a single refresh of the rows written
+        """
+        rows = [(row, list(data)) for row, data in rows if row >= 0 and data is not None]
+        if not rows:
+            return
+        for row, data in rows:
+            self.table.write_row(row, data)
+        last_row, cols = max(row for row, _ in rows), max(len(data) for _, data in rows)
+        self.table.resize(last_row + 5 if last_row >= self.GetNumberRows() - 1 else 0, cols)
+        self.RefreshRow(min(row for row, _ in rows), last_row)
+
+    def bind_store(self, store, first_row=0):
+        """
+        Shows a results table (datastore.ColumnStore) from first_row on. Call refresh_store after rows are appended to
+        the store.
+        """
+        self.table.bind_store(store, first_row)
+        self.refresh_store()
+
+    def refresh_store(self):
+        store = self.table.store
+        last_row = self.table.first_row + store.rows
+        self.table.resize(last_row + 5 if last_row >= self.GetNumberRows() - 1 else 0, len(store))
+        if store.rows:
+            self.RefreshRow(last_row - 1)
+
+    def RefreshRow(self, row, last_row=None):
+        # redraws only the cells of one row (or of the rows up to last_row), and only if they are visible
+        last_row = row if last_row is None else last_row
+        rect = self.BlockToDeviceRect(wx.grid.GridCellCoords(row, 0),
+                                      wx.grid.GridCellCoords(last_row, max(0, self.GetNumberCols() - 1)))
+        if not rect.IsEmpty():
+            self.GetGridWindow().RefreshRect(rect)
+
 
 class MyGridFrame(wx.Frame):
     def __init__(self, *args, **kwds):
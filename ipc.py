@@ -0,0 +1,282 @@
+import numpy as np
+import threading
+import math
+import time
+import socket
+import struct
+import json
+import os
+import re
+
+"""
+Data channel between MainLauncher and the test scripts it runs.
+
+Scripts used to report their results by printing '[TABLE] [...]' lines, which the launcher picked out of the log and
+parsed with json.loads. That shares one pipe with log text and progress bars, and costs a print and a parse per value.
+Results now travel over a local TCP socket of their own as length-prefixed binary records, and stdout is left to logs:
+
+    header      struct '<BI'    kind, length of the payload in bytes
+    payload                     depends on the kind:
+
+    ROW         float64 buffer  one row of numbers (integers arrive as floats)
+    ROW_JSON    JSON list       one row holding anything else (strings, None, ...)
+    BLOCK       '<II' + buffer  rows, columns, then a C-ordered float64 array of rows x columns
+    PROGRESS    '<qqd'          current, total, estimated seconds left (NaN until known)
+    METADATA    JSON object     e.g. {"header": ["freq", "cur", ...]}
+
+MainLauncher opens the socket and passes its address to the script in the LEVIATHAN_IPC environment variable. A script
+publishes through the module level channel, which connects on first use:
+
+    import ipc
+    ipc.channel.metadata(header=['index', 't', 'y'])
+    for i in range(n):
+        ipc.channel.row([i, t[i], y[i]])
+        ipc.channel.progress(i + 1, n)
+
+A script run on its own (no LEVIATHAN_IPC, or nothing listening) falls back to printing '[TABLE] [...]' lines, which
+the launcher still understands.
+
+progress() can be called on every iteration of a tight loop. It is rate limited on the script side: a record is sent
+at most every PROGRESS_INTERVAL seconds (a line is printed at most every PRINT_INTERVAL seconds without the channel),
+and the last step is always sent. Anything in between costs a clock read and a comparison. The launcher only keeps the
+latest progress it received and shows it in a gauge on its next update tick.
+"""
+
+ENV_VAR = 'LEVIATHAN_IPC'
+HEADER = struct.Struct('<BI')
+SHAPE = struct.Struct('<II')
+PROGRESS_RECORD = struct.Struct('<qqd')
+PROGRESS_INTERVAL = 0.1  # seconds
+PRINT_INTERVAL = 1.0  # seconds
+PROGRESS_LINE = re.compile(r'Progress: (\d+)/(\d+)(?:.*ETA (\d+(?::\d\d)+))?')
+ROW, ROW_JSON, BLOCK, PROGRESS, METADATA = range(1, 6)
+
+
+class Publisher:
+    def __init__(self, address=None):
+        """
+        :param address: 'host:port' of the launcher. Defaults to the LEVIATHAN_IPC environment variable
+        """
+        self.address = address
+        self.sock = None
+        self.connected = None  # None until the first record decides between the socket and the stdout fallback
+        self.lock = threading.Lock()
+        self.progress_start = None
+        self.progress_current = 0
+        self.progress_sent = -math.inf
+
+    def connect(self):
+        address = self.address or os.environ.get(ENV_VAR)
+        self.connected = False
+        if address:
+            host, port = address.rsplit(':', 1)
+            try:
+                self.sock = socket.create_connection((host, int(port)), timeout=5)
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.connected = True
+            except OSError as e:
+                print(f'[IPC] could not connect to {address} ({e}). Results are printed instead')
+        return self.connected
+
+    def send(self, kind, payload):
+        with self.lock:
+            if self.connected is None:
+                self.connect()
+            if self.connected:
+                self.sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+            return self.connected
+
+    # records ----------------------------------------------------------------------------------------------------------
+    def row(self, data):
+        data = list(data)
+        if all(isinstance(value, (int, float, np.number)) and not isinstance(value, bool) for value in data):
+            sent = self.send(ROW, np.asarray(data, dtype='<f8').tobytes())
+        else:
+            sent = self.send(ROW_JSON, json.dumps(data, default=to_json).encode())
+        if not sent:
+            print(f'[TABLE] {json.dumps(data, default=to_json)}')
+
+    def rows(self, array):
+        """
+        Publishes a 2D array of numbers as one record. Much cheaper than one row() per row for high rate data.
+        """
+        array = np.ascontiguousarray(array, dtype='<f8')
+        if array.ndim == 1:
+            array = array[np.newaxis, :]
+        if not self.send(BLOCK, SHAPE.pack(*array.shape) + array.tobytes()):
+            for data in array.tolist():
+                print(f'[TABLE] {json.dumps(data)}')
+
+    def progress(self, current, total):
+        """
+        Reports that current of total steps are done. The ETA is extrapolated from the time since the first step, and
+        a current lower than the last one starts a new progress.
+        """
+        now = time.perf_counter()
+        if self.progress_start is None or current < self.progress_current:
+            self.progress_start, self.progress_sent = now, -math.inf
+        self.progress_current = current
+
+        interval = PRINT_INTERVAL if self.connected is False else PROGRESS_INTERVAL
+        if current < total and now - self.progress_sent < interval:
+            return
+        self.progress_sent = now
+
+        eta = (now - self.progress_start) / current * (total - current) if current > 0 else math.nan
+        if not self.send(PROGRESS, PROGRESS_RECORD.pack(int(current), int(total), eta)):
+            percent = 100. * current / total if total else 100.
+            print(f'Progress: {current}/{total} ({percent:.1f}%) ETA {format_eta(eta)}')
+
+    def metadata(self, **fields):
+        if not self.send(METADATA, json.dumps(fields, default=to_json).encode()):
+            if 'header' in fields:
+                print(f"[TABLE] {json.dumps(list(fields['header']), default=to_json)}")
+            for key, value in fields.items():
+                if key != 'header':
+                    print(f'[META] {key}: {value}')
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            self.connected = None
+
+
+class Listener:
+    """
+    Launcher side of the channel. Listens on a free port of the loopback interface for the one script being run.
+    """
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.address = '{}:{}'.format(*self.server.getsockname())
+
+    def accept(self, timeout=None):
+        """
+        :return: the connection of the script, or None if it did not connect within timeout seconds
+        """
+        self.server.settimeout(timeout)
+        try:
+            conn, _ = self.server.accept()
+        except (socket.timeout, BlockingIOError):
+            return None
+        conn.settimeout(None)
+        return conn
+
+    def close(self):
+        self.server.close()
+
+
+# FUNCTION DEFINITIONS -------------------------------------------------------------------------------------------------
+def to_json(value):
+    # numpy scalars and arrays are not serializable by json. Anything else is sent as its string
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def read_exactly(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def records(conn):
+    """
+    Yields (kind, value) for every record received on conn until the script closes it:
+
+        ROW, BLOCK  -->  list of rows, each a list of values
+        PROGRESS    -->  (current, total, eta)
+        METADATA    -->  dict
+    """
+    while True:
+        header = read_exactly(conn, HEADER.size)
+        if header is None:
+            return
+        kind, length = HEADER.unpack(header)
+        payload = read_exactly(conn, length)
+        if payload is None:
+            return
+
+        if kind == ROW:
+            yield ROW, [np.frombuffer(payload, dtype='<f8').tolist()]
+        elif kind == ROW_JSON:
+            yield ROW, [json.loads(payload)]
+        elif kind == BLOCK:
+            shape = SHAPE.unpack_from(payload)
+            yield BLOCK, np.frombuffer(payload, dtype='<f8', offset=SHAPE.size).reshape(shape).tolist()
+        elif kind == PROGRESS:
+            yield PROGRESS, PROGRESS_RECORD.unpack(payload)
+        elif kind == METADATA:
+            yield METADATA, json.loads(payload)
+
+
+def format_eta(seconds):
+    """
+    [EXAMPLE] format_eta(75) --> '1:15', format_eta(3725) --> '1:02:05', format_eta(nan) --> '--:--'
+    """
+    if not math.isfinite(seconds):
+        return '--:--'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes}:{seconds:02d}'
+
+
+def parse_progress(line):
+    """
+    Reads a progress line printed by a script running without the data channel.
+
+    :return: (current, total, eta) or None if line is not a progress line
+    """
+    match = PROGRESS_LINE.match(line)
+    if match is None:
+        return None
+    eta = math.nan
+    if match.group(3):
+        eta = 0
+        for part in match.group(3).split(':'):
+            eta = eta * 60 + int(part)
+    return int(match.group(1)), int(match.group(2)), eta
+
+
+channel = Publisher()
+
+
+if __name__ == "__main__":
+    import time
+
+    listener = Listener()
+    sender = Publisher(listener.address)
+    count = 100000
+
+    def receive(conn):
+        received = [(kind, value) for kind, value in records(conn)]
+        rows = sum(len(value) for kind, value in received if kind in (ROW, BLOCK))
+        print(f'received {rows} rows and {sum(kind == PROGRESS for kind, _ in received)} progress records')
+
+    thread = threading.Thread(target=lambda: receive(listener.accept(5)))
+    thread.start()
+    start = time.perf_counter()
+    for i in range(count):
+        sender.row([i, i * 0.0005, 0.25, 1.0, -1.0, 0.5])
+    elapsed = time.perf_counter() - start
+    print(f'row():  {elapsed / count * 1e6:.2f} us/row')
+    start = time.perf_counter()
+    sender.rows(np.random.random((count, 6)))
+    elapsed = time.perf_counter() - start
+    print(f'rows(): {elapsed / count * 1e6:.3f} us/row')
+    start = time.perf_counter()
+    for i in range(count):
+        sender.progress(i + 1, count)
+    elapsed = time.perf_counter() - start
+    print(f'progress(): {elapsed / count * 1e6:.3f} us/call')
+    sender.close()
+    thread.join()
+    listener.close()
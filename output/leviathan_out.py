@@ -1,19 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import numpy as np
 import threading
+import atexit
 import visa
 import time
 import sys
 import csv
 import os
 import wx
-import wx.grid
 import wx.propgrid as wxpg
 
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
 from matplotlib.backends.backend_wxagg import NavigationToolbar2WxAgg as NavigationToolbar
 
+# leviathan's own modules are imported from the leviathan directory, one level above the generated scripts
+leviathan_dir = str(Path(__file__).resolve().parent.parent)
+if leviathan_dir not in sys.path:
+    sys.path.append(leviathan_dir)
+from tracing import tracer
+from pyunivisa import Settling
+from sweep_planner import serpentine_product
+from checkpoint import Journal, sweep_signature
+import checkpoint
+from datastore import ColumnStore
+from grid_wrapper import MyGrid
+from redraw import RedrawScheduler
+from decimate import LineDecimator
+from datalabels import DataLabels
+
 
 # FILE PATH TO SAVE CSV ------------------------------------------------------------------------------------------------
 csv_path = 'output\\csv\\'
@@ -23,33 +39,106 @@ fig_path = 'output\\figures\\'
 Path('results').mkdir(parents=True, exist_ok=True)
 filename = 'test'
 path_to_file = f'results\\{filename}_{time.strftime("%Y%m%d_%H%M")}'
+journal_path = checkpoint.journal_path(filename)  # checkpoint of the sweep, see checkpoint.Journal
 
 
 # FUNCTION DEFINITIONS -------------------------------------------------------------------------------------------------
-def average_reading(instrument, cmd, samples=10):
-    data = []
-    time.sleep(5)
-    for idx in range(samples):
-        data.append(float(instrument.query(cmd).split(',')[0]))
-        time.sleep(0.20)
-    array = np.asarray(data)
+settling = Settling()  # see pyunivisa.Settling. Options per instrument come from its 'settling' configuration
+
+
+def buffered_reading(instrument, cmd='READ?', samples=10):
+    """
+    Meters with their own reading memory (34461A, 8846A) take every sample on a single immediate trigger and return
+    the whole buffer from one cmd query (READ?, MEAS:VOLT:AC?, ...) as a comma separated list, instead of one query
+    round trip per sample.
+    Meters that support binary transfers (instrument.binary) return the buffer as a REAL64 block, so there is no ASCII
+    to parse at all. The meter is always put back to ASCII single readings afterwards, even when the query fails.
+    """
+    with instrument.io_lock:
+        # COUN after ';' stays in the TRIG subsystem, and ';:' returns to the root for SAMP
+        instrument.write(f'TRIG:SOUR IMM;COUN 1;:SAMP:COUN {samples}')
+        try:
+            if instrument.binary:
+                instrument.write('FORM:DATA REAL,64;BORD NORM')  # BORD stays in the FORM subsystem after ';'
+                return instrument.query_binary(cmd, datatype='d', is_big_endian=True)
+            return np.fromstring(instrument.query(cmd), dtype=float, sep=',')
+        finally:
+            # also after a timeout or a bad block, or every later ASCII reading of the meter would come back binary
+            instrument.write('FORM:DATA ASC;:SAMP:COUN 1')
+
+
+def average_reading(instrument, cmd, samples=10, buffered=None, settle=None):
+    """
+    :param buffered: fetch all samples in one transfer with buffered_reading. Defaults to instrument.buffered, which is
+                     set for meters that support it
+    :param settle: settling options of this reading, such as {'rtol': 0.01}. They take precedence over the 'settling'
+                   entry of the instrument configuration (instrument.settling), see Settling
+    :return: (mean, std)
+    """
+    if buffered is None:
+        buffered = instrument.buffered
+    with tracer.span('reading', cmd, instrument=instrument.name):
+        settling.wait(instrument, cmd, **{**instrument.settling, **(settle or {})})
+        if buffered:
+            array = buffered_reading(instrument, cmd, samples)
+        else:
+            data = []
+            for idx in range(samples):
+                data.append(float(instrument.query(cmd).split(',')[0]))
+            array = np.asarray(data)
     mean = array.mean()
     std = np.sqrt(np.mean(abs(array - mean) ** 2))
     return mean, std
 
 
+reading_executor = ThreadPoolExecutor(thread_name_prefix='reading')
+
+
+def compile_expression(text):
+    """
+    Compiles an eqn_parser expression for a derived column. eqn_parser is only imported once a derived column is
+    declared.
+    """
+    import eqn_parser
+    return eqn_parser.compileExpression(text)
+
+
+def as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def concurrent_readings(*requests, samples=10):
+    """
+    Reads independent instruments at the same time instead of one after another. Each request is an
+    (instrument, cmd) pair and runs average_reading on a shared thread pool, so the settling time of every instrument
+    overlaps. Only generated when 'Read concurrently' is checked in the script wizard.
+
+    The readings run on threads rather than through asyncunivisa.AsyncClient on purpose: VisaClient sessions are
+    blocking pyvisa sessions over GPIB and VXI-11 as well as raw sockets, and the I/O lock of each session keeps the
+    threads from reading each other's responses.
+
+    :return: list of (mean, std) tuples in the same order as the requests
+    """
+    futures = [reading_executor.submit(average_reading, instrument, cmd, samples) for instrument, cmd in requests]
+    return [future.result() for future in futures]
+
+
 class Test:
     def __init__(self, parent):
         self.parent = parent
         # CONFIGURED INSTRUMENTS ---------------------------------------------------------------------------------------
         f5560A_id = {'ip_address': '129.196.136.130', 'port': '3490', 'gpib_address': '', 'mode': 'NIGHTHAWK'}
         f5790A_id = {'ip_address': '', 'port': '', 'gpib_address': '6', 'mode': 'GPIB'}
-        k34461A_id = {'ip_address': '10.205.92.155', 'port': '3490', 'gpib_address': '', 'mode': 'INSTR'}
+        k34461A_id = {'ip_address': '10.205.92.155', 'port': '3490', 'gpib_address': '', 'mode': 'INSTR',
+                      'settling': {'rtol': 0.01, 'timeout': 2}}
 
         # ESTABLISH COMMUNICATION WITH INSTRUMENTS ---------------------------------------------------------------------
-        self.f5560A = VisaClient(f5560A_id)
-        self.f5790A = VisaClient(f5790A_id)
-        self.k34461A = VisaClient(k34461A_id)
+        self.f5560A = VisaClient(f5560A_id, 'f5560A')
+        self.f5790A = VisaClient(f5790A_id, 'f5790A')
+        self.k34461A = VisaClient(k34461A_id, 'k34461A')
 
     # SETUP ------------------------------------------------------------------------------------------------------------
     def setup(self):
@@ -64,43 +153,53 @@ class Test:
         _cur = [119e-3]
         _range_label = ["120uA", "1.2mA", "12mA", "120mA"]
         # _cur = [11.9e-3]
-        self.parent.write_header(["range", "freq", "cur", "nom", "nom_dist",
-                                  "loaded", "loaded_dist", "resistor", "cur_shift", "ppm_shift"])
-
-        for freq in _freq:
-            for idx, cur in enumerate(_cur):
-                self.f5560A.write(f'out {cur}A;out {freq}Hz ')
-
-                print('===================================================')
-                print(f'\nOperating in {_range_label[idx]} range at {cur}A')
-                resistor = input('\nSpecify the sense resistor in ohms:')
-                input('\nReady to operate?')
-                self.f5560A.write(f'OPER')
-
-                self.f5790A.write(f'TRIG')
-                nom, *_ = average_reading(self.f5790A, f'*WAI;VAL?')
-                nom = nom / float(resistor)
-                self.k34461A.write('SYST:REM')
-                nom_dist, *_ = average_reading(self.k34461A, f'READ?')
-                nom_dist = round(nom_dist / 100e-3, 4)
-                self.f5560A.write(f'STBY')
-
-                input('\nConnect 400uH. Ready to operate?')
-                self.f5560A.write(f'OPER')
-                loaded, *_ = average_reading(self.f5790A, f'*WAI;VAL?')
-                loaded = loaded / float(resistor)
-                self.k34461A.write('SYST:REM')
-                loaded_dist, *_ = average_reading(self.k34461A, f'READ?')
-                loaded_dist = round(loaded_dist / 100e-3, 4)
-                self.f5560A.write(f'STBY')
-
-                cur_shift = loaded - nom
-                ppm_shift = round((cur_shift / nom) * 1e6, 2)
-
-                self.parent.write_to_log([_range_label[idx], freq, cur, nom, nom_dist,
-                                          loaded, loaded_dist, resistor, cur_shift, ppm_shift])
+        # computed by the frame from each logged row and shown after the measured columns
+        self.parent.add_derived_column('cur_shift', 'loaded - nom')
+        self.parent.add_derived_column('ppm_shift', 'round(cur_shift / nom * 1e6, 2)')
+        _header = ["range", "freq", "cur", "nom", "nom_dist", "loaded", "loaded_dist", "resistor", "settle_time"]
+        self.parent.write_header(_header)
+        _sweep = sweep_signature(1, _freq, _cur)
+        journal = Journal(journal_path, _header, resume=self.parent.resume, sweep=_sweep)
+
+        _setpoints = [(freq, idx, cur) for freq in _freq for idx, cur in enumerate(_cur)]
+        for _index, (freq, idx, cur) in enumerate(_setpoints):
+            if _index in journal:
+                # completed before the run was interrupted. Replayed from the journal instead of measured again
+                self.parent.write_to_log(journal.rows[_index])
                 self.parent.plot_data()
+                continue
 
+            self.f5560A.write(f'out {cur}A;out {freq}Hz ')
+
+            print('===================================================')
+            print(f'\nOperating in {_range_label[idx]} range at {cur}A')
+            resistor = input('\nSpecify the sense resistor in ohms:')
+            input('\nReady to operate?')
+            self.f5560A.write(f'OPER')
+
+            self.f5790A.write(f'TRIG')
+            nom, *_ = average_reading(self.f5790A, f'*WAI;VAL?')
+            nom = nom / float(resistor)
+            self.k34461A.write('SYST:REM')
+            nom_dist, *_ = average_reading(self.k34461A, f'READ?')
+            nom_dist = round(nom_dist / 100e-3, 4)
+            self.f5560A.write(f'STBY')
+
+            input('\nConnect 400uH. Ready to operate?')
+            self.f5560A.write(f'OPER')
+            loaded, *_ = average_reading(self.f5790A, f'*WAI;VAL?')
+            loaded = loaded / float(resistor)
+            self.k34461A.write('SYST:REM')
+            loaded_dist, *_ = average_reading(self.k34461A, f'READ?')
+            loaded_dist = round(loaded_dist / 100e-3, 4)
+            self.f5560A.write(f'STBY')
+
+            _row = [_range_label[idx], freq, cur, nom, nom_dist, loaded, loaded_dist, resistor, settling.reset()]
+            self.parent.write_to_log(_row)
+            journal.append(_index, _row)
+            self.parent.plot_data()
+
+        journal.close(complete=True)
         self.close_instruments()
 
     def close_instruments(self):
@@ -122,11 +221,22 @@ class TestFrame(wx.Frame):
         self.row = 0
         self.prevLine = ''
         self.line = ''
-        self.table = {}
+        self.table = ColumnStore()
+        self.derived = {}  # {column: compiled eqn_parser expression over the other columns}
+        self.header_row = None
+        self.first_row = 0  # grid row of the first row of the table
+        self.grid_layout = None  # (header row, first row, columns) last shown by the grid
         self.overlay = {}
         self.ax = None
         self.x, self.y = [0.], [[0.]]
+        self.plot = []
+        self.decimator = None
+        self.plot_key = None  # what the live lines show. The plot is only rebuilt when it changes
+        self.background = None  # the axes without the live lines, restored before the lines are blitted on top
+        self.capturing = False
+        self.labels = None  # DataLabels artist, while a column is chosen for the data labels
         self.flag_complete = False
+        self.resume = '--resume' in sys.argv or bool(os.environ.get('LEVIATHAN_RESUME'))
 
         self.panel_main = wx.Panel(self.panel_frame, wx.ID_ANY)
         self.notebook = wx.Notebook(self.panel_main, wx.ID_ANY)
@@ -143,6 +253,8 @@ class TestFrame(wx.Frame):
         self.canvas = FigureCanvas(self.notebook_1_pane_2, -1, self.figure)
         self.toolbar = NavigationToolbar(self.canvas)
         self.toolbar.Realize()
+        self.canvas.mpl_connect('draw_event', self.on_canvas_draw)
+        self.plot_scheduler = RedrawScheduler(self, self.refresh, rate=10)
         self.notebook_1_Settings = wx.Panel(self.notebook_1, wx.ID_ANY)
         # Use PropertyGridManger instead, if pages are desired
         self.property_grid_1 = wx.propgrid.PropertyGrid(self.notebook_1_Settings, wx.ID_ANY)
@@ -150,6 +262,7 @@ class TestFrame(wx.Frame):
         self.notebook_Spreadsheet = wx.Panel(self.notebook, wx.ID_ANY)
         self.grid_1 = MyGrid(self.notebook_Spreadsheet)
         self.btn_run = wx.Button(self.panel_main, wx.ID_ANY, "Run Test")
+        self.checkbox_resume = wx.CheckBox(self.panel_main, wx.ID_ANY, "Resume")
         # TODO - Pause: https://stackoverflow.com/a/34313474/3382269
         self.btn_pause = wx.Button(self.panel_main, wx.ID_ANY, "Pause")
         self.btn_stop = wx.Button(self.panel_main, wx.ID_ANY, "Stop")
@@ -173,6 +286,8 @@ class TestFrame(wx.Frame):
         self.grid_1.CreateGrid(31, 16)
         self.grid_1.SetDefaultColSize(150)
         self.notebook.SetMinSize((1200, 500))
+        self.checkbox_resume.SetValue(self.resume)
+        self.checkbox_resume.SetToolTip("Skip the setpoints already completed in the journal of an interrupted run")
         self._create_plot_properties()
 
     def __do_layout(self):
@@ -220,7 +335,10 @@ class TestFrame(wx.Frame):
         static_line_2 = wx.StaticLine(self.panel_main, wx.ID_ANY)
         static_line_2.SetMinSize((1200, 2))
         grid_sizer_1.Add(static_line_2, (3, 0), (1, 4), wx.ALIGN_CENTER_VERTICAL | wx.BOTTOM | wx.TOP, 5)
-        grid_sizer_1.Add(self.btn_run, (4, 0), (1, 1), wx.ALIGN_RIGHT | wx.RIGHT, 20)
+        sizer_run = wx.BoxSizer(wx.HORIZONTAL)
+        sizer_run.Add(self.checkbox_resume, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 10)
+        sizer_run.Add(self.btn_run, 0, 0, 0)
+        grid_sizer_1.Add(sizer_run, (4, 0), (1, 1), wx.ALIGN_RIGHT | wx.RIGHT, 20)
         grid_sizer_1.Add(self.btn_pause, (4, 1), (1, 1), wx.ALIGN_RIGHT | wx.RIGHT, 20)
         grid_sizer_1.Add(self.btn_stop, (4, 2), (1, 1), wx.ALIGN_RIGHT | wx.RIGHT, 10)
         grid_sizer_1.Add(self.btn_save, (4, 3), (1, 1), wx.ALIGN_RIGHT, 0)
@@ -249,13 +367,19 @@ class TestFrame(wx.Frame):
         pg.Append(wxpg.EnumProperty(label="X Data",             name="X Data", labels=['NaN'],   values=[0]))
         pg.Append(wxpg.MultiChoiceProperty(label="Y Data",      name='Y Data', choices=['NaN'],  value=['NaN']))
         pg.Append(wxpg.EnumProperty(label="Data Labels", name="Data Labels",   labels=['NaN'],   values=[0]))
+        # long series are reduced to about 2 points per pixel before they are drawn
+        pg.Append(wxpg.EnumProperty(label="Decimation",  name="Decimation",    labels=['Min/Max', 'LTTB', 'Off']))
 
         pg.Append(wxpg.PropertyCategory("3 - Optional Static Plot Overlay"))
         pg.Append(wxpg.FileProperty(label="Overlay Plot", value=rf"{dir_path}"))
         pg.Append(wxpg.EnumProperty(label="X Axis Variable", labels=['']))
         pg.Append(wxpg.EnumProperty(label="Y Axis Variable", labels=['']))
 
-        pg.Append(wxpg.PropertyCategory("4 - Advanced Properties"))
+        pg.Append(wxpg.PropertyCategory("4 - Derived Columns"))
+        # name = expression pairs separated by semicolons, such as: ppm = (l - n) / n * 1e6; dist = d / 100e-3
+        pg.Append(wxpg.StringProperty(label="Derived Columns", value=''))
+
+        pg.Append(wxpg.PropertyCategory("5 - Advanced Properties"))
         pg.Append(wxpg.ArrayStringProperty(label="xLim",   value=['0', '100']))
         pg.Append(wxpg.ArrayStringProperty(label="yLim",   value=['0', '100']))
         pg.Append(wxpg.DateProperty(label="Date",          value=wx.DateTime.Now()))
@@ -264,14 +388,42 @@ class TestFrame(wx.Frame):
         pg.Grid.FitColumns()
 
     def on_run(self, event):
+        self.resume = self.checkbox_resume.GetValue()
+        if not self.resume and not self.confirm_restart():
+            return
         self.thread.start()
 
+    def confirm_restart(self):
+        """
+        A run that does not resume starts the journal over. If the journal holds the setpoints of an interrupted run,
+        asks whether to resume it, discard it or cancel.
+
+        :return: False to cancel the run
+        """
+        if not journal_path.exists():
+            return True
+        meta, rows, _ = checkpoint.load(journal_path)
+        if not rows or meta.get('complete'):
+            return True
+        dialog = wx.MessageDialog(self, f'{journal_path} holds {len(rows)} setpoints of an interrupted run, which '
+                                        f'starting over discards.', 'Interrupted run',
+                                  wx.YES_NO | wx.CANCEL | wx.ICON_QUESTION)
+        dialog.SetYesNoCancelLabels('Resume', 'Start over', 'Cancel')
+        answer = dialog.ShowModal()
+        dialog.Destroy()
+        if answer == wx.ID_CANCEL:
+            return False
+        self.resume = answer == wx.ID_YES
+        self.checkbox_resume.SetValue(self.resume)
+        return True
+
     def run(self):
         print('run!')
         self.flag_complete = False
         T = Test(self)
         T.run()
         self.flag_complete = True
+        tracer.export_at_exit()  # when LEVIATHAN_TRACE is set. Written again at exit
 
     def OnGridChangeEvent(self, evt):
         pg = self.property_grid_1
@@ -282,6 +434,12 @@ class TestFrame(wx.Frame):
             pg.GetProperty('X Axis Variable').SetChoices(wxpg.PGChoices(['Select option'] + choices))
             pg.GetProperty('Y Axis Variable').SetChoices(wxpg.PGChoices(['Select option'] + choices))
 
+        elif prop.GetName() == 'Derived Columns':
+            for declaration in pg.GetPropertyValue('Derived Columns').split(';'):
+                name, _, expression = declaration.partition('=')
+                if name.strip() and expression.strip():
+                    self.add_derived_column(name.strip(), expression.strip())
+
         elif prop.GetName() == 'X Axis Variable' or 'Y Axis Variable' and self.flag_complete:
             self.update_yAxisData()
 
@@ -304,51 +462,146 @@ class TestFrame(wx.Frame):
                         self.overlay[key].append(row[idx])
 
     def write_header(self, header):
+        header = list(header) + [name for name in self.derived if name not in header]
         if not self.table:
-            self.table = {key: [] for key in header}
+            self.table = ColumnStore(header)
         else:
-            self.table = {header[col]: self.table[key] for col, key in enumerate(self.table.keys())}
+            self.table.rename(header)
 
-        self.grid_1.write_list_to_row(self.row, self.table.keys())
+        self.header_row = self.row
         self.row += 1
+        self.first_row = self.row
+        self.plot_scheduler.request()  # the header is written to the grid by refresh_grid, on the GUI thread
+
+    def add_derived_column(self, name, expression):
+        """
+        Declares a column computed from the other columns of each row, such as
+            self.parent.add_derived_column('ppm_shift', 'round((loaded - nom) / nom * 1e6, 2)')
+        The expression is compiled once with eqn_parser and evaluated for each new row in write_to_log, so only the new
+        row is computed. Derived columns may refer to derived columns declared before them. Declaring a column that
+        already exists replaces its expression and recomputes it for the rows logged so far.
+        """
+        self.derived[name] = compile_expression(expression)
+        if self.header_row is None:
+            return  # added to the table by write_header
+
+        # derived columns always follow the measured columns
+        measured = [key for key in self.table if key not in self.derived]
+        values = [self.derive(self.table.row(idx)[:len(measured)]) for idx in range(self.table.rows)]
+        for col, column in enumerate(self.derived):
+            self.table.set_column(column, [row_values[col] for row_values in values])
+
+        self.grid_1.write_list_to_row(self.header_row, self.table.keys())
+        self.grid_1.ForceRefresh()
+        if self.ax:
+            choices = list(self.table.keys())
+            pg = self.property_grid_1
+            pg.GetProperty('X Data').SetChoices(wxpg.PGChoices(choices))
+            pg.GetProperty('Y Data').SetChoices(wxpg.PGChoices(choices))
+            pg.GetProperty('Data Labels').SetChoices(wxpg.PGChoices([""] + choices))
+
+    def derive(self, row_data):
+        """
+        :param row_data: a logged row, without its derived columns
+        :return: the values of the derived columns for the row, in the order they were declared
+        """
+        measured = [key for key in self.table if key not in self.derived]
+        variables = {key: as_number(value) for key, value in zip(measured, row_data)}
+        values = []
+        for column, expression in self.derived.items():
+            try:
+                value = expression(variables)
+            except Exception as e:
+                print(f'[Derived] {column}: {e}')
+                value = float('nan')
+            variables[column] = value
+            values.append(value)
+        return values
 
     def write_to_log(self, row_data):
-        self.grid_1.write_list_to_row(self.row, row_data)
-        self.row += 1
+        # called by Test.run on the sweep thread. Only appends to the table: the grid shows the new row once
+        # refresh_grid runs on the GUI thread
+        with tracer.span('gui', 'write_to_log'):
+            if self.derived:
+                row_data = list(row_data) + self.derive(row_data)
+            if not self.table:
+                self.table = ColumnStore(f'col {idx}' for idx in range(len(row_data)))
+                self.first_row = self.row
+            self.table.append(row_data)
+            self.row += 1
+            self.plot_scheduler.request()
 
+    def plot_data(self):
+        # called by Test.run after each row. Only marks the plot out of date, so the sweep never waits for a draw and
+        # matplotlib is only touched on the GUI thread, by draw_plot
+        self.plot_scheduler.request()
+
+    def refresh(self):
+        # the plot scheduler's callback. Brings the grid and the plot up to date on the GUI thread
+        self.refresh_grid()
+        self.draw_plot()
+
+    def refresh_grid(self):
+        """
+        Shows the rows logged since the last refresh. The sweep thread only changes self.table, so the grid is only
+        resized and redrawn here, on the GUI thread.
+        """
         if not self.table:
-            self.table = {f'col {idx}': item for idx, item in enumerate(row_data)}
+            return
+        layout = (self.header_row, self.first_row, tuple(self.table.keys()))
+        if self.grid_1.table.store is not self.table or layout != self.grid_layout:
+            self.grid_layout = layout
+            if self.header_row is not None:
+                self.grid_1.write_list_to_row(self.header_row, layout[2])
+            self.grid_1.bind_store(self.table, self.first_row)  # logged rows are read from the table when drawn
         else:
-            for idx, key in enumerate(self.table.keys()):
-                self.table[key].append(row_data[idx])
+            self.grid_1.refresh_store()
 
-    def plot_data(self):
+    def draw_plot(self):
+        with tracer.span('gui', 'plot_data'):
+            self._plot_data()
+
+    def _plot_data(self):
         if not self.ax:
             self.draw_2dplot()
         else:
             pg = self.property_grid_1
             # self.x = self.table[pg.GetProperty('X Data').GetValueAsString()]
-            self.x = self.table[pg.GetPropertyValueAsString('X Data')]
-            self.y = [self.table[col] for col in pg.GetPropertyValue('Y Data')]
-            self.update_yAxisData()
+            rows = self.table.rows  # the sweep may append a row while the columns are read
+            self.x = self.table[pg.GetPropertyValueAsString('X Data')][:rows]
+            self.y = [self.table[col][:rows] for col in pg.GetPropertyValue('Y Data')]
+            if self.get_plot_key() != self.plot_key:
+                self.update_yAxisData()
+            else:
+                self.update_lines()
+
+    def get_plot_key(self):
+        # the plot is rebuilt when any of these change. Otherwise new rows only update the data of the lines
+        pg = self.property_grid_1
+        return (pg.GetPropertyValueAsString('X Data'), tuple(pg.GetPropertyValue('Y Data')),
+                pg.GetPropertyValueAsString('Scale'), pg.GetPropertyValueAsString('X Axis Variable'),
+                pg.GetPropertyValueAsString('Y Axis Variable'), pg.GetPropertyValueAsString('Data Labels'),
+                pg.GetPropertyValueAsString('Decimation'))
 
     def _plot_helper(self):
         pg = self.property_grid_1
+        method = {'Min/Max': 'minmax', 'LTTB': 'lttb'}.get(pg.GetPropertyValueAsString('Decimation'))
+        self.decimator = LineDecimator(self.ax, method)  # the axes were cleared, along with their callbacks
         self.plot = [self.ax.plot]*len(self.y)
         for idx, y in enumerate(self.y):
-            # plot returns a list of artists of which you want the first element when changing x or y data
+            # the decimator returns the line plotted, the artist to update when changing x or y data
             scale = pg.GetPropertyValueAsString('Scale')
             if scale == 'Linear':
-                self.plot[idx], = self.ax.plot(self.x, y)
+                self.plot[idx] = self.decimator.plot(self.ax.plot, self.x, y)
                 self.draw_overlay(self.ax.plot)
             if scale == 'SemilogX':
-                self.plot[idx], = self.ax.semilogx(self.x, y)
+                self.plot[idx] = self.decimator.plot(self.ax.semilogx, self.x, y)
                 self.draw_overlay(self.ax.semilogx)
             if scale == 'SemilogY':
-                self.plot[idx], = self.ax.semilogy(self.x, y)
+                self.plot[idx] = self.decimator.plot(self.ax.semilogy, self.x, y)
                 self.draw_overlay(self.ax.semilogy)
             if scale == 'LogLog':
-                self.plot[idx], = self.ax.loglog(self.x, y)
+                self.plot[idx] = self.decimator.plot(self.ax.loglog, self.x, y)
                 self.draw_overlay(self.ax.loglog)
 
     def draw_overlay(self, plot_type):
@@ -380,366 +633,135 @@ class TestFrame(wx.Frame):
         self.toolbar.update()  # Not sure why this is needed - ADS
 
     def update_yAxisData(self):
+        # full rebuild of the plot. Only needed when the axes, the scale or the plotted columns change
         self.ax.clear()
         self._plot_helper()
+        self.plot_key = self.get_plot_key()
 
+        self.labels = None  # removed by clear()
         self.update_data_labels()
         self.update_axis_labels()
         self.ax.relim()
         self.ax.autoscale_view()
 
-        self.canvas.draw()
+        self.redraw()
         self.canvas.flush_events()
 
-    def update_data_labels(self):
-        pg = self.property_grid_1
-        label_var = pg.GetPropertyValueAsString('Data Labels')
-        if label_var:
-            for idx, text in enumerate(self.table[label_var]):
-                plt.annotate(f'{label_var}={round(text, 3)}',
-                             (self.x[idx], self.y[0][idx]),
-                             xytext=(0, 10),
-                             textcoords='offset pixels',
-                             horizontalalignment='center')
-
-    def update_axis_labels(self):
-        pg = self.property_grid_1
-        self.ax.set_title(pg.GetPropertyValue('Title'), fontsize=15, fontweight="bold")
-        self.ax.set_xlabel(pg.GetPropertyValue('X Label'), fontsize=8)
-        self.ax.set_ylabel(pg.GetPropertyValue('Y Label'), fontsize=8)
-        self.ax.grid(pg.GetPropertyValue('Grid'))
-        self.plot[0].set_color(tuple(x/255 for x in pg.GetPropertyValue('Line Colour')))
-
-
-class MyGrid(wx.grid.Grid):
-    def __init__(self, parent):
-        """Constructor"""
-        wx.grid.Grid.__init__(self, parent, wx.ID_ANY, wx.DefaultPosition, wx.DefaultSize, 0)
-        self.selected_rows = []
-        self.selected_cols = []
-        self.history = []
-
-        self.frame_number = 1
-
-        # test all the events
-        self.Bind(wx.grid.EVT_GRID_CELL_LEFT_CLICK, self.OnCellLeftClick)
-        self.Bind(wx.grid.EVT_GRID_CELL_RIGHT_CLICK, self.OnCellRightClick)
-        self.Bind(wx.grid.EVT_GRID_CELL_LEFT_DCLICK, self.OnCellLeftDClick)
-        self.Bind(wx.grid.EVT_GRID_CELL_RIGHT_DCLICK, self.OnCellRightDClick)
-        self.Bind(wx.grid.EVT_GRID_LABEL_LEFT_CLICK, self.OnLabelLeftClick)
-        self.Bind(wx.grid.EVT_GRID_LABEL_RIGHT_CLICK, self.OnLabelRightClick)
-        self.Bind(wx.grid.EVT_GRID_LABEL_LEFT_DCLICK, self.OnLabelLeftDClick)
-        self.Bind(wx.grid.EVT_GRID_LABEL_RIGHT_DCLICK, self.OnLabelRightDClick)
-        self.Bind(wx.grid.EVT_GRID_ROW_SIZE, self.OnRowSize)
-        self.Bind(wx.grid.EVT_GRID_COL_SIZE, self.OnColSize)
-        self.Bind(wx.grid.EVT_GRID_RANGE_SELECT, self.OnRangeSelect)
-        self.Bind(wx.grid.EVT_GRID_CELL_CHANGED, self.OnCellChange)
-        self.Bind(wx.grid.EVT_GRID_SELECT_CELL, self.OnSelectCell)
-        self.Bind(wx.grid.EVT_GRID_EDITOR_SHOWN, self.OnEditorShown)
-        self.Bind(wx.grid.EVT_GRID_EDITOR_HIDDEN, self.OnEditorHidden)
-        self.Bind(wx.grid.EVT_GRID_EDITOR_CREATED, self.OnEditorCreated)
-
-    def OnCellLeftClick(self, event):
-        print("OnCellLeftClick: (%d,%d) %s\n" % (event.GetRow(), event.GetCol(), event.GetPosition()))
-        event.Skip()
-
-    def OnCellRightClick(self, event):
-        print("OnCellRightClick: (%d,%d) %s\n" % (event.GetRow(), event.GetCol(), event.GetPosition()))
-        menu_contents = [(wx.NewId(), "Cut", self.onCut),
-                         (wx.NewId(), "Copy", self.onCopy),
-                         (wx.NewId(), "Paste", self.onPaste)]
-        popup_menu = wx.Menu()
-        for menu_item in menu_contents:
-            if menu_item is None:
-                popup_menu.AppendSeparator()
-                continue
-            popup_menu.Append(menu_item[0], menu_item[1])
-            self.Bind(wx.EVT_MENU, menu_item[2], id=menu_item[0])
-
-        self.PopupMenu(popup_menu, event.GetPosition())
-        popup_menu.Destroy()
-        return
-
-    def OnCellLeftDClick(self, evt):
-        print("OnCellLeftDClick: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnCellRightDClick(self, evt):
-        print("OnCellRightDClick: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnLabelLeftClick(self, evt):
-        print("OnLabelLeftClick: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnLabelRightClick(self, evt):
-        print("OnLabelRightClick: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnLabelLeftDClick(self, evt):
-        print("OnLabelLeftDClick: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnLabelRightDClick(self, evt):
-        print("OnLabelRightDClick: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnRowSize(self, evt):
-        print("OnRowSize: row %d, %s\n" % (evt.GetRowOrCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnColSize(self, evt):
-        print("OnColSize: col %d, %s\n" % (evt.GetRowOrCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnRangeSelect(self, evt):
-        if evt.Selecting():
-            msg = 'Selected'
-        else:
-            msg = 'Deselected'
-        print("OnRangeSelect: %s  top-left %s, bottom-right %s\n" % (
-            msg, evt.GetTopLeftCoords(), evt.GetBottomRightCoords()))
-        evt.Skip()
-
-    def OnCellChange(self, evt):
-        print("OnCellChange: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        # Show how to stay in a cell that has bad data.  We can't just
-        # call SetGridCursor here since we are nested inside one so it
-        # won't have any effect.  Instead, set coordinates to move to in
-        # idle time.
-        value = self.GetCellValue(evt.GetRow(), evt.GetCol())
-        if value == 'no good':
-            self.moveTo = evt.GetRow(), evt.GetCol()
-
-    def OnSelectCell(self, evt):
-        if evt.Selecting():
-            msg = 'Selected'
-        else:
-            msg = 'Deselected'
-        print("OnSelectCell: %s (%d,%d) %s\n" % (msg, evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        # Another way to stay in a cell that has a bad value...
-        row = self.GetGridCursorRow()
-        col = self.GetGridCursorCol()
-        if self.IsCellEditControlEnabled():
-            self.HideCellEditControl()
-            self.DisableCellEditControl()
-        value = self.GetCellValue(row, col)
-        if value == 'no good 2':
-            return  # cancels the cell selection
-        evt.Skip()
-
-    def OnEditorShown(self, evt):
-        if evt.GetRow() == 6 and evt.GetCol() == 3 and \
-                wx.MessageBox("Are you sure you wish to edit this cell?",
-                              "Checking", wx.YES_NO) == wx.NO:
-            evt.Veto()
-            return
-        print("OnEditorShown: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnEditorHidden(self, evt):
-        if evt.GetRow() == 6 and evt.GetCol() == 3 and \
-                wx.MessageBox("Are you sure you wish to finish editing this cell?",
-                              "Checking", wx.YES_NO) == wx.NO:
-            evt.Veto()
-            return
-        print("OnEditorHidden: (%d,%d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetPosition()))
-        evt.Skip()
-
-    def OnEditorCreated(self, evt):
-        print("OnEditorCreated: (%d, %d) %s\n" % (evt.GetRow(), evt.GetCol(), evt.GetControl()))
-
-    def add_history(self, change):
-        self.history.append(change)
-
-    def get_selection(self):
+    def update_lines(self):
         """
-        Returns selected range's start_row, start_col, end_row, end_col
-        If there is no selection, returns selected cell's start_row=end_row, start_col=end_col
+        Appends the new rows to the existing lines. Only the lines are drawn again, blitted over the cached background
+        of the axes, unless the data outgrew the axis limits or a new row brought a data label into view.
         """
-        if not len(self.GetSelectionBlockTopLeft()):
-            selected_columns = self.GetSelectedCols()
-            selected_rows = self.GetSelectedRows()
-            if selected_columns:
-                start_col = selected_columns[0]
-                end_col = selected_columns[-1]
-                start_row = 0
-                end_row = self.GetNumberRows() - 1
-            elif selected_rows:
-                start_row = selected_rows[0]
-                end_row = selected_rows[-1]
-                start_col = 0
-                end_col = self.GetNumberCols() - 1
-            else:
-                start_row = end_row = self.GetGridCursorRow()
-                start_col = end_col = self.GetGridCursorCol()
-        elif len(self.GetSelectionBlockTopLeft()) > 1:
-            wx.MessageBox("Multiple selections are not supported", "Warning")
-            return []
-        else:
-            start_row, start_col = self.GetSelectionBlockTopLeft()[0]
-            end_row, end_col = self.GetSelectionBlockBottomRight()[0]
-
-        return [start_row, start_col, end_row, end_col]
+        for line, y in zip(self.plot, self.y):
+            self.decimator.set_data(line, self.x, y)
+        self.update_data_labels()
 
-    def get_selected_cells(self):
-        # returns a list of selected cells
-        selection = self.get_selection()
-        if not selection:
-            return
+        self.ax.relim()
+        if not self.view_contains_data() and self.ax.get_autoscale_on():  # not while zoomed in with the toolbar
+            self.rescale()
+            self.redraw()
+        elif self.background is None or (self.labels is not None and self.labels.changed()):
+            self.redraw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.blit_lines()
 
-        start_row, start_col, end_row, end_col = selection
-        for row in range(start_row, end_row + 1):
-            for col in range(start_col, end_col + 1):
-                yield [row, col]
+    def view_contains_data(self):
+        data, view = self.ax.dataLim, self.ax.viewLim
+        return (min(view.x0, view.x1) <= data.x0 and data.x1 <= max(view.x0, view.x1)
+                and min(view.y0, view.y1) <= data.y0 and data.y1 <= max(view.y0, view.y1))
 
-    def onCopy(self, event):
+    def rescale(self, headroom=0.25):
         """
-        Copies range of selected cells to clipboard.
+        Autoscales to the data, leaving headroom in the direction the data grew, so a growing series does not force a
+        full redraw on every row.
         """
-
-        selection = self.get_selection()
-        if not selection:
-            return []
-        start_row, start_col, end_row, end_col = selection
-
-        data = u''
-
-        rows = range(start_row, end_row + 1)
-        for row in rows:
-            columns = range(start_col, end_col + 1)
-            for idx, column in enumerate(columns, 1):
-                if idx == len(columns):
-                    # if we are at the last cell of the row, add new line instead
-                    data += self.GetCellValue(row, column) + "\n"
-                else:
-                    data += self.GetCellValue(row, column) + "\t"
-
-        text_data_object = wx.TextDataObject()
-        text_data_object.SetText(data)
-
-        if wx.TheClipboard.Open():
-            wx.TheClipboard.SetData(text_data_object)
-            wx.TheClipboard.Close()
-        else:
-            wx.MessageBox("Can't open the clipboard", "Warning")
-
-    def onPaste(self, event):
-        if not wx.TheClipboard.Open():
-            wx.MessageBox("Can't open the clipboard", "Warning")
-            return False
-
-        clipboard = wx.TextDataObject()
-        wx.TheClipboard.GetData(clipboard)
-        wx.TheClipboard.Close()
-        data = clipboard.GetText()
-        if data[-1] == "\n":
-            data = data[:-1]
-
-        try:
-            cells = self.get_selected_cells()
-            cell = next(cells)
-        except StopIteration:
-            return False
-
-        start_row = end_row = cell[0]
-        start_col = end_col = cell[1]
-        max_row = self.GetNumberRows()
-        max_col = self.GetNumberCols()
-
-        history = []
-        out_of_range = False
-
-        for row, line in enumerate(data.split("\n")):
-            target_row = start_row + row
-            if not (0 <= target_row < max_row):
-                out_of_range = True
-                break
-
-            if target_row > end_row:
-                end_row = target_row
-
-            for col, value in enumerate(line.split("\t")):
-                target_col = start_col + col
-                if not (0 <= target_col < max_col):
-                    out_of_range = True
-                    break
-
-                if target_col > end_col:
-                    end_col = target_col
-
-                # save previous value of the cell for undo
-                history.append([target_row, target_col, {"value": self.GetCellValue(target_row, target_col)}])
-
-                self.SetCellValue(target_row, target_col, value)
-
-        self.SelectBlock(start_row, start_col, end_row, end_col)  # select pasted range
-        if out_of_range:
-            wx.MessageBox("Pasted data is out of Grid range", "Warning")
-
-        self.add_history({"type": "change", "cells": history})
-
-    def onDelete(self, e):
-        cells = []
-        for row, col in self.get_selected_cells():
-            attributes = {
-                "value": self.GetCellValue(row, col),
-                "alignment": self.GetCellAlignment(row, col)
-            }
-            cells.append((row, col, attributes))
-            self.SetCellValue(row, col, "")
-
-        self.add_history({"type": "delete", "cells": cells})
-
-    def onCut(self, e):
-        self.onCopy(e)
-        self.onDelete(e)
-
-    def retrieveList(self):
+        previous = self.ax.get_xlim(), self.ax.get_ylim()
+        self.ax.autoscale_view()
+        axes = ((previous[0], self.ax.dataLim.intervalx, self.ax.get_xlim, self.ax.set_xlim, self.ax.get_xscale()),
+                (previous[1], self.ax.dataLim.intervaly, self.ax.get_ylim, self.ax.set_ylim, self.ax.get_yscale()))
+        for (old_lo, old_hi), (data_lo, data_hi), get_lim, set_lim, scale in axes:
+            lo, hi = get_lim()
+            forward, inverse = (np.log10, lambda v: 10 ** v) if scale == 'log' else (float, float)
+            span = (forward(hi) - forward(lo)) * headroom
+            lo = inverse(forward(lo) - span) if data_lo < min(old_lo, old_hi) else lo
+            hi = inverse(forward(hi) + span) if data_hi > max(old_lo, old_hi) else hi
+            set_lim(lo, hi, auto=None)  # keeps autoscaling on
+
+    def redraw(self):
         """
-        Copies range of selected cells to clipboard.
+        Full draw of the canvas. The background is captured with the live lines hidden, so later updates restore it and
+        blit only the lines. Saved figures and draws by the toolbar still include the lines.
         """
+        if not self.canvas.supports_blit:
+            self.canvas.draw()
+            return
+        self.capturing = True
+        for line in self.plot:
+            line.set_visible(False)
+        try:
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        finally:
+            for line in self.plot:
+                line.set_visible(True)
+            self.capturing = False
+        self.blit_lines()
+
+    def blit_lines(self):
+        for line in self.plot:
+            self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
+
+    def on_canvas_draw(self, event):
+        # any draw other than redraw (zoom, pan, resize) leaves the cached background out of date
+        if not self.capturing:
+            self.background = None
 
-        selection = self.get_selection()
-        if not selection:
-            return []
-        start_row, start_col, end_row, end_col = selection
-
-        data = u''
-        list_row = []
-        list_data = []
-        rows = range(start_row, end_row + 1)
-        for row in rows:
-            columns = range(start_col, end_col + 1)
-            for idx, column in enumerate(columns, 1):
-                if idx == len(columns):
-                    # if we are at the last cell of the row, add new line instead
-                    list_row.append(self.GetCellValue(row, column))
-                    list_data.append(list_row)
-                    list_row = []
-                else:
-                    list_row.append(self.GetCellValue(row, column))
-
-        return list_data
+    def update_data_labels(self):
+        # labels the points of the first plotted column with the values of the 'Data Labels' column
+        pg = self.property_grid_1
+        label_var = pg.GetPropertyValueAsString('Data Labels')
+        if label_var and self.y:
+            if self.labels is None:
+                self.labels = DataLabels(label_var)
+                self.ax.add_artist(self.labels)
+            self.labels.set_data(self.x, self.y[0], self.table[label_var])
 
-    def write_list_to_row(self, row=0, data=None):
-        if data is not None:
-            if row >= 0:
-                if row >= self.GetNumberRows() - 1:
-                    self.AppendRows(5)
-                for col, item in enumerate(data):
-                    self.SetCellValue(row, col, str(item))
-            else:
-                print('row must be in range greater than 0')
-        else:
-            print('No data to write to grid!')
-            pass
+    def update_axis_labels(self):
+        pg = self.property_grid_1
+        self.ax.set_title(pg.GetPropertyValue('Title'), fontsize=15, fontweight="bold")
+        self.ax.set_xlabel(pg.GetPropertyValue('X Label'), fontsize=8)
+        self.ax.set_ylabel(pg.GetPropertyValue('Y Label'), fontsize=8)
+        self.ax.grid(pg.GetPropertyValue('Grid'))
+        if self.plot:
+            self.plot[0].set_color(tuple(x/255 for x in pg.GetPropertyValue('Line Colour')))
 
 
 class VisaClient:
-    def __init__(self, id):
+    """
+    Open sessions are pooled at the class level and keyed by resource string, so every VisaClient in the process shares
+    one ResourceManager and reuses an already-open, already-identified session instead of reconnecting. A pooled
+    session that has been idle for longer than max_idle seconds must answer *IDN? before it is reused, otherwise it is
+    evicted and reopened. Opening and health-checking a resource only holds the lock of that resource, so instruments
+    created from different threads do not wait on each other. Every VisaClient of a resource shares its session, so
+    query holds the I/O lock of the session from the write to the end of the read and concurrent readings do not get
+    each other's responses.
+    """
+    rm = None
+    sessions = {}  # {resource string: {'INSTR': resource, 'identity': str, 'lock': RLock, 'last_used': float}}
+    locks = {}  # {resource string: lock held while the resource is opened or health-checked}
+    lock = threading.Lock()
+    max_idle = 30.  # seconds
+    buffered_models = ('34461A', '8846A')  # meters that can return a whole buffer of samples from one READ?
+    binary_models = ('34461A',)  # meters that can return that buffer as an IEEE 488.2 REAL64 block
+
+    def __init__(self, id, name=None):
         try:
-            self.rm = visa.ResourceManager()
+            with VisaClient.lock:
+                if VisaClient.rm is None:
+                    VisaClient.rm = visa.ResourceManager()
+            self.rm = VisaClient.rm
             self.instr_info = id
             self.mode = self.instr_info['mode']
             self.timeout = 60000  # 1 (60e3) minute timeout
@@ -751,61 +773,142 @@ class VisaClient:
                    "    See NI-VISA Installation:\n"
                    "        > https://pyvisa.readthedocs.io/en/1.8/getting_nivisa.html#getting-nivisa\n")
             print(msg)
+
+        self.INSTR = None
+        self.identity = ''
+        self.io_lock = threading.RLock()  # held for a write and its read. Shared by every VisaClient of the session
+        self.resource, self.read_termination = self.get_resource()
+        self.name = name or self.resource  # instrument shown in traces
+        with VisaClient.lock:
+            resource_lock = VisaClient.locks.setdefault(self.resource, threading.Lock())
+        with resource_lock:
+            session = VisaClient.sessions.get(self.resource)
+            if session is not None and self.is_alive(session):
+                self.INSTR = session['INSTR']
+                self.identity = session['identity']
+                self.io_lock = session['lock']
+                session['last_used'] = time.time()
+                print(self.identity)
+            else:
+                VisaClient.evict(self.resource)
+                self.connect()
+
+        # buffered acquisition can be forced on or off with a 'buffered' entry in the instrument configuration
+        self.buffered = self.instr_info.get('buffered', any(model in self.identity
+                                                            for model in VisaClient.buffered_models))
+        self.binary = self.instr_info.get('binary', any(model in self.identity
+                                                        for model in VisaClient.binary_models))
+        # settling options of every reading of this instrument, such as {'rtol': 0.01, 'timeout': 2}. See Settling
+        self.settling = self.instr_info.get('settling') or {}
+
+    def get_resource(self):
+        # if mode is SOCKET:
+        if self.mode == 'SOCKET':
+            # SOCKET is a non-protocol raw TCP connection
+            address = self.instr_info['ip_address']
+            port = self.instr_info['port']
+            return f'TCPIP0::{address}::{port}::SOCKET', '\n'
+
+        # if mode is GPIB:
+        elif self.mode == 'GPIB':
+            address = self.instr_info['gpib_address']
+            return f'GPIB0::{address}::0::INSTR', None
+
+        # if mode is INSTR:
+        elif self.mode == 'INSTR':
+            # INSTR is a VXI-11 protocol
+            address = self.instr_info['ip_address']
+            return f'TCPIP0::{address}::inst0::INSTR', '\n'
+
+        # if mode is SERIAL:
+        elif self.mode == 'SERIAL':
+            address = self.instr_info['ip_address']
+            return f'{address}', '\n'
+
+        # TODO - http://lampx.tugraz.at/~hadley/num/ch9/python/9.2.php
+        # if mode is SERIAL:
+        elif self.mode == 'USB':
+            address = self.instr_info['ip_address']
+            return f'{address}', '\n'
+
+        # if mode is NIGHTHAWK:
+        elif self.mode == 'NIGHTHAWK':
+            address = self.instr_info['ip_address']
+            port = self.instr_info['port']
+            return f'TCPIP::{address}::{port}::SOCKET', '>'
+
+        # if mode is SIM:
+        elif self.mode == 'SIM':
+            # simulated instrument (see simulator.py). The address names the model, such as '5560A' or '34461A'
+            address = self.instr_info['ip_address']
+            return f'SIM::{address}', '\n'
+        else:
+            print('Failed to connect.')
+            return None, None
+
+    def connect(self):
         for attempt in range(5):
             try:
-                # TODO - verify this works as intended... Otherwise leave INSTR lines commented
-                # if mode is SOCKET:
-                if self.mode == 'SOCKET':
-                    # SOCKET is a non-protocol raw TCP connection
-                    address = self.instr_info['ip_address']
-                    port = self.instr_info['port']
-                    self.INSTR = self.rm.open_resource(f'TCPIP0::{address}::{port}::SOCKET', read_termination='\n')
-
-                # if mode is GPIB:
-                elif self.mode == 'GPIB':
-                    address = self.instr_info['gpib_address']
-                    self.INSTR = self.rm.open_resource(f'GPIB0::{address}::0::INSTR')
-
-                # if mode is INSTR:
-                elif self.mode == 'INSTR':
-                    # INSTR is a VXI-11 protocol
-                    address = self.instr_info['ip_address']
-                    self.INSTR = self.rm.open_resource(f'TCPIP0::{address}::inst0::INSTR', read_termination='\n')
-
-                # if mode is SERIAL:
-                elif self.mode == 'SERIAL':
-                    address = self.instr_info['ip_address']
-                    self.INSTR = self.rm.open_resource(f'{address}')
-                    self.INSTR.read_termination = '\n'
-
-                # TODO - http://lampx.tugraz.at/~hadley/num/ch9/python/9.2.php
-                # if mode is SERIAL:
-                elif self.mode == 'USB':
-                    address = self.instr_info['ip_address']
-                    self.INSTR = self.rm.open_resource(f'{address}', read_termination='\n')
-
-                # if mode is NIGHTHAWK:
-                elif self.mode == 'NIGHTHAWK':
-                    address = self.instr_info['ip_address']
-                    port = self.instr_info['port']
-                    self.INSTR = self.rm.open_resource(f'TCPIP::{address}::{port}::SOCKET', read_termination='>')
+                with tracer.span('connect', 'open_resource', instrument=self.name, attempt=attempt + 1):
+                    if self.mode == 'SIM':
+                        self.INSTR = self.open_simulated()
+                    elif self.read_termination is None:
+                        self.INSTR = self.rm.open_resource(self.resource)
+                    else:
+                        self.INSTR = self.rm.open_resource(self.resource, read_termination=self.read_termination)
+                if self.mode == 'NIGHTHAWK':
                     self.read()
-                else:
-                    print('Failed to connect.')
 
                 self.INSTR.write('BEEP')
-                print(self.INSTR.query('*IDN?'))
+                self.identity = self.INSTR.query('*IDN?')
+                print(self.identity)
 
                 self.INSTR.timeout = self.timeout
 
-            except (visa.VisaIOError, Exception) as e:
+            except visa.VisaIOError:
                 # https://github.com/pyvisa/pyvisa-py/issues/146#issuecomment-453695057
                 print(f'[attempt {attempt + 1}/5] - retrying connection to instrument')
             else:
+                with VisaClient.lock:
+                    VisaClient.sessions[self.resource] = {'INSTR': self.INSTR, 'identity': self.identity,
+                                                          'lock': self.io_lock, 'last_used': time.time()}
                 break
         else:
             print('Invalid session handle. The resource might be closed.')
 
+    def open_simulated(self):
+        import simulator  # only needed when an instrument is configured with mode: SIM
+        options = {key: self.instr_info[key] for key in ('latency', 'noise', 'tau', 'gain', 'seed')
+                   if key in self.instr_info}
+        return simulator.open_resource(self.resource, read_termination=self.read_termination, **options)
+
+    def is_alive(self, session):
+        if time.time() - session['last_used'] < VisaClient.max_idle:
+            return True
+        try:
+            with session['lock']:
+                session['INSTR'].query('*IDN?')
+        except visa.VisaIOError:
+            return False
+        return True
+
+    @staticmethod
+    def evict(resource):
+        with VisaClient.lock:
+            session = VisaClient.sessions.pop(resource, None)
+        if session is not None:
+            try:
+                session['INSTR'].close()
+            except visa.VisaIOError:
+                pass
+
+    @staticmethod
+    def close_all():
+        with VisaClient.lock:
+            resources = list(VisaClient.sessions.keys())
+        for resource in resources:
+            VisaClient.evict(resource)
+
     def info(self):
         return self.instr_info
 
@@ -817,26 +920,69 @@ class VisaClient:
             print('Failed to connect to address.')
 
     def write(self, cmd):
-        self.INSTR.write(f'{cmd}')
+        with self.io_lock, tracer.span('write', cmd, instrument=self.name):
+            self.INSTR.write(f'{cmd}')
 
     def read(self):
         response = None
-        if self.mode == 'NIGHTHAWK':
-            response = (self.INSTR.read().split("\r")[0].lstrip())
-        else:
-            response = self.INSTR.read()
+        with self.io_lock, tracer.span('read', 'read', instrument=self.name):
+            if self.mode == 'NIGHTHAWK':
+                response = (self.INSTR.read().split("\r")[0].lstrip())
+            else:
+                response = self.INSTR.read()
         return response
 
     def query(self, cmd):
         response = None
-        if self.mode == 'NIGHTHAWK':
-            response = (self.INSTR.query(f'{cmd}')).split("\r")[0].lstrip()
-        else:
-            response = (self.INSTR.query(f'{cmd}'))
+        with self.io_lock, tracer.span('query', cmd, instrument=self.name):
+            if self.mode == 'NIGHTHAWK':
+                response = (self.INSTR.query(f'{cmd}')).split("\r")[0].lstrip()
+            else:
+                response = (self.INSTR.query(f'{cmd}'))
         return response
 
+    def read_binary(self, datatype='d', is_big_endian=False, expect_termination=True):
+        """
+        Reads an IEEE 488.2 definite-length block (#<n><length><data>) and returns a read-only numpy view onto the
+        received bytes. The header is read first so the data is read in one transfer of exactly <length> bytes.
+
+        :param datatype: 'f' for REAL32 or 'd' for REAL64
+        :param is_big_endian: byte order of the data
+        """
+        with self.io_lock:
+            mark = self.INSTR.read_bytes(1, break_on_termchar=False)
+            while mark != b'#':
+                mark = self.INSTR.read_bytes(1, break_on_termchar=False)
+            digits = int(self.INSTR.read_bytes(1, break_on_termchar=False))
+            if digits == 0:
+                raise ValueError('Indefinite-length blocks (#0) are not supported')
+            length = int(self.INSTR.read_bytes(digits, break_on_termchar=False))
+            data = self.INSTR.read_bytes(length, break_on_termchar=False)
+
+            if self.mode == 'NIGHTHAWK':
+                self.INSTR.read()  # discard everything up to the prompt
+            elif expect_termination and self.INSTR.read_termination:
+                self.INSTR.read_bytes(len(self.INSTR.read_termination), break_on_termchar=False)
+
+        dtype = np.dtype(datatype).newbyteorder('>' if is_big_endian else '<')
+        return np.frombuffer(data, dtype=dtype)
+
+    def query_binary(self, cmd, datatype='d', is_big_endian=False, expect_termination=True):
+        with self.io_lock, tracer.span('query', cmd, instrument=self.name, binary=True):
+            self.INSTR.write(f'{cmd}')
+            return self.read_binary(datatype, is_big_endian, expect_termination)
+
     def close(self):
-        self.INSTR.close()
+        # hands the session back to the pool. Sessions are closed at exit by VisaClient.close_all
+        with VisaClient.lock:
+            session = VisaClient.sessions.get(self.resource)
+            if session is not None:
+                session['last_used'] = time.time()
+        if session is None and self.INSTR is not None:
+            self.INSTR.close()
+
+
+atexit.register(VisaClient.close_all)
 
 
 class MyApp(wx.App):
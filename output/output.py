@@ -37,11 +37,14 @@ fig_path = 'output\\figures\\'
 
 
 # FUNCTION DEFINITIONS -------------------------------------------------------------------------------------------------
-def average_reading(instrument, cmd):
-	time.sleep(2)
+settling = pyunivisa.Settling()
+
+
+def average_reading(instrument, cmd, samples=10):
+    data = []
+    settling.wait(instrument, cmd)
     for idx in range(samples):
-        data.append(float(instrument.read(cmd).split(',')[0]))
-        time.sleep(0.20)
+        data.append(float(instrument.query(cmd).split(',')[0]))
     array = np.asarray(data)
     mean = array.mean()
     std = np.sqrt(np.mean(abs(array - mean) ** 2))
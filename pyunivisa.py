@@ -1,6 +1,11 @@
 import pyvisa
 from pyvisa import VisaIOError  # Here is the error handle to use...
+from tracing import tracer
+import numpy as np
+import threading
+import atexit
 import yaml
+import time
 import os
 
 
@@ -25,62 +30,232 @@ def CreateInstance(item):
     return Client(instr)
 
 
+def BinaryDtype(datatype='d', is_big_endian=False):
+    """
+    :param datatype: 'f' for REAL32 or 'd' for REAL64 (struct format characters, as used by pyvisa)
+    :return: numpy dtype with the requested byte order
+    """
+    return np.dtype(datatype).newbyteorder('>' if is_big_endian else '<')
+
+
+def SimOptions(instr_info):
+    """
+    Picks the settings of a simulated instrument (latency, noise, tau, gain, seed) out of its instrument configuration
+    """
+    return {key: instr_info[key] for key in ('latency', 'noise', 'tau', 'gain', 'seed') if key in instr_info}
+
+
+class SessionPool:
+    """
+    Process-wide pool of open VISA sessions keyed by resource string (TCPIP SOCKET, VXI-11 INSTR, GPIB, NIGHTHAWK).
+
+    One ResourceManager is shared by the process and each resource is opened and identified (*IDN?) only once.
+    Repeated requests for the same resource string, from any Client instance, are handed the already-open session so
+    repeated sweeps reuse connections instead of reconnecting.
+
+    A session that has sat idle for longer than max_idle seconds is health-checked (*IDN?) before it is handed out
+    again. Sessions that fail the check are evicted (closed and dropped) and reopened.
+
+    Opening and health-checking a resource only holds the lock of that resource, so a slow or unreachable instrument
+    does not hold up the other instruments being acquired in the meantime.
+
+    Every Client of a resource talks over the same session, so each session carries an I/O lock. Client.query holds it
+    from the write to the end of the read, so readings taken from other threads do not get each other's responses. A
+    session is opened with one read termination and timeout, and a request for the same resource with a different
+    configuration raises ValueError instead of silently using the settings of whoever opened it first.
+
+    session dict --> {'INSTR': resource, 'identity': '*IDN? response', 'prompt': bool, 'read_termination': str,
+                      'timeout': int, 'lock': RLock held for a write and its read, 'last_used': float}
+    """
+
+    def __init__(self, max_idle=30.0, attempts=5):
+        self.rm = None
+        self.sessions = {}
+        self.locks = {}  # {resource string: lock held while the resource is opened or health-checked}
+        self.max_idle = max_idle  # seconds
+        self.attempts = attempts
+        self.lock = threading.Lock()
+
+    def resource_manager(self):
+        with self.lock:
+            if self.rm is None:
+                self.rm = pyvisa.ResourceManager()
+            return self.rm
+
+    def acquire(self, resource, read_termination='\n', prompt=False, timeout=3000, options=None):
+        """
+        Returns an open, identified session for the resource string. Opens a new session on first use.
+
+        :param resource: VISA resource string such as 'TCPIP::10.205.92.67::3490::SOCKET' or 'GPIB0::6::INSTR'
+        :param read_termination: read termination character of the session
+        :param prompt: True if the instrument answers with a prompt (NIGHTHAWK '>') that must be consumed after opening
+        :param timeout: VISA timeout in milliseconds
+        :param options: keyword arguments for simulated (SIM::) resources. See simulator.open_resource
+        :return: session dict, or None if the resource could not be opened
+        """
+        with self.lock:
+            resource_lock = self.locks.setdefault(resource, threading.Lock())
+
+        with resource_lock:
+            session = self.sessions.get(resource)
+            if session is not None and (session['read_termination'], session['timeout']) != (read_termination, timeout):
+                raise ValueError(f'{resource} is already open with read_termination={session["read_termination"]!r} '
+                                 f'and timeout={session["timeout"]}, not {read_termination!r} and {timeout}')
+            if session is not None and not self.is_alive(session):
+                print(f'Evicting dead session: {resource}')
+                self.evict(resource)
+                session = None
+
+            if session is None:
+                session = self.open(resource, read_termination, prompt, timeout, options)
+                if session is None:
+                    return None
+                with self.lock:
+                    self.sessions[resource] = session
+
+            session['last_used'] = time.time()
+            return session
+
+    def open(self, resource, read_termination='\n', prompt=False, timeout=3000, options=None):
+        for attempt in range(self.attempts):
+            try:
+                with tracer.span('connect', 'open_resource', instrument=resource, attempt=attempt + 1):
+                    INSTR = self.open_resource(resource, read_termination, options)
+                INSTR.timeout = timeout
+                if prompt:
+                    INSTR.read()  # consume the prompt sent on connection
+                identity = self._identify(INSTR, prompt)
+            except VisaIOError:
+                # https://github.com/pyvisa/pyvisa-py/issues/146#issuecomment-453695057
+                print(f'[attempt {attempt + 1}/{self.attempts}] - retrying connection to {resource}')
+            else:
+                return {'INSTR': INSTR, 'identity': identity, 'prompt': prompt, 'read_termination': read_termination,
+                        'timeout': timeout, 'lock': threading.RLock(), 'last_used': time.time()}
+        print(f'Failed to connect to resource: {resource}')
+        return None
+
+    def open_resource(self, resource, read_termination='\n', options=None):
+        if resource.startswith('SIM::'):
+            import simulator  # only needed when an instrument is configured with mode: SIM
+            return simulator.open_resource(resource, read_termination=read_termination, **(options or {}))
+        return self.resource_manager().open_resource(resource, read_termination=read_termination)
+
+    @staticmethod
+    def _identify(INSTR, prompt=False):
+        identity = INSTR.query('*IDN?')
+        if prompt:
+            identity = identity.split("\r")[0].lstrip()
+        return identity.strip()
+
+    def is_alive(self, session):
+        """
+        Sessions used within the last max_idle seconds are assumed alive. Older sessions must answer *IDN? first.
+        """
+        if time.time() - session['last_used'] < self.max_idle:
+            return True
+        try:
+            with session['lock']:
+                self._identify(session['INSTR'], session['prompt'])
+        except VisaIOError:
+            return False
+        return True
+
+    def release(self, resource):
+        """
+        Hands a session back to the pool. The session is kept open for the next Client that asks for it.
+        """
+        with self.lock:
+            session = self.sessions.get(resource)
+            if session is not None:
+                session['last_used'] = time.time()
+
+    def evict(self, resource):
+        with self.lock:
+            session = self.sessions.pop(resource, None)
+        if session is not None:
+            try:
+                session['INSTR'].close()
+            except VisaIOError:
+                pass
+
+    def close_all(self):
+        with self.lock:
+            resources = list(self.sessions.keys())
+        for resource in resources:
+            self.evict(resource)
+
+
+pool = SessionPool()
+atexit.register(pool.close_all)
+
+
 class Client:
     def __init__(self, _instr_info):
         self.instr_info = _instr_info
         self.mode = self.instr_info['mode']
 
         self.INSTR = None
+        self.session = None
+        self.io_lock = threading.RLock()  # I/O lock of the pooled session once acquired
         self.address = None
         self.port = None
+        self.resource = None
+        self.read_termination = '\n'
 
-        self.rm = pyvisa.ResourceManager()
         self.timeout = 3000  # 1 (60e3) minute timeout
 
-        # TODO - verify this works as intended... Otherwise leave INSTR lines commented
         # if mode is SOCKET:
         if self.mode == 'SOCKET':
             self.address = self.instr_info['ip_address']
             self.port = self.instr_info['port']
-            # self.INSTR = self.rm.open_resource(f'TCPIP::{self.address}::{self.port}::SOCKET')
-            # self.INSTR.read_termination = '\n'
+            self.resource = f'TCPIP::{self.address}::{self.port}::SOCKET'
 
         # if mode is GPIB:
         elif self.mode == 'GPIB':
             self.address = self.instr_info['gpib_address']
-            # self.INSTR = self.rm.open_resource(f'GPIB0::{self.address}::INSTR')
+            self.resource = f'GPIB0::{self.address}::INSTR'
 
         # if mode is INSTR:
         elif self.mode == 'INSTR':
             self.address = self.instr_info['ip_address']
-            # self.INSTR = self.rm.open_resource(f'TCPIP::{self.address}::INSTR')
-            # self.INSTR.read_termination = '\n'
+            self.resource = f'TCPIP::{self.address}::INSTR'
 
         # if mode is SERIAL:
         elif self.mode == 'SERIAL':
             self.address = self.instr_info['ip_address']
-            # self.INSTR = self.rm.open_resource(f'{self.address}')
-            # self.INSTR.read_termination = '\n'
+            self.resource = f'{self.address}'
 
         # TODO - http://lampx.tugraz.at/~hadley/num/ch9/python/9.2.php
         # if mode is SERIAL:
         elif self.mode == 'USB':
             self.address = self.instr_info['ip_address']
-            # self.INSTR = self.rm.open_resource(f'{self.address}')
-            # self.INSTR.read_termination = '\n'
+            self.resource = f'{self.address}'
 
         # if mode is NIGHTHAWK:
         elif self.mode == 'NIGHTHAWK':
             self.address = self.instr_info['ip_address']
             self.port = self.instr_info['port']
-            # self.INSTR = self.rm.open_resource(f'TCPIP::{self.address}::{self.port}::SOCKET')
-            # self.INSTR.read_termination = '>'
-            # self.INSTR.read()
+            self.resource = f'TCPIP::{self.address}::{self.port}::SOCKET'
+            self.read_termination = '>'
+
+        # if mode is SIM:
+        elif self.mode == 'SIM':
+            # simulated instrument (see simulator.py). The address names the model, such as '5560A' or '34461A'
+            self.address = self.instr_info['ip_address']
+            self.resource = f'SIM::{self.address}'
         else:
             print('Failed to connect.')
+        self.name = self.instr_info.get('instr', self.resource)  # instrument shown in traces
+        self.settling = self.instr_info.get('settling') or {}  # options of every Settling.wait on this instrument
 
-        # TODO - Leave commented until after verifying visa communication works
-        # self.INSTR.timeout = self.timeout
+        # sessions are shared across Client instances through the process-wide pool
+        if self.resource is not None:
+            self.session = pool.acquire(self.resource, read_termination=self.read_termination,
+                                        prompt=(self.mode == 'NIGHTHAWK'), timeout=self.timeout,
+                                        options=SimOptions(self.instr_info))
+            if self.session is not None:
+                self.INSTR = self.session['INSTR']
+                self.io_lock = self.session['lock']
 
     def info(self):
         print(self.instr_info)
@@ -88,7 +263,8 @@ class Client:
     def identify(self):
         print()
         try:
-            identity = self.query('*IDN?')
+            # pooled sessions are identified once when opened
+            identity = self.session['identity'] if self.session else self.query('*IDN?')
             print(identity + '\n')
         # TODO - do not use bare except. how to find visa?
         # except visa.VisaIOError:
@@ -96,29 +272,203 @@ class Client:
             print('Failed to connect to address: ' + self.address)
 
     def write(self, cmd):
-        self.INSTR.write(f'{cmd}')
+        with self.io_lock, tracer.span('write', cmd, instrument=self.name):
+            self.INSTR.write(f'{cmd}')
 
     def read(self):
         response = None
-        if self.mode == 'NIGHTHAWK':
-            response = (self.INSTR.read().split("\r")[0].lstrip())
-        else:
-            response = self.INSTR.read()
+        with self.io_lock, tracer.span('read', 'read', instrument=self.name):
+            if self.mode == 'NIGHTHAWK':
+                response = (self.INSTR.read().split("\r")[0].lstrip())
+            else:
+                response = self.INSTR.read()
         return response
 
     def query(self, cmd):
         response = None
-        if self.mode == 'NIGHTHAWK':
-            response = (self.INSTR.query(f'{cmd}')).split("\r")[0].lstrip()
-        else:
-            response = (self.INSTR.query(f'{cmd}'))
+        # the lock is held from the write to the end of the read so no other thread's response is read instead
+        with self.io_lock, tracer.span('query', cmd, instrument=self.name):
+            if self.mode == 'NIGHTHAWK':
+                response = (self.INSTR.query(f'{cmd}')).split("\r")[0].lstrip()
+            else:
+                response = (self.INSTR.query(f'{cmd}'))
         return response
 
+    def read_binary(self, datatype='d', is_big_endian=False, expect_termination=True):
+        """
+        Reads an IEEE 488.2 definite-length block (#<n><length><data>). The header is read first so the data bytes are
+        read in one transfer of exactly <length> bytes, which is not cut short by termination characters inside the
+        data. The returned array is a read-only view onto that receive buffer.
+
+        :param datatype: 'f' for REAL32 or 'd' for REAL64
+        :param is_big_endian: byte order of the data (most SCPI instruments default to big endian)
+        :param expect_termination: consume the termination character the instrument sends after the block
+        :return: numpy array
+        """
+        with self.io_lock:
+            mark = self.INSTR.read_bytes(1, break_on_termchar=False)
+            while mark != b'#':
+                mark = self.INSTR.read_bytes(1, break_on_termchar=False)
+            digits = int(self.INSTR.read_bytes(1, break_on_termchar=False))
+            if digits == 0:
+                raise ValueError('Indefinite-length blocks (#0) are not supported')
+            length = int(self.INSTR.read_bytes(digits, break_on_termchar=False))
+            data = self.INSTR.read_bytes(length, break_on_termchar=False)
+
+            if self.mode == 'NIGHTHAWK':
+                self.INSTR.read()  # discard everything up to the prompt
+            elif expect_termination and self.INSTR.read_termination:
+                self.INSTR.read_bytes(len(self.INSTR.read_termination), break_on_termchar=False)
+
+        return np.frombuffer(data, dtype=BinaryDtype(datatype, is_big_endian))
+
+    def query_binary(self, cmd, datatype='d', is_big_endian=False, expect_termination=True):
+        with self.io_lock, tracer.span('query', cmd, instrument=self.name, binary=True):
+            self.INSTR.write(f'{cmd}')
+            return self.read_binary(datatype, is_big_endian, expect_termination)
+
     def close(self):
-        self.INSTR.close()
+        """
+        Returns the session to the pool rather than closing it. Use pool.evict(resource) to force a disconnect.
+        """
+        if self.session is not None:
+            pool.release(self.resource)
+            self.session = None
+            self.INSTR = None
+
+
+class Settling:
+    """
+    Waits for an instrument reading to settle instead of sleeping a fixed time before every measurement. The reading is
+    polled every 'interval' seconds until the last 'window' readings meet every enabled stability criterion:
+        > rtol  - peak-to-peak spread of the readings, relative to their mean
+        > slope - least-squares slope of the readings per second, relative to their mean
+    atol is an absolute floor on both tolerances for readings near zero. Set a criterion to None to disable it.
+
+    With opc=True, *OPC? is polled first so pending operations (range changes, relay switching) complete before the
+    reading is polled. A hard timeout bounds the whole wait.
+
+    The arguments are only defaults. A noisy reading such as a distortion residual never meets a tight rtol and would
+    wait out the whole timeout, so any of them can be overridden for every wait on one instrument with a 'settling'
+    entry in its instrument configuration, or for a single wait:
+
+        k34461A:
+          mode: INSTR
+          ...
+          settling: {rtol: 0.01, timeout: 2}
+
+    The waits are recorded until reset(), which returns the time spent settling so it can be logged for each setpoint.
+    Readings taken concurrently settle at the same time, so waits that overlap are only counted once.
+    """
+    options = ('rtol', 'slope', 'atol', 'window', 'interval', 'timeout', 'opc')
+
+    def __init__(self, rtol=100e-6, slope=None, atol=0., window=3, interval=0.2, timeout=5., opc=False):
+        self.rtol = rtol
+        self.slope = slope  # 1/s
+        self.atol = atol
+        self.window = window
+        self.interval = interval  # seconds
+        self.timeout = timeout  # seconds
+        self.opc = opc
+
+        self.waits = []  # (start, end) of every wait since the last reset()
+        self.lock = threading.Lock()
+
+    def wait(self, instrument, cmd, **options):
+        """
+        :param options: overrides of rtol, slope, atol, window, interval, timeout or opc for this wait only
+        :return: seconds waited
+        """
+        unknown = set(options) - set(self.options)
+        if unknown:
+            raise TypeError(f'Unknown settling options: {", ".join(sorted(unknown))}')
+        config = {name: options.get(name, getattr(self, name)) for name in self.options}
+        with tracer.span('settling', cmd, instrument=getattr(instrument, 'name', '')):
+            return self._wait(instrument, cmd, **config)
+
+    def _wait(self, instrument, cmd, rtol, slope, atol, window, interval, timeout, opc):
+        start = time.time()
+        if opc:
+            self.wait_opc(instrument, start, interval, timeout)
+
+        readings, stamps = [], []
+        while time.time() - start < timeout:
+            readings.append(float(instrument.query(cmd).split(',')[0]))
+            stamps.append(time.time())
+            if len(readings) >= window and self.is_settled(readings[-window:], stamps[-window:], rtol, slope, atol):
+                break
+            time.sleep(interval)
+        else:
+            print(f'[Settling] {cmd} did not settle within {timeout} s')
+
+        end = time.time()
+        with self.lock:
+            self.waits.append((start, end))
+        return end - start
+
+    @staticmethod
+    def wait_opc(instrument, start, interval, timeout):
+        while time.time() - start < timeout:
+            try:
+                if instrument.query('*OPC?').strip().lstrip('+') == '1':
+                    return
+            except VisaIOError:
+                pass  # *OPC? blocks until complete and may time out on long operations
+            time.sleep(interval)
+
+    @staticmethod
+    def is_settled(readings, stamps, rtol, slope, atol):
+        y = np.asarray(readings)
+        mean = abs(y.mean())
+        if rtol is not None and np.ptp(y) > max(rtol * mean, atol):
+            return False
+        if slope is not None:
+            t = np.asarray(stamps) - stamps[0]
+            if t[-1] > 0 and abs(np.polyfit(t, y, 1)[0]) > max(slope * mean, atol):
+                return False
+        return True
+
+    def reset(self):
+        """
+        :return: seconds spent settling since the last reset, counting the time covered by overlapping waits once
+        """
+        with self.lock:
+            waits, self.waits = sorted(self.waits), []
+        elapsed, covered = 0., 0.
+        for start, end in waits:
+            if end > covered:
+                elapsed += end - max(start, covered)
+                covered = end
+        return elapsed
 
 
 def initialize(size):
     instr_list = [None for m in range(size)]
     config_dict = ReadConfig()
     return tuple(CreateInstance(config_dict[i]) for i in range(size))
+
+
+if __name__ == "__main__":
+    import asyncio
+    import asyncunivisa
+
+    # loopback check of read_binary/query_binary against the TCP stand-in instruments of asyncunivisa
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    def serve(prompt):
+        server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(lambda r, w: asyncunivisa._stand_in(r, w, prompt=prompt, latency=0.), '127.0.0.1', 0),
+            loop).result()
+        return server.sockets[0].getsockname()[1]
+
+    for mode in ('SOCKET', 'NIGHTHAWK'):
+        port = serve(prompt=(mode == 'NIGHTHAWK'))
+        instrument = Client({'instr': mode, 'mode': mode, 'ip_address': '127.0.0.1', 'port': port})
+        instrument.identify()
+        for attempt in range(2):  # the second block checks that the termination after the first one was consumed
+            block = instrument.query_binary('FETC?', datatype='d', is_big_endian=True)
+            assert block.size == 1000 and abs(block.mean() - 1.0) < 1e-6, (block.size, block.mean())
+        assert abs(float(instrument.query('READ?')) - 1.0) < 1e-4
+        print(f'{mode} binary block: {block.size} readings, mean {block.mean():.9f}')
+        pool.evict(instrument.resource)
@@ -0,0 +1,75 @@
+import time
+import wx
+
+"""
+Redraw scheduling for the plots of leviathan.
+
+Drawing a matplotlib canvas on every change ties the rate of whatever produces the changes to the time a draw takes. A
+sweep that called plot_data after every row waited for each draw, and drew from its worker thread besides. Instead,
+whoever changes the data only requests a redraw, which sets a flag and returns. A timer on the GUI thread redraws a
+requested plot at most rate times per second, so any number of requests between two ticks cost one draw:
+
+    self.plot_scheduler = RedrawScheduler(self, self.draw_plot, rate=10)
+    ...
+    self.plot_scheduler.request()  # from any thread
+
+A draw that takes longer than the frame budget (1 / rate) backs the scheduler off: the next draw waits for three times
+as long as the last draw took (up to max_interval), so the GUI thread spends at most about a quarter of its time
+drawing however complex the plot gets. Fast draws bring the interval back down to the frame budget.
+
+Generated test scripts import RedrawScheduler from here.
+"""
+
+
+class RedrawScheduler:
+    def __init__(self, window, draw, rate=10, max_interval=2.):
+        """
+        :param window: window owning the timer. The timer stops when the window is destroyed
+        :param draw: redraws the plot. Always called on the GUI thread
+        :param rate: most redraws per second
+        :param max_interval: longest wait between two draws of a requested plot when backed off, in seconds
+        """
+        self.window = window
+        self.draw = draw
+        self.budget = 1. / rate
+        self.interval = self.budget
+        self.max_interval = max_interval
+        self.dirty = False
+        self.last = 0.
+
+        self.timer = wx.Timer(window)
+        window.Bind(wx.EVT_TIMER, self.on_timer, self.timer)
+        window.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
+        self.timer.Start(max(1, int(self.budget * 1000)))
+
+    def request(self):
+        # safe from any thread. Only sets a flag
+        self.dirty = True
+
+    def on_timer(self, event):
+        if self.dirty and time.perf_counter() - self.last >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Draws now, on the GUI thread, and adapts the interval to the time the draw took.
+        """
+        self.dirty = False
+        start = time.perf_counter()
+        try:
+            self.draw()
+        finally:
+            self.last = time.perf_counter()
+            elapsed = self.last - start
+            if elapsed > self.budget:
+                self.interval = min(self.max_interval, 3 * elapsed)
+            else:
+                self.interval = max(self.budget, self.interval / 2)
+
+    def stop(self):
+        self.timer.Stop()
+
+    def on_destroy(self, event):
+        if event.GetEventObject() is self.window:
+            self.timer.Stop()
+        event.Skip()
@@ -0,0 +1,343 @@
+from pyvisa import VisaIOError, constants
+import numpy as np
+import threading
+import time
+import re
+from collections import deque
+
+"""
+Simulated instruments for running test scripts without hardware.
+
+Selected with 'mode: SIM' in instrument_config.yaml. The address field names the model being simulated:
+
+    f5560A:
+      ip_address: '5560A'
+      port: ''
+      gpib_address: ''
+      mode: SIM
+      latency: 0.005    # optional. seconds per query
+      noise: 1.0e-6     # optional. relative standard deviation of each reading
+      tau: 0.2          # optional. time constant (s) of the settling curve after an output change
+      gain: 1.0         # optional. meters only. reading = gain * output level
+
+Every simulated instrument in the process looks at the same Bench, so a meter reads back whatever the simulated
+calibrator is sourcing. After OUT, OPER or STBY the bench level follows an exponential settling curve towards the new
+target. SimInstrument mimics the parts of a pyvisa resource the clients use (write, read, query, read_bytes, timeout,
+read_termination, close), so it is handed out by the session pools exactly like a real session.
+
+Supported SCPI subset (short or long form, in any case):
+    > common   - *IDN?, *RST, *CLS, *WAI, *OPC, *OPC?, *TRG, SYST:REM, SYST:ERR?, BEEP
+    > 5560A    - OUT <value><A|V|Hz>[, <value><Hz>], OPER, STBY, OPER?, OUT?
+    > meters   - VAL?, READ?, MEAS?, FETC?, TRIG, INIT, CONF:VOLT:DC (and any other CONF or MEAS), TRIG:SOUR, TRIG:COUN,
+                 SAMP:COUN, FORM[:DATA], FORM:BORD
+
+Compound commands follow the SCPI path rules, so strings that a real instrument rejects are rejected here too. After a
+';' the next header is relative to the subsystem of the previous one ('TRIG:SOUR IMM;COUN 1' sets TRIG:COUN), a header
+starting with ':' goes back to the root ('TRIG:COUN 1;:SAMP:COUN 5'), and common commands (*...) leave the path alone.
+A header that does not resolve to a supported command ('TRIG:SOUR IMM;SAMP:COUN 5' would be TRIG:SAMP:COUN) puts
+-113 "Undefined header" in the error queue read by SYST:ERR?, is reported on stdout, and discards the rest of the
+command. A query discarded this way never answers, so reading its response times out.
+"""
+
+COMMON_HEADERS = ('*IDN?', '*RST', '*CLS', '*WAI', '*OPC', '*OPC?', '*TRG', 'SYSTem:REMote', 'SYSTem:ERRor[:NEXT]?',
+                  'BEEP')
+SOURCE_HEADERS = ('OUTput', 'OUTput?', 'OPERate', 'OPERate?', 'STBY')
+METER_HEADERS = ('VAL?', 'READ?', 'FETCh?', 'MEASure...?', 'CONFigure...', 'TRIGger', 'INITiate', 'TRIGger:SOURce',
+                 'TRIGger:COUNt', 'SAMPle:COUNt', 'FORMat[:DATA]', 'FORMat:BORDer')
+
+MODELS = {
+    '5560A': {'identity': 'FLUKE,5560A,SIM00001,1.0', 'source': True},
+    '5790A': {'identity': 'FLUKE,5790A,SIM00002,1.0', 'source': False},
+    '34461A': {'identity': 'Keysight Technologies,34461A,SIM00003,A.02.14-02.40-02.14-00.49-01-01', 'source': False},
+    '8846A': {'identity': 'FLUKE,8846A,SIM00004,1.0', 'source': False},
+}
+
+PREFIXES = {'N': 1e-9, 'U': 1e-6, 'M': 1e-3, 'K': 1e3}
+QUANTITY = re.compile(r'([-+]?(?:\d+\.?\d*|\.\d+)(?:E[-+]?\d+)?)\s*([NUMK]?)(HZ|A|V)?', re.IGNORECASE)
+
+
+class Bench:
+    """
+    Output state of the simulated calibrator shared by every simulated instrument. The level seen by the meters moves
+    from where it was at the last change towards the new target as start + (target - start) * (1 - exp(-t / tau)).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.amplitude = 0.
+        self.unit = 'A'
+        self.frequency = 0.
+        self.operate = False
+        self.tau = 0.2  # seconds
+        self.start = 0.
+        self.changed = time.time()
+
+    def reset(self):
+        with self.lock:
+            self.start = self._level(time.time())
+            self.amplitude, self.frequency, self.operate = 0., 0., False
+            self.changed = time.time()
+
+    def _target(self):
+        return self.amplitude if self.operate else 0.
+
+    def _level(self, now):
+        if self.tau <= 0:
+            return self._target()
+        return self._target() + (self.start - self._target()) * np.exp(-(now - self.changed) / self.tau)
+
+    def level(self, now=None):
+        with self.lock:
+            return self._level(time.time() if now is None else now)
+
+    def set_output(self, amplitude=None, unit=None, frequency=None, operate=None):
+        with self.lock:
+            now = time.time()
+            self.start = self._level(now)
+            if amplitude is not None:
+                self.amplitude = amplitude
+            if unit is not None:
+                self.unit = unit
+            if frequency is not None:
+                self.frequency = frequency
+            if operate is not None:
+                self.operate = operate
+            self.changed = now
+
+
+bench = Bench()
+
+
+class Headers:
+    """
+    The headers an instrument understands, in SCPI notation: the short form in upper case followed by the rest of the
+    long form in lower case, [optional nodes], a trailing '?' for queries and '...' for any nodes below ('MEASure...?'
+    takes MEAS:VOLT:AC?). A header received resolves to the short form of the one it matches without its optional
+    nodes, such as 'SAMPLE:COUNT' --> 'SAMP:COUN' and 'FORM:DATA' --> 'FORM', or to None if it is undefined.
+    """
+
+    def __init__(self, specs):
+        self.specs = [self.compile(spec) for spec in specs]
+        self.resolved = {}  # {header received: short form or None}
+
+    @staticmethod
+    def compile(spec):
+        query = spec.endswith('?')
+        spec = spec.rstrip('?')
+        below = spec.endswith('...')
+        nodes = [(re.match(r'[*A-Z]*', name).group(), name.upper(), bool(optional))
+                 for optional, name in re.findall(r'(\[?):?([*A-Za-z]+)', spec)]
+        short = ':'.join(node for node, _, optional in nodes if not optional) + ('?' if query else '')
+        return query, below, nodes, short
+
+    def resolve(self, header):
+        if header not in self.resolved:
+            query = header.endswith('?')
+            received = header.rstrip('?').split(':')
+            self.resolved[header] = next((short for is_query, below, nodes, short in self.specs
+                                          if is_query == query and self.match(received, nodes, below)), None)
+        return self.resolved[header]
+
+    def match(self, received, nodes, below):
+        if not nodes:
+            return below or not received
+        (short, long, optional), rest = nodes[0], nodes[1:]
+        if received and received[0] in (short, long) and self.match(received[1:], rest, below):
+            return True
+        return optional and self.match(received, rest, below)
+
+
+class SimInstrument:
+    def __init__(self, model, read_termination='\n', latency=0.005, noise=1e-6, tau=None, gain=1.0, seed=None):
+        self.model = model
+        self.identity = MODELS[model]['identity']
+        self.is_source = MODELS[model]['source']
+        self.read_termination = read_termination or '\n'
+        self.timeout = 3000  # milliseconds. Kept for parity with pyvisa resources
+        self.latency = float(latency)
+        self.noise = float(noise)
+        self.gain = float(gain)
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+
+        self.samples = 1
+        self.binary = False
+        self.big_endian = True
+        self.errors = deque()
+        self.headers = Headers(COMMON_HEADERS + (SOURCE_HEADERS if self.is_source else METER_HEADERS))
+
+        if tau is not None and self.is_source:
+            bench.tau = float(tau)
+
+    # pyvisa resource interface ----------------------------------------------------------------------------------------
+    def write(self, cmd):
+        with self.lock:
+            for header, args in self.parse(cmd):
+                command = self.headers.resolve(header)
+                if command is None:
+                    self.error(-113, 'Undefined header', header)
+                    break
+                response = self.dispatch(command, args)
+                if response is not None:
+                    if self.latency:
+                        time.sleep(self.latency)
+                    if isinstance(response, str):
+                        response = response.encode()
+                    self.buffer += response + self.read_termination.encode()
+
+    def read(self):
+        with self.lock:
+            end = self.buffer.find(self.read_termination.encode())
+            if end < 0:
+                raise VisaIOError(constants.StatusCode.error_timeout)
+            response = bytes(self.buffer[:end])
+            del self.buffer[:end + len(self.read_termination)]
+        return response.decode()
+
+    def query(self, cmd):
+        self.write(cmd)
+        return self.read()
+
+    def read_bytes(self, count, break_on_termchar=False):
+        with self.lock:
+            if len(self.buffer) < count:
+                raise VisaIOError(constants.StatusCode.error_timeout)
+            data = bytes(self.buffer[:count])
+            del self.buffer[:count]
+        return data
+
+    def close(self):
+        self.buffer.clear()
+
+    # command handling -------------------------------------------------------------------------------------------------
+    @staticmethod
+    def parse(cmd):
+        """
+        Splits a command into its headers, each resolved to its full path:
+        'TRIG:SOUR IMM;COUN 1;:SAMP:COUN 5' --> [('TRIG:SOUR', 'IMM'), ('TRIG:COUN', '1'), ('SAMP:COUN', '5')]
+        """
+        path = []
+        for part in cmd.split(';'):
+            part = part.strip()
+            if part:
+                header, _, args = part.partition(' ')
+                header = header.upper()
+                if not header.startswith('*'):
+                    if header.startswith(':'):
+                        path, header = [], header[1:]
+                    nodes = path + header.split(':')
+                    path, header = nodes[:-1], ':'.join(nodes)
+                yield header, args.strip()
+
+    def error(self, code, message, header):
+        self.errors.append(f'{code},"{message}"')
+        print(f'[SIM {self.model}] {code},"{message}" ({header})')
+
+    def dispatch(self, header, args):
+        if header == '*IDN?':
+            return self.identity
+        elif header == '*OPC?':
+            return '1'
+        elif header == '*RST':
+            self.samples, self.binary = 1, False
+            if self.is_source:
+                bench.reset()
+        elif header == '*CLS':
+            self.errors.clear()
+        elif header == 'SYST:ERR?':
+            return self.errors.popleft() if self.errors else '+0,"No error"'
+        elif header in ('*WAI', '*OPC', '*TRG', 'SYST:REM', 'BEEP'):
+            pass
+        elif self.is_source:
+            return self.source_command(header, args)
+        else:
+            return self.meter_command(header, args)
+        return None
+
+    def source_command(self, header, args):
+        if header == 'OUT':
+            amplitude, unit, frequency = None, None, None
+            for value, prefix, suffix in QUANTITY.findall(args):
+                value = float(value) * PREFIXES.get(prefix.upper(), 1.)
+                if suffix.upper() == 'HZ':
+                    frequency = value
+                else:
+                    amplitude, unit = value, (suffix.upper() or bench.unit)
+            bench.set_output(amplitude=amplitude, unit=unit, frequency=frequency)
+        elif header == 'OPER?':
+            return str(int(bench.operate))
+        elif header == 'OPER':
+            bench.set_output(operate=True)
+        elif header == 'STBY':
+            bench.set_output(operate=False)
+        elif header == 'OUT?':
+            return f'{bench.amplitude:.6E},{bench.unit},{bench.frequency:.6E}'
+        return None
+
+    def meter_command(self, header, args):
+        if header in ('VAL?', 'READ?', 'MEAS?', 'FETC?'):
+            if header == 'VAL?':
+                # the 5790A answers with the reading followed by its unit
+                return f'{self.reading()[0]:.7E},{bench.unit}'
+            data = self.reading(self.samples)
+            if self.binary:
+                return self.block(data)
+            return ','.join(f'{value:.9E}' for value in data)
+        elif header == 'SAMP:COUN':
+            self.samples = max(1, int(float(args)))
+        elif header == 'FORM':
+            self.binary = args.upper().startswith('REAL')
+        elif header == 'FORM:BORD':
+            self.big_endian = args.upper().startswith('NORM')
+        return None
+
+    def reading(self, samples=1):
+        level = self.gain * bench.level()
+        return level + abs(level) * self.noise * self.rng.standard_normal(samples)
+
+    def block(self, data):
+        data = np.asarray(data, dtype='>f8' if self.big_endian else '<f8').tobytes()
+        length = str(len(data)).encode()
+        return b'#' + str(len(length)).encode() + length + data
+
+
+def open_resource(resource, read_termination='\n', **options):
+    """
+    Counterpart to pyvisa.ResourceManager.open_resource for 'SIM::<model>' resource strings. The model is found in the
+    address, so 'SIM::5560A' and 'SIM::34461A-2' both work.
+
+    :param options: latency, noise, tau, gain and seed. See SimInstrument
+    """
+    address = resource.split('::', 1)[-1]
+    for model in MODELS:
+        if model in address.upper():
+            return SimInstrument(model, read_termination=read_termination, **options)
+    raise VisaIOError(constants.StatusCode.error_resource_not_found)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _demo():
+    import pyunivisa
+
+    f5560A = pyunivisa.Client({'ip_address': '5560A', 'port': '', 'gpib_address': '', 'mode': 'SIM'})
+    f5790A = pyunivisa.Client({'ip_address': '5790A', 'port': '', 'gpib_address': '', 'mode': 'SIM'})
+    k34461A = pyunivisa.Client({'ip_address': '34461A', 'port': '', 'gpib_address': '', 'mode': 'SIM'})
+    for instrument in (f5560A, f5790A, k34461A):
+        instrument.identify()
+
+    settling = pyunivisa.Settling(rtol=10e-6, interval=0.05)
+    k34461A.write('*RST;CONF:VOLT:DC')
+    for cur in (0.001, 0.01, 0.1):
+        f5560A.write(f'out {cur}A;out 1000Hz ')
+        f5560A.write('OPER')
+        elapsed = settling.wait(f5790A, 'VAL?')
+        nom = float(f5790A.query('VAL?').split(',')[0])
+        k34461A.write('SAMP:COUN 10')
+        buffer = np.fromstring(k34461A.query('READ?'), sep=',')
+        print(f'{cur:.3f} A --> 5790A {nom:.7f}, 34461A {buffer.mean():.7f} (settled in {elapsed:.2f} s)')
+        f5560A.write('STBY')
+
+
+if __name__ == "__main__":
+    _demo()
@@ -0,0 +1,86 @@
+import itertools
+
+"""
+Execution order of sweeps that iterate over all permutations of their input variables.
+
+Nested loops in column order restart the inner variables from their first value every time an outer variable steps,
+and the outer variables change in whatever order they were typed in. On a calibrator every change of range or frequency
+costs a relay switch and a settling time, so the sweep is reordered instead:
+
+    > nesting_order     - each variable can be given a cost (relative price of changing it). The most expensive
+                          variable becomes the outermost loop so it changes least often. Ties keep the user's order.
+    > serpentine_product - the loops run forward and backward alternately (reflected mixed-radix Gray code), so between
+                          two setpoints exactly one variable changes and it only steps to a neighbouring value.
+
+Every setpoint keeps its index in the unordered permutation, itertools.product(*series) in the user's column order, so
+the collected rows can be mapped back (and sorted) to the order the user asked for.
+"""
+
+
+def nesting_order(names, costs=None):
+    """
+    :param names: input variables in the user's column order
+    :param costs: {variable: cost}. Variables without a cost have a cost of 1
+    :return: positions of the variables from the outermost loop to the innermost
+    """
+    costs = costs or {}
+    return sorted(range(len(names)), key=lambda idx: -float(costs.get(names[idx], 1.)))
+
+
+def serpentine_product(*series, order=None):
+    """
+    Yields (index, values) for every combination of the series. values are in the order the series are given and index
+    is the position of the same combination in itertools.product(*series).
+
+    [EXAMPLE] serpentine_product([1, 2], 'abc') --> (0, (1, 'a')), (1, (1, 'b')), (2, (1, 'c')),
+                                                    (5, (2, 'c')), (4, (2, 'b')), (3, (2, 'a'))
+
+    :param order: positions of the series from the outermost loop to the innermost. Defaults to the given order
+    """
+    order = list(range(len(series))) if order is None else list(order)
+    sizes = [len(values) for values in series]
+    if not series or 0 in sizes:
+        return
+    strides = [1] * len(series)
+    for axis in range(len(series) - 2, -1, -1):
+        strides[axis] = strides[axis + 1] * sizes[axis + 1]
+
+    position = [0] * len(series)
+    step = [1] * len(series)
+    while True:
+        yield sum(p * s for p, s in zip(position, strides)), tuple(values[p] for values, p in zip(series, position))
+
+        # advance the innermost loop that can still move. A loop that reached its end reverses instead
+        for axis in reversed(order):
+            if 0 <= position[axis] + step[axis] < sizes[axis]:
+                position[axis] += step[axis]
+                break
+            step[axis] = -step[axis]
+        else:
+            return
+
+
+def transitions(points, costs=None):
+    """
+    Total cost of the changes between consecutive setpoints. Used to compare an ordering against plain nested loops.
+
+    :param points: [(variable values), ...] in execution order
+    :param costs: one cost per variable, in the same order as the values. Defaults to 1 for each variable
+    """
+    total = 0.
+    for previous, current in zip(points, points[1:]):
+        total += sum((1. if costs is None else costs[axis])
+                     for axis, (a, b) in enumerate(zip(previous, current)) if a != b)
+    return total
+
+
+if __name__ == "__main__":
+    ranges, freqs, currents = [1, 2, 3], [50, 1000, 10000], [0.1, 0.5, 1.0]
+    costs = {'range': 10., 'freq': 5., 'cur': 1.}
+    order = nesting_order(['cur', 'freq', 'range'], costs)
+
+    nested = list(itertools.product(currents, freqs, ranges))
+    planned = [values for _, values in serpentine_product(currents, freqs, ranges, order=order)]
+    weights = [costs['cur'], costs['freq'], costs['range']]
+    print(f'nested loops: {transitions(nested, weights):.0f}')
+    print(f'serpentine:   {transitions(planned, weights):.0f}')
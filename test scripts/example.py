@@ -1,35 +1,19 @@
+from pathlib import Path
 import time
+import sys
 import numpy as np
 
+try:
+    import ipc  # on the PYTHONPATH when run from MainLauncher
+except ImportError:
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    import ipc
+
 """
-Progress Bar!
-+ for more information: https://stackoverflow.com/a/34325723
+Example test script. Rows, metadata and progress are published to MainLauncher through ipc.channel
 """
 
 
-def printProgressBar(iteration, total, prefix='', suffix='', decimals=1, length=100, fill='█', printEnd='\n'):
-    """
-    Call in a loop to create terminal progress bar
-    @params:
-        iteration   - Required  : current iteration (Int)
-        total       - Required  : total iterations (Int)
-        prefix      - Optional  : prefix string (Str)
-        suffix      - Optional  : suffix string (Str)
-        decimals    - Optional  : positive number of decimals in percent complete (Int)
-        length      - Optional  : character length of bar (Int)
-        fill        - Optional  : bar fill character (Str)
-        printEnd    - Optional  : end character (e.g. "", "\r", "\r\n") (Str)
-    """
-    percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
-    filledLength = int(length * iteration // total)
-    bar = fill * filledLength + '-' * (length - filledLength)
-    # print('\r%s |%s| %s%% %s' % (prefix, bar, percent, suffix), end=printEnd)  # how it should work in a normal shell
-    print('%s |%s| %s%% %s' % (prefix, bar, percent, suffix), end=printEnd)
-    # Print New Line on Complete
-    if iteration == total:
-        print()
-
-
 def main():
     """
     Here's a terrible bug that took some time to resolve:
@@ -126,9 +110,9 @@ def main():
 
     items = len(x)
     data = [[int(0)] * 6] * items
+    ipc.channel.metadata(header=['index', 't', 'y', 'x', 'y', 'z'], selection=selection)
 
-    # Initial call to print 0% progress
-    printProgressBar(0, items, prefix='Progress:', suffix='Complete', length=39)
+    ipc.channel.progress(0, items)
     for i in range(items):
         t = i * 0.0005
         data[i][0] = i
@@ -139,10 +123,9 @@ def main():
         data[i][4] = y[i]
         data[i][5] = z[i]
 
-        print(f'[TABLE] {data[i]}')
+        ipc.channel.row(data[i])
 
-        # Update Progress Bar
-        printProgressBar(i + 1, items, prefix='Progress:', suffix='Complete', length=39)
+        ipc.channel.progress(i + 1, items)
 
         time.sleep(0.1)
 
@@ -0,0 +1,67 @@
+import asyncunivisa
+from asyncunivisa import AsyncClient
+
+import asyncio
+import unittest
+import numpy as np
+
+"""
+Checks AsyncClient against the local TCP stand-in instrument of asyncunivisa, served on 127.0.0.1 with a free port.
+
+    python -m unittest test_asyncunivisa
+"""
+
+
+class StandInTest(unittest.IsolatedAsyncioTestCase):
+    prompt = False
+    mode = 'SOCKET'
+
+    async def asyncSetUp(self):
+        self.server = await asyncio.start_server(
+            lambda r, w: asyncunivisa._stand_in(r, w, prompt=self.prompt, latency=0.), '127.0.0.1', 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.instrument = await AsyncClient({'ip_address': '127.0.0.1', 'port': port, 'mode': self.mode}).connect()
+
+    async def asyncTearDown(self):
+        await self.instrument.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_query(self):
+        self.assertEqual(await self.instrument.query('*IDN?'), 'FLUKE,STAND-IN,0,1.0')
+        self.assertAlmostEqual(float(await self.instrument.query('READ?')), 1.0, delta=1e-4)
+
+    async def test_query_binary(self):
+        for attempt in range(2):  # the second block only parses if the termination after the first one was consumed
+            block = await self.instrument.query_binary('FETC?', datatype='d', is_big_endian=True)
+            self.assertEqual(block.size, 1000)
+            self.assertEqual(block.dtype, np.dtype('>f8'))
+            self.assertAlmostEqual(block.mean(), 1.0, delta=1e-6)
+        self.assertEqual(await self.instrument.query('*IDN?'), 'FLUKE,STAND-IN,0,1.0')
+
+    async def test_concurrent_queries(self):
+        # the lock of the client keeps each write together with its own read
+        responses = await asyncio.gather(*(self.instrument.query(cmd) for cmd in ('*IDN?', 'READ?') * 10))
+        self.assertEqual(responses[::2], ['FLUKE,STAND-IN,0,1.0'] * 10)
+        self.assertTrue(all(abs(float(response) - 1.0) < 1e-4 for response in responses[1::2]))
+
+
+class NighthawkStandInTest(StandInTest):
+    prompt = True
+    mode = 'NIGHTHAWK'
+
+    async def test_prompt_is_stripped(self):
+        # a NIGHTHAWK response arrives as '<response>\r\n>'. Only the response is returned
+        response = await self.instrument.query('*IDN?')
+        self.assertNotIn('>', response)
+        self.assertNotIn('\r', response)
+        self.assertEqual(response, 'FLUKE,STAND-IN,0,1.0')
+
+    async def test_write_consumes_prompt(self):
+        await self.instrument.write('OPER')
+        self.assertEqual(await self.instrument.read(), '')
+        self.assertEqual(await self.instrument.query('*IDN?'), 'FLUKE,STAND-IN,0,1.0')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import pyunivisa
+from pyunivisa import Client, pool
+
+import socketserver
+import threading
+import unittest
+import numpy as np
+
+"""
+Loopback checks of Client.read_binary/query_binary against a local TCP stand-in instrument served on 127.0.0.1 with a
+free port. The stand-in answers 'FETC? <numpy dtype>' with an IEEE 488.2 definite-length block of READINGS in that
+dtype, such as 'FETC? >f8' for big endian REAL64, and 'FETC:IND?' with an indefinite-length (#0) block.
+
+    python -m unittest test_pyunivisa
+"""
+
+READINGS = 1.0 + 0.25 * np.arange(100)  # exact in REAL32 and REAL64
+
+
+class StandIn(socketserver.StreamRequestHandler):
+    prompt = False
+
+    def send(self, response):
+        self.wfile.write(response + (b'\r\n>' if self.prompt else b'\n'))
+
+    def handle(self):
+        if self.prompt:
+            self.wfile.write(b'>')
+        for line in self.rfile:
+            cmd = line.decode().strip()
+            if cmd == '*IDN?':
+                self.send(b'FLUKE,STAND-IN,0,1.0')
+            elif cmd.startswith('FETC? '):
+                data = READINGS.astype(cmd.split()[1]).tobytes()
+                length = str(len(data)).encode()
+                self.send(b'#' + str(len(length)).encode() + length + data)
+            elif cmd == 'FETC:IND?':
+                self.send(b'#0' + READINGS.astype('>f8').tobytes())
+            elif self.prompt:
+                self.wfile.write(b'\r\n>')
+
+
+class NighthawkStandIn(StandIn):
+    prompt = True
+
+
+class BinaryBlockTest(unittest.TestCase):
+    handler = StandIn
+    mode = 'SOCKET'
+
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self.handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        port = self.server.server_address[1]
+        self.instrument = Client({'instr': self.mode, 'mode': self.mode, 'ip_address': '127.0.0.1', 'port': port})
+
+    def tearDown(self):
+        pool.evict(self.instrument.resource)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_query_binary(self):
+        for datatype in ('f', 'd'):
+            for is_big_endian in (True, False):
+                with self.subTest(datatype=datatype, is_big_endian=is_big_endian):
+                    dtype = pyunivisa.BinaryDtype(datatype, is_big_endian)
+                    block = self.instrument.query_binary(f'FETC? {dtype.str}', datatype, is_big_endian)
+                    self.assertEqual(block.dtype, dtype)
+                    np.testing.assert_array_equal(block, READINGS)
+                    # the termination after the block was consumed, so the next response is read from its start
+                    self.assertEqual(self.instrument.query('*IDN?'), 'FLUKE,STAND-IN,0,1.0')
+
+    def test_read_binary(self):
+        self.instrument.write('FETC? <f4')
+        block = self.instrument.read_binary(datatype='f', is_big_endian=False)
+        np.testing.assert_array_equal(block, READINGS)
+        self.assertFalse(block.flags.writeable)  # a view onto the received bytes
+
+    def test_indefinite_length_block(self):
+        with self.assertRaises(ValueError):
+            self.instrument.query_binary('FETC:IND?')
+
+
+class NighthawkBinaryBlockTest(BinaryBlockTest):
+    handler = NighthawkStandIn
+    mode = 'NIGHTHAWK'
+
+
+if __name__ == "__main__":
+    unittest.main()
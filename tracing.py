@@ -0,0 +1,172 @@
+from contextlib import contextmanager, nullcontext
+import numpy as np
+import functools
+import threading
+import atexit
+import json
+import time
+import re
+import os
+
+"""
+Opt-in timing of instrument I/O, settling and GUI updates.
+
+Tracing is off by default and a disabled span costs next to nothing. It is switched on for a whole process by setting
+the LEVIATHAN_TRACE environment variable to the path of the trace file to write at exit (MainLauncher does this for a
+run when Trace > Trace Next Run is checked), or from code with tracer.enable(path).
+
+Every span records its category, name (the SCPI command for instrument I/O), instrument, thread, start and duration.
+Traces are exported in the Chrome trace-event format, so they can be opened in chrome://tracing or
+https://ui.perfetto.dev, and summarized per command (count, total, p50/p95/max) with summary() and format_summary().
+
+    with tracer.span('query', 'READ?', instrument='k34461A'):
+        ...
+
+Generated test scripts import the tracer from here, so their runs are traced the same way.
+"""
+
+ENV_VAR = 'LEVIATHAN_TRACE'
+NUMBER = re.compile(r'(?<![\w.])[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def enable(self, path=None):
+        """
+        :param path: trace file written at exit. Nothing is written at exit when None
+        """
+        if not self.enabled:
+            self.enabled = True
+            self.path = path
+            if path:
+                atexit.register(self.export_at_exit)
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+
+    def span(self, cat, name, **args):
+        if not self.enabled:
+            return nullcontext()
+        return self._span(cat, name, args)
+
+    @contextmanager
+    def _span(self, cat, name, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(cat, name, start, time.perf_counter(), args)
+
+    def record(self, cat, name, start, end, args=None):
+        event = {'name': str(name), 'cat': cat, 'ph': 'X', 'pid': self.pid, 'tid': threading.get_ident(),
+                 'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6, 'args': args or {}}
+        with self.lock:
+            self.events.append(event)
+
+    def traced(self, cat, name=None):
+        """
+        Decorator that spans every call of a function. The span is named after the function unless a name is given.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._span(cat, name or func.__name__, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def export_chrome(self, path):
+        with self.lock:
+            events = list(self.events)
+        threads = {event['tid'] for event in events}
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                     'args': {'name': thread.name}}
+                    for thread in threading.enumerate() if (tid := thread.ident) in threads]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+    def export_at_exit(self):
+        if self.events and self.path:
+            self.export_chrome(self.path)
+
+
+tracer = Tracer()
+if os.environ.get(ENV_VAR):
+    tracer.enable(os.environ[ENV_VAR])
+
+
+# FUNCTION DEFINITIONS -------------------------------------------------------------------------------------------------
+def load_chrome(path):
+    with open(path, 'r') as f:
+        trace = json.load(f)
+    events = trace['traceEvents'] if isinstance(trace, dict) else trace
+    return [event for event in events if event.get('ph') == 'X']
+
+
+def command_key(name):
+    """
+    Commands that differ only in their numbers are summarized together: 'out 0.12A; out 1000Hz' --> 'out #A; out #Hz'
+    """
+    return NUMBER.sub('#', name)
+
+
+def summary(events=None):
+    """
+    Groups complete events by (category, instrument, command) and sorts them by total time. See command_key.
+
+    :param events: trace events. Defaults to the events recorded so far
+    :return: [{'cat': str, 'instrument': str, 'name': str, 'count': int, 'total_ms': float, 'p50_ms': float,
+               'p95_ms': float, 'max_ms': float}, ...]
+    """
+    if events is None:
+        with tracer.lock:
+            events = list(tracer.events)
+
+    groups = {}
+    for event in events:
+        key = (event.get('cat', ''), event.get('args', {}).get('instrument', ''), command_key(event['name']))
+        groups.setdefault(key, []).append(event['dur'] / 1e3)
+
+    rows = []
+    for (cat, instrument, name), durations in groups.items():
+        ms = np.asarray(durations)
+        p50, p95 = np.percentile(ms, [50, 95])
+        rows.append({'cat': cat, 'instrument': instrument, 'name': name, 'count': int(ms.size),
+                     'total_ms': float(ms.sum()), 'p50_ms': float(p50), 'p95_ms': float(p95),
+                     'max_ms': float(ms.max())})
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+def format_summary(rows):
+    header = f"{'category':<12} {'instrument':<14} {'command':<32} {'count':>7} {'total ms':>11} " \
+             f"{'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        name = row['name'] if len(row['name']) <= 32 else row['name'][:29] + '...'
+        lines.append(f"{row['cat']:<12} {row['instrument']:<14} {name:<32} {row['count']:>7} "
+                     f"{row['total_ms']:>11.2f} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['max_ms']:>9.3f}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        print(format_summary(summary(load_chrome(sys.argv[1]))))
+    else:
+        print('usage: python tracing.py <trace.json>')
@@ -46,7 +46,7 @@ class MyDialog(wx.Dialog):
         self.panel_2 = wx.ScrolledWindow(self.panel_1, wx.ID_ANY, style=wx.TAB_TRAVERSAL)
 
         self.config = {}
-        self.choices = ["SOCKET", "GPIB", "INSTR", "SERIAL", "USB", "NIGHTHAWK"]
+        self.choices = ["SOCKET", "GPIB", "INSTR", "SERIAL", "USB", "NIGHTHAWK", "SIM"]
         # Scrolling Panel ----------------------------------------------------------------------------------------------
         self.instrID_text = [wx.TextCtrl()] * 4
         self.ipAddress_text = [wx.TextCtrl()] * 4
@@ -235,6 +235,12 @@ class MyDialog(wx.Dialog):
             self.ipAddress_text[row].Enable(False)
             self.port_text[row].Enable(False)
             self.gpib_text[row].Enable(True)
+        elif self.mode_choice[row].GetStringSelection() == 'SIM':
+            # the address of a simulated instrument is the model name (5560A, 5790A, 34461A, 8846A)
+            self.instrID_text[row].Enable(True)
+            self.ipAddress_text[row].Enable(True)
+            self.port_text[row].Enable(False)
+            self.gpib_text[row].Enable(False)
         elif self.mode_choice[row].GetStringSelection() == 'INSTR' or 'SERIAL' or 'USB':
             self.instrID_text[row].Enable(True)
             self.ipAddress_text[row].Enable(True)
@@ -370,17 +376,20 @@ class MyDialog(wx.Dialog):
         :param e: event e waits for button press from 'Save'
         :return:
         """
-        self.config = {}
+        previous, self.config = self.config, {}
         for row in range(len(self.instrID_text)):
             # self.config[f'INSTR{row}'] = {'instr': self.instrID_text[row].GetValue(),
             #                               'ip_address': self.ipAddress_text[row].GetValue(),
             #                               'port': self.port_text[row].GetValue(),
             #                               'gpib_address': self.gpib_text[row].GetValue(),
             #                               'mode': self.mode_choice[row].GetStringSelection()}
-            self.config[self.instrID_text[row].GetValue()] = {'ip_address': self.ipAddress_text[row].GetValue(),
-                                                              'port': self.port_text[row].GetValue(),
-                                                              'gpib_address': self.gpib_text[row].GetValue(),
-                                                              'mode': self.mode_choice[row].GetStringSelection()}
+            instr = self.instrID_text[row].GetValue()
+            # entries without a field in the dialog (settling, simulator options) are kept as they were
+            self.config[instr] = {**previous.get(instr, {}),
+                                  'ip_address': self.ipAddress_text[row].GetValue(),
+                                  'port': self.port_text[row].GetValue(),
+                                  'gpib_address': self.gpib_text[row].GetValue(),
+                                  'mode': self.mode_choice[row].GetStringSelection()}
             print(self.config)
 
         with open('instrument_config.yaml', 'w') as f:
@@ -1,4 +1,6 @@
 import eqn_parser
+import decimate
+import redraw
 
 import wx
 import wx.lib.mixins.listctrl
@@ -6,7 +8,9 @@ import wx.lib.mixins.listctrl
 import functools
 import operator
 import itertools
+import hashlib
 import string
+from collections import OrderedDict
 
 import matplotlib.tri as mtri
 import matplotlib.pyplot as plt
@@ -18,6 +22,11 @@ from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 unused import
 
 import numpy as np
 
+try:
+    from scipy.spatial import Delaunay  # optional. Lets a triangulation grow with the points of a live sweep
+except ImportError:
+    Delaunay = None
+
 
 def increment_column_index():
     n = 1
@@ -26,6 +35,65 @@ def increment_column_index():
         n += 1
 
 
+def digest(*arrays):
+    h = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array, dtype=float)
+        h.update(str(array.shape).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+class TriangulationCache:
+    """
+    Delaunay triangulations of the X/Y points of 3D surfaces, keyed by a hash of the X and Y values. Triangulating tens
+    of thousands of setpoints takes far longer than drawing them, and only X or Y changes it: a new Z column, a new
+    equation of Z or a new colormap reuse the cached triangulation.
+
+    When the points are the points of the last triangulation plus new ones appended (a live sweep), the triangulation
+    is extended with the new points instead of being rebuilt, if scipy is installed. Otherwise it is rebuilt.
+    """
+
+    def __init__(self, size=8):
+        self.size = size
+        self.entries = OrderedDict()  # {digest of x, y: mtri.Triangulation}, least recently used first
+        self.live = None  # (points, digest, scipy Delaunay) of the last triangulation that can be extended
+
+    def get(self, x, y):
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        key = digest(x, y)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        if Delaunay is None:
+            triang = mtri.Triangulation(x, y)
+        else:
+            points = np.column_stack((x, y))
+            known = self.live[0] if self.live is not None else 0
+            if 0 < known < len(x) and self.live[1] == digest(x[:known], y[:known]):
+                delaunay = self.live[2]
+                delaunay.add_points(points[known:])
+            else:
+                delaunay = Delaunay(points, incremental=True)
+            self.live = (len(x), key, delaunay)
+            triang = mtri.Triangulation(x, y, triangles=anticlockwise(points, delaunay.simplices))
+
+        self.entries[key] = triang
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return triang
+
+
+def anticlockwise(points, triangles):
+    # matplotlib expects the corners of each triangle in anticlockwise order. qhull does not order them
+    a, b, c = (points[triangles[:, corner]] for corner in range(3))
+    clockwise = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) < 0
+    triangles = triangles.copy()
+    triangles[clockwise, 1], triangles[clockwise, 2] = triangles[clockwise, 2], triangles[clockwise, 1]
+    return triangles
+
+
 class PlotFrame(wx.Frame):
     """
     Class used for creating frames other than the main one
@@ -52,6 +120,8 @@ class PlotFrame(wx.Frame):
         self.canvas = FigureCanvas(self.panel_2, -1, self.figure)
         self.toolbar = NavigationToolbar(self.canvas)
         self.toolbar.Realize()
+        # changes only request a draw. The canvas is drawn at most 10 times per second (see redraw.py)
+        self.plot_scheduler = redraw.RedrawScheduler(self, self.canvas.draw, rate=10)
 
         self.choices = []
         self.button_9 = wx.Button(self.panel_2, wx.ID_ANY, "Edit Data")
@@ -79,6 +149,8 @@ class PlotFrame(wx.Frame):
         self.y = np.array(0.)
         self.z = np.array(0.)
         self.ax = None
+        self.decimator = None  # plots 2D lines decimated to the width of the axes (see decimate.py)
+        self.triangulations = TriangulationCache()
 
         # Event Triggers -----------------------------------------------------------------------------------------------
         onPlotMode_event = lambda event: self.onPlotMode(event)
@@ -228,10 +300,11 @@ class PlotFrame(wx.Frame):
         # TODO - https://stackoverflow.com/questions/594266/equation-parsing-in-python
 
         self.ax = self.figure.add_subplot(111)
+        self.decimator = decimate.LineDecimator(self.ax)
 
         for i, y in enumerate(self.y):
             # plot returns a list of artists of which you want the first element when changing x or y data
-            self.plot = self.ax.plot(self.x, y)
+            self.plot = [self.decimator.plot(self.ax.plot, self.x, y)]
         self.ax.set_title('2D Plot Title', fontsize=15, fontweight="bold")
         self.ax.set_ylabel(self.choices[0], fontsize=8)
         self.ax.set_xlabel(self.choices[1], fontsize=8)
@@ -260,7 +333,7 @@ class PlotFrame(wx.Frame):
         """
         self.ax = self.figure.add_subplot(111, projection='3d')
 
-        triang = mtri.Triangulation(self.x, self.y[0])
+        triang = self.triangulations.get(self.x, self.y[0])  # reused when only Z changed
         self.plot = self.ax.plot_trisurf(triang, self.z, cmap=cm.CMRmap)  # cmap=cm.viridis
         self.ax.zaxis.set_major_locator(LinearLocator(10))
         self.ax.zaxis.set_major_formatter(FormatStrFormatter('%.2f'))
@@ -287,7 +360,8 @@ class PlotFrame(wx.Frame):
                     >   If the range of the data is changing, x and y axis limits must manually be reset. Use:
                             self.ax.relim()
                             self.ax.autoscale_view()
-        In addition, ensure self.canvas.draw() is called after plotting each update to the frame
+        In addition, ensure the canvas is drawn after plotting each update to the frame. Updates only request a draw
+        (self.plot_scheduler.request()), which the redraw scheduler carries out on its next tick
         Source: https://stackoverflow.com/a/4098938
 
         :param event: event waits for change in choice dropdown
@@ -295,7 +369,7 @@ class PlotFrame(wx.Frame):
         column = self.choice_dropdown[0].GetSelection()
         self.x = self.data[:, column]
         if self.radio_box_1.GetStringSelection() == '2D':
-            self.plot[0].set_xdata(self.x)
+            self.decimator.set_data(self.plot[0], self.x, self.y[-1])
 
             self.UpdateAxisLabels()
             self.ax.relim()
@@ -304,8 +378,7 @@ class PlotFrame(wx.Frame):
             self.figure.delaxes(self.ax)
             self.Draw_3DPlot()
 
-        self.canvas.draw()
-        self.canvas.flush_events()
+        self.plot_scheduler.request()
 
     def update_yAxisData(self, event):
         selections = self.choice_dropdown[1].GetSelection()
@@ -314,8 +387,9 @@ class PlotFrame(wx.Frame):
             self.y[i] = self.data[:, column]
         if self.radio_box_1.GetStringSelection() == '2D':
             self.ax.clear()
+            self.decimator = decimate.LineDecimator(self.ax)  # clearing the axes dropped the callbacks of the last one
             for i, y in enumerate(self.y):
-                self.plot = self.ax.plot(self.x, y)
+                self.plot = [self.decimator.plot(self.ax.plot, self.x, y)]
 
             self.UpdateAxisLabels()
             self.ax.relim()
@@ -324,8 +398,7 @@ class PlotFrame(wx.Frame):
             self.figure.delaxes(self.ax)
             self.Draw_3DPlot()
 
-        self.canvas.draw()
-        self.canvas.flush_events()
+        self.plot_scheduler.request()
 
     def update_zAxisData(self, event):
         """
@@ -341,8 +414,7 @@ class PlotFrame(wx.Frame):
         else:
             self.plot.set_3d_properties(self.z)
 
-        self.canvas.draw()
-        self.canvas.flush_events()
+        self.plot_scheduler.request()
 
     def UpdateAxisLabels(self):
         """
@@ -404,22 +476,22 @@ class PlotFrame(wx.Frame):
             self.Draw_3DPlot()
 
         # make the canvas draw its contents again with the new data
-        self.canvas.draw()
+        self.plot_scheduler.request()
 
     def onUpdateXLabel(self, event):
         self.ax.set_xlabel(self.text_ctrl_axis_labels[1].GetValue())
         # make the canvas draw its contents again with the new data
-        self.canvas.draw()
+        self.plot_scheduler.request()
 
     def onUpdateYLabel(self, event):
         self.ax.set_ylabel(self.text_ctrl_axis_labels[2].GetValue())
         # make the canvas draw its contents again with the new data
-        self.canvas.draw()
+        self.plot_scheduler.request()
 
     def onUpdateZLabel(self, event):
         self.ax.set_zlabel(self.text_ctrl_axis_labels[3].GetValue())
         # make the canvas draw its contents again with the new data
-        self.canvas.draw()
+        self.plot_scheduler.request()
 
     def onPlotMode(self, event):
         selectedMode = self.radio_box_1.GetStringSelection()
@@ -435,7 +507,7 @@ class PlotFrame(wx.Frame):
                 self.choice_dropdown[2].SetSelection(2)
                 self.figure.delaxes(self.ax)
                 self.Draw_3DPlot()
-                self.canvas.draw()
+                self.plot_scheduler.request()
             else:
                 print('Insufficient columns of data for 3D plot!\nReverting mode back to 2D')
                 self.radio_box_1.SetSelection(0)
@@ -448,7 +520,7 @@ class PlotFrame(wx.Frame):
 
             self.figure.delaxes(self.ax)
             self.Draw_2DPlot()
-            self.canvas.draw()
+            self.plot_scheduler.request()
 
     def onParseY_expression(self, event):
         """
@@ -468,11 +540,10 @@ class PlotFrame(wx.Frame):
         """
         input_string = self.text_ctrl_17.GetValue()
 
-        nsp = eqn_parser.NumericStringParser()
-        nsp.expr(input_string)
-        newY = [0.] * len(self.y)
-        for idx in range(len(self.y)):
-            newY[idx] = nsp.eval(variables={'x': self.x, 'y': self.y[idx]})
+        # parsed once (or taken from the cache of compiled expressions), then evaluated for every column. Long logs are
+        # evaluated in chunks so memory does not peak at several times the size of a column
+        transform = eqn_parser.compileExpression(input_string)
+        newY = [transform.evaluateChunked(x=self.x, y=y) for y in self.y]
 
         # code = parser.expr(input_string).compile()
         # newY = [0.] * len(self.y)
@@ -483,15 +554,16 @@ class PlotFrame(wx.Frame):
 
         if self.radio_box_1.GetStringSelection() == '2D':
             self.ax.clear()
+            self.decimator = decimate.LineDecimator(self.ax)
             for i, y in enumerate(newY):
-                self.plot = self.ax.plot(self.x, y)
+                self.plot = [self.decimator.plot(self.ax.plot, self.x, y)]
             self.UpdateAxisLabels()  # TODO - silly this has to be broken up. See note in method onUpdateTitle
         else:
             # self.update_3dAxisData()
             self.figure.delaxes(self.ax)
             self.ax = self.figure.add_subplot(111, projection='3d')
 
-            triang = mtri.Triangulation(self.x, newY[0])
+            triang = self.triangulations.get(self.x, newY[0])
             self.plot = self.ax.plot_trisurf(triang, self.z, cmap=cm.CMRmap)  # cmap=cm.viridis
             self.ax.zaxis.set_major_locator(LinearLocator(10))
             self.ax.zaxis.set_major_formatter(FormatStrFormatter('%.2f'))
@@ -508,8 +580,7 @@ class PlotFrame(wx.Frame):
         # self.UpdateAxisLabels()
         self.ax.relim()
         self.ax.autoscale_view()
-        self.canvas.draw()
-        self.canvas.flush_events()
+        self.plot_scheduler.request()
 
 
 class CheckListCtrl(wx.ComboCtrl):
@@ -12,6 +12,8 @@ import re
 
 import os
 from jinja2 import FileSystemLoader, Environment
+import sweep_planner
+import checkpoint
 """
 ObjectListView2 is a fork of http://objectlistview.sourceforge.net/python/index.html , as Phillip Piper is no longer
 maintaining the Python version.
@@ -87,7 +89,47 @@ class CodeWriter:
                 commands[level]['code'] = "f'" + cmd + "'"
         return commands
 
-    def generate_code(self, instr_config, input_variables, permutate, commands, output_variables):
+    def group_concurrent_reads(self, commands):
+        """
+        Merges consecutive readings from different instruments into a single concurrent_readings call in the generated
+        script, so the instruments are read at the same time. A reading from an instrument already in the group, or one
+        that uses the result of a reading in the group, starts a new group.
+
+        The readings of a group no longer run in the order they were listed, so this is only done when asked for (see
+        generate_code). A reading that relies on another instrument having settled first must not be grouped.
+
+        :param commands: [Example] --> [{'choice': 'choice string', 'code': 'code string', 'variable': 'variable'}]
+        :return: commands with each merged group replaced by {'choice': '', 'code': '', 'variable': '',
+                                                              'concurrent': [command, command, ...]}
+        """
+        grouped = []
+        group = []
+
+        def flush():
+            if len(group) > 1:
+                grouped.append({'choice': '', 'code': '', 'variable': '', 'concurrent': group[:]})
+            else:
+                grouped.extend(group)
+            group.clear()
+
+        for cmd in commands:
+            if cmd['variable'] != '' and cmd['choice'] != '':
+                instruments = {read['choice'] for read in group}
+                results = {var.strip() for read in group for var in read['variable'].split(',')}
+                # identifiers used in the replacement fields of the f-string, so a result 'v' is not found in 'VAL?'
+                names = set(re.findall(r'\b\w+\b', ' '.join(re.findall(r'\{([^}]*)\}', cmd['code']))))
+                if cmd['choice'] in instruments or not results.isdisjoint(names):
+                    flush()
+                group.append(cmd)
+            else:
+                flush()
+                grouped.append(cmd)
+        flush()
+
+        return grouped
+
+    def generate_code(self, instr_config, input_variables, permutate, commands, output_variables, output_file=None,
+                      costs=None, concurrent=False):
         """
         Understanding Jinja linebreaks: https://stackoverflow.com/a/45719723/3382269
         Create file if does not exist: https://stackoverflow.com/a/42334034/3382269
@@ -97,21 +139,30 @@ class CodeWriter:
         :param permutate:
         :param commands:
         :param output_variables:
+        :param output_file: path of the generated script. Defaults to output/leviathan_out.py
+        :param costs: {input variable: cost of changing it}. Orders the loops of a permutated sweep, see sweep_planner
+        :param concurrent: read consecutive readings from different instruments at the same time, see
+                           group_concurrent_reads. Otherwise every command runs in the order it was listed
         :return:
         """
         self.input_variables = input_variables
         self.output_variables = output_variables
         self.commands = self.command_parser(commands)
-
-        if not os.path.exists('./output/leviathan_out.py'):
-            with open('./output/leviathan_out.py', 'w'):
-                pass
+        if concurrent:
+            self.commands = self.group_concurrent_reads(self.commands)
+
+        if output_file is None:
+            if not os.path.exists('./output/leviathan_out.py'):
+                with open('./output/leviathan_out.py', 'w'):
+                    pass
+            output_file = os.path.join(os.path.dirname(__file__), './output/leviathan_out.py')
         variables = [key for key in self.input_variables.keys()] + [key for key in self.output_variables.keys()]
-        OUTPUT_FILE = os.path.join(os.path.dirname(__file__), './output/leviathan_out.py')
+        OUTPUT_FILE = output_file
         self.tm.stream(instr_config=instr_config,
                        input_variables=self.input_variables,
                        variables_used=variables,
                        permutate=permutate,
+                       sweep_order=sweep_planner.nesting_order(list(self.input_variables.keys()), costs),
                        commands=self.commands).dump(OUTPUT_FILE)
 
 
@@ -199,10 +250,11 @@ class CommandParser(object):
 
 
 class Variable(object):
-    def __init__(self, variable, header, data):
+    def __init__(self, variable, header, data, cost='1'):
         self.variable = variable
         self.header = header
         self.data = data
+        self.cost = cost  # relative cost of changing this variable. Orders the loops of a permutated sweep
 
 
 class WizardFrame(wx.Frame):
@@ -268,7 +320,9 @@ class WizardFrame(wx.Frame):
         self.bitmap_button_1.SetBitmapPressed(wx.Bitmap("images/btn_add_pressed.png", wx.BITMAP_TYPE_ANY))
         self.btn_execute = wx.Button(self.panel_2, wx.ID_ANY, "Execute")
         self.spin_ctrl_double_1 = wx.SpinCtrlDouble(self.panel_2, wx.ID_ANY, "1.0", min=0.0, max=100.0)
+        self.checkbox_resume = wx.CheckBox(self.panel_2, wx.ID_ANY, "Resume")
         self.btn_clear = wx.Button(self.panel_2, wx.ID_ANY, "Clear")
+        self.checkbox_concurrent = wx.CheckBox(self.panel_2, wx.ID_ANY, "Read concurrently")
         self.btn_generate = wx.Button(self.panel_2, wx.ID_ANY, "Generate Code")
         self.btn_save = wx.Button(self.panel_2, wx.ID_ANY, "Save")
 
@@ -350,7 +404,8 @@ class WizardFrame(wx.Frame):
         self.list_ctrl.SetColumns([ColumnDefn(title="",         align="left", valueGetter="", maximumWidth=0),
                                    ColumnDefn(title="Variable", align="left", width=100, valueGetter="variable"),
                                    ColumnDefn(title="Header",   align="left", width=100, valueGetter="header"),
-                                   ColumnDefn(title="Data",     align="left", width=326, valueGetter="data")])
+                                   ColumnDefn(title="Cost",     align="left", width=50,  valueGetter="cost"),
+                                   ColumnDefn(title="Data",     align="left", width=276, valueGetter="data")])
         self.AddRow()
         self.radio_box_2.SetSelection(0)
         self.label_32.SetFont(wx.Font(9, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_ITALIC, wx.FONTWEIGHT_NORMAL, 0, ""))
@@ -382,6 +437,10 @@ class WizardFrame(wx.Frame):
         self.panel_4.SetMinSize((530, 170))
         self.panel_4.SetScrollRate(10, 10)
         self.spin_ctrl_double_1.SetMinSize((50, 23))
+        self.checkbox_resume.SetToolTip("Skip the setpoints already completed in the journal of an interrupted run")
+        self.checkbox_concurrent.SetToolTip("Read consecutive readings from different instruments at the same time in "
+                                            "the generated script. Leave unchecked if a reading relies on the command "
+                                            "order, such as a source that must settle before a meter is read")
 
     def __do_layout(self):
         sizer_2 = wx.BoxSizer(wx.VERTICAL)
@@ -493,6 +552,7 @@ class WizardFrame(wx.Frame):
         grid_sizer_1.Add(label_7,                   (10, 1), (1, 1), wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
         grid_sizer_1.Add(self.spin_ctrl_double_1,   (10, 2), (1, 1), wx.ALL, 5)
         grid_sizer_1.Add(label_8,                   (10, 3), (1, 1), wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        grid_sizer_1.Add(self.checkbox_resume,      (10, 4), (1, 1), wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
 
         ################################################################################################################
 
@@ -502,6 +562,7 @@ class WizardFrame(wx.Frame):
 
         # SECTION: Buttons ---------------------------------------------------------------------------------------------
         grid_sizer_1.Add(self.btn_clear, (12, 0), (1, 1), wx.LEFT, 10)
+        grid_sizer_1.Add(self.checkbox_concurrent, (12, 4), (1, 2), wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 10)
         grid_sizer_1.Add(self.btn_generate, (12, 6), (1, 1), wx.LEFT, 10)
         grid_sizer_1.Add(self.btn_save, (12, 7), (1, 1), wx.ALIGN_RIGHT | wx.LEFT, 10)
         self.panel_2.SetSizer(grid_sizer_1)
@@ -676,15 +737,34 @@ class WizardFrame(wx.Frame):
             self.text_ctrl_12.SetLabelText("")
         else:
             self.label_32.SetLabel("Iterates over all permutations as a Gray code sequence")
-            self.label_33.SetLabel("The permutation order is indicated below:")
+            self.label_33.SetLabel("Loop order, most expensive (outermost) first:")
             self.text_ctrl_12.Enable(True)
             self.UpdateTraversalText()
 
     def GetTraversalOrder(self):
         return [var for _Variable in self.variables if (var := _Variable.variable) != ('' or '*')]
 
+    def GetVariableCosts(self):
+        """
+        :return: {sample} ---> {'inVar0': 10.0, 'inVar1': 1.0}. Costs that are not numbers count as 1
+        """
+        costs = {}
+        for _Variable in self.variables:
+            try:
+                costs[_Variable.variable] = float(_Variable.cost)
+            except (TypeError, ValueError):
+                costs[_Variable.variable] = 1.
+        return costs
+
+    def GetPlannedOrder(self):
+        """
+        Permutated sweeps run the most expensive variable in the outermost loop. See sweep_planner.nesting_order
+        """
+        variables = self.GetTraversalOrder()
+        return [variables[idx] for idx in sweep_planner.nesting_order(variables, self.GetVariableCosts())]
+
     def UpdateTraversalText(self):
-        traversalString = u' ▶ '.join(self.GetTraversalOrder())
+        traversalString = u' ▶ '.join(self.GetPlannedOrder())
 
         self.text_ctrl_12.SetLabelText(traversalString)
 
@@ -893,11 +973,28 @@ class WizardFrame(wx.Frame):
         # self.instruments = {instr['instr']: pyunivisa.CreateInstance(instr) for instr in self.ReportInstrList()}
 
         # Traversal method ---------------------------------------------------------------------------------------------
+        # each setpoint keeps its index in the unordered sweep, which is the key of the generated script's journal
         dataPts = []
         if self.radio_box_2.GetSelection() == 0:    # Traverse simultaneously
-            dataPts = [dict(zip(inVars, i)) for i in zip(*inVars.values())]
+            dataPts = [(index, dict(zip(inVars, i))) for index, i in enumerate(zip(*inVars.values()))]
         elif self.radio_box_2.GetSelection() == 1:  # Traverse all permutations
-            dataPts = [dict(zip(inVars, i)) for i in itertools.product(*inVars.values())]
+            order = sweep_planner.nesting_order(list(inVars.keys()), self.GetVariableCosts())
+            dataPts = [(index, dict(zip(inVars, i)))
+                       for index, i in sweep_planner.serpentine_product(*inVars.values(), order=order)]
+
+        # Resume -------------------------------------------------------------------------------------------------------
+        # only a journal written by this very sweep is resumed. The same index is another setpoint in any other sweep
+        journal = checkpoint.journal_path()
+        if self.checkbox_resume.GetValue() and journal.exists():
+            meta, completed, _ = checkpoint.load(journal)
+            permutate = self.radio_box_2.GetSelection()
+            header = checkpoint.sweep_header(inputVariable_dict, outputVariable_list, permutate)
+            sweep = checkpoint.sweep_signature(permutate, *inVars.values())
+            if (meta.get('header'), meta.get('sweep')) != (header, sweep):
+                print(f'# not resuming: {journal} was written by a different sweep. Every setpoint is run')
+            else:
+                print(f'# resuming: {len(completed)} setpoints already completed in {journal}')
+                dataPts = [(index, point) for index, point in dataPts if index not in completed]
 
         # Create command stack using parser ----------------------------------------------------------------------------
         parse = CommandParser()
@@ -905,7 +1002,7 @@ class WizardFrame(wx.Frame):
         stack = [parse.buildStack(cmd['code']) for cmd in commands]  # shunting-yard algorithm
 
         # Do command ---------------------------------------------------------------------------------------------------
-        for parse.variables in dataPts:
+        for index, parse.variables in dataPts:
             for idx, cmd in enumerate(stack):
                 cmdCopy = cmd[:]
                 choice = commands[idx]['choice']
@@ -936,7 +1033,9 @@ class WizardFrame(wx.Frame):
                          input_variables=self.GetInputVariables(),
                          output_variables=self.GetOutputVariables(),
                          permutate=self.radio_box_2.GetSelection(),
-                         commands=commands)
+                         commands=commands,
+                         costs=self.GetVariableCosts(),
+                         concurrent=self.checkbox_concurrent.GetValue())
 
     def OnClear(self, e):
         print('clear')